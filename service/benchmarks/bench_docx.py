@@ -0,0 +1,59 @@
+"""Benchmark DOCX reading with the configured reader.
+
+`_read_docx` reads with DOCX_READER, so set it to compare readers:
+
+    DOCX_READER=lxml python benchmarks/bench_docx.py [paragraphs] [repeats]
+"""
+import io
+import os, sys
+import timeit
+import tracemalloc
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from docx import Document
+
+from main import DOCX_READER, _read_docx
+from bench_rules import synthetic_paragraphs
+
+
+def synthetic_docx(n):
+    doc = Document()
+    for p in synthetic_paragraphs(n):
+        para = doc.add_paragraph(p["content"])
+        if p["content"][0].isdigit():
+            para.style = doc.styles["Heading 1"]
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    data = synthetic_docx(n)
+
+    def read():
+        # Consume the stream the way the fused analyzer does, one record at a time
+        for _ in _read_docx(data):
+            pass
+
+    print(f"paragraphs: {n} ({len(data) // 1024} KiB)")
+    seconds = min(timeit.repeat(read, number=1, repeat=repeats))
+    print(f"{DOCX_READER:12s} {seconds * 1000:8.1f} ms  peak {peak_memory(read) / 2**20:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark encoding an analysis result for the upload response.
+
+Compares the old copy plus Starlette `JSONResponse` with the encoders in
+`encoders.py`, which append the per-response fields to the encoded bytes.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_encode.py [paragraphs] [repeats]
+"""
+import os, sys
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from fastapi.responses import JSONResponse
+
+from encoders import JSONEncoder, MsgpackEncoder
+from main import _process_styled_text
+from bench_rules import synthetic_paragraphs
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    pairs = [("Normal", "Zahvala")] + [("Normal", p["content"]) for p in synthetic_paragraphs(n - 1)]
+    result = _process_styled_text(pairs, mode="fused")
+    extra = {"document_id": "00000000-0000-0000-0000-000000000000", "save_status": None}
+
+    def copy_json():
+        response_data = result.copy()
+        response_data.update(extra)
+        return JSONResponse(response_data).body
+
+    encoders = {
+        "copy + JSONResponse": copy_json,
+        "stdlib json": lambda: JSONEncoder("json").encode(result, extra),
+        "orjson": lambda: JSONEncoder("orjson").encode(result, extra),
+        "msgpack": lambda: MsgpackEncoder().encode(result, extra),
+    }
+    print(f"paragraphs: {len(result['paragraphs'])}")
+    baseline = None
+    for name, fn in encoders.items():
+        seconds = min(timeit.repeat(fn, number=1, repeat=repeats))
+        baseline = baseline or seconds
+        print(f"{name:20s} {seconds * 1000:7.1f} ms  {len(fn()) / 2**20:6.2f} MiB  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark paragraph records through the analysis: dicts against slotted records.
+
+Every path streams a synthetic DOCX through `_read_docx`, with the lxml
+reader unless DOCX_READER says otherwise; it opens
+with "Zahvala", so the analysis keeps the whole body. The pipeline
+and "dicts" build a dict with a fresh uuid per paragraph; "records" feeds
+compact `Paragraph` records straight from `(style, text)` pairs. Memory is
+reported while the analyzer holds the document ("held", before any result
+dicts exist) and over the whole call including serialization ("peak"),
+along with the number of allocated blocks still alive at the end of the stream.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_paragraphs.py [paragraphs] [repeats]
+"""
+import io
+import os, sys
+import timeit
+import tracemalloc
+import uuid
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from docx import Document
+
+os.environ.setdefault("DOCX_READER", "lxml")
+from main import Paragraph, StreamingAnalyzer, _process_styled_text, _read_docx
+from bench_rules import synthetic_paragraphs
+
+
+def synthetic_docx(n):
+    doc = Document()
+    doc.add_paragraph("Zahvala")
+    for p in synthetic_paragraphs(n - 1):
+        para = doc.add_paragraph(p["content"])
+        if p["content"][0].isdigit():
+            para.style = doc.styles["Heading 1"]
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def as_dicts(pairs):
+    return ({"id": str(uuid.uuid4()), "style": style, "content": text} for style, text in pairs)
+
+
+def memory(data, make):
+    """`(held bytes, live blocks, peak bytes)` of feeding `make(pairs)` to the analyzer."""
+    tracemalloc.start()
+    try:
+        analyzer = StreamingAnalyzer()
+        for p in make(_read_docx(data)):
+            analyzer.feed(p)
+        snapshot = tracemalloc.take_snapshot()
+        held = tracemalloc.get_traced_memory()[0]
+        analyzer.result()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return held, blocks, peak
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    data = synthetic_docx(n)
+
+    def pipeline():
+        return _process_styled_text(_read_docx(data), mode="pipeline")
+
+    def dicts():
+        analyzer = StreamingAnalyzer()
+        for p in as_dicts(_read_docx(data)):
+            analyzer.feed(p)
+        return analyzer.result()
+
+    def records():
+        return _process_styled_text(_read_docx(data), mode="fused")
+
+    strip = lambda result: [(p["style"], p["content"]) for p in result["paragraphs"]]
+    assert strip(pipeline()) == strip(dicts()) == strip(records())
+
+    print(f"paragraphs: {n}")
+    print(f"{'':8s} {'time':>9s} {'held':>10s} {'blocks':>8s} {'peak':>10s}")
+    results = {}
+    for name, fn, make in (("pipeline", pipeline, None), ("dicts", dicts, as_dicts),
+                           ("records", records, lambda pairs: (Paragraph(s, t) for s, t in pairs))):
+        seconds = min(timeit.repeat(fn, number=1, repeat=repeats))
+        results[name] = seconds
+        if make is None:
+            print(f"{name:8s} {seconds * 1000:6.1f} ms")
+            continue
+        held, blocks, peak = memory(data, make)
+        print(f"{name:8s} {seconds * 1000:6.1f} ms {held / 2**20:6.2f} MiB {blocks:8d} {peak / 2**20:6.2f} MiB")
+    print(f"speedup over dicts: {results['dicts'] / results['records']:.2f}x, "
+          f"over pipeline: {results['pipeline'] / results['records']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
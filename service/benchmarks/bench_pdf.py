@@ -0,0 +1,72 @@
+"""Benchmark the PDF engines: pdf2docx conversion against PyMuPDF extraction.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_pdf.py [pages] [repeats]
+"""
+import difflib
+import os, sys
+import tempfile
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import fitz
+from docx import Document
+from pdf2docx import Converter
+
+from main import _iter_styled_text, _analyze_pdf
+from pdf_extract import extract_styled_text
+from bench_rules import synthetic_paragraphs
+
+
+def synthetic_pdf(path, pages):
+    """Typeset a thesis of roughly `pages` pages with sized headings."""
+    doc = fitz.open()
+    page, y = None, 0
+    for p in synthetic_paragraphs(pages * 12):
+        heading = p["content"][0].isdigit()
+        size = 16 if heading else 11
+        if page is None or y > 760 or heading:
+            page, y = doc.new_page(), 72
+        rect = fitz.Rect(72, y, 523, 800)
+        text = p["content"].replace("č", "c")
+        height = page.insert_textbox(rect, text, fontsize=size,
+                                     fontname="hebo" if heading else "helv")
+        y = 800 - height + size if height >= 0 else 800
+    doc.save(path)
+
+
+def converted_styled_text(pdf_path):
+    docx_path = pdf_path[:-4] + ".docx"
+    cv = Converter(pdf_path)
+    cv.convert(docx_path)
+    cv.close()
+    return list(_iter_styled_text(Document(docx_path)))
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "thesis.pdf")
+        synthetic_pdf(path, pages)
+
+        words = lambda pairs: " ".join(text for _, text in pairs).split()
+        native, converted = words(extract_styled_text(path)), words(converted_styled_text(path))
+        parity = difflib.SequenceMatcher(None, native, converted, autojunk=False).ratio()
+
+        old = min(timeit.repeat(lambda: _analyze_pdf(path, "pdf2docx"), number=1, repeat=repeats))
+        new = min(timeit.repeat(lambda: _analyze_pdf(path, "pymupdf"), number=1, repeat=repeats))
+    print(f"pages:      {pages}")
+    print(f"pdf2docx:   {old * 1000:8.1f} ms")
+    print(f"pymupdf:    {new * 1000:8.1f} ms")
+    print(f"speedup:    {old / new:8.1f}x")
+    print(f"word match: {parity:8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark page-parallel pdf2docx conversion against worker count.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_pdf_parallel.py [pages,...] [workers,...]
+
+Defaults to 50- and 300-page documents and 1, 2, 4, ... up to the core count.
+Every run's text is checked against PyMuPDF's direct extraction, so a
+split that drops or reorders pages shows up as a lower word match.
+"""
+import asyncio
+import difflib
+import os, sys
+import tempfile
+import time
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+from pdf_extract import extract_styled_text
+from bench_pdf import synthetic_pdf
+
+
+def worker_counts():
+    cores = os.cpu_count() or 1
+    counts, n = [], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    return counts + [cores]
+
+
+def words(pairs):
+    return " ".join(text for _, text in pairs).split()
+
+
+async def convert(path):
+    pairs = await main._convert_pdf_parallel(path)
+    await main._run_in_pool(main._process_styled_text, pairs)
+    return pairs
+
+
+def run():
+    sizes = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [50, 300]
+    counts = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else worker_counts()
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in sizes:
+            path = os.path.join(tmp, f"thesis_{pages}.pdf")
+            synthetic_pdf(path, pages)
+            expected = words(extract_styled_text(path))
+            baseline = None
+            for workers in counts:
+                main.ANALYSIS_WORKERS = workers
+                main.PDF_CONVERT_PARALLELISM = workers
+                # Start the pool before timing so process spawn is not counted
+                asyncio.run(main._run_in_pool(main._pdf_page_count, path))
+                start = time.perf_counter()
+                pairs = asyncio.run(convert(path))
+                elapsed = time.perf_counter() - start
+                match = difflib.SequenceMatcher(None, words(pairs), expected, autojunk=False).ratio()
+                main._shutdown_executor()
+                baseline = baseline or elapsed
+                print(f"pages: {pages:4d}  workers: {workers:3d}  "
+                      f"{elapsed:8.2f} s  speedup: {baseline / elapsed:5.2f}x  word match: {match:6.1%}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,98 @@
+"""Benchmark paragraph persistence against a local PostgREST stand-in.
+
+Starts a small HTTP server that accepts PostgREST inserts, upserts and RPC
+calls with a fixed per-request latency, then saves generated theses through
+the Supabase async client with the old fixed batches, byte-sized concurrent
+batches, and a single RPC call.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_persist.py [paragraphs] [latency_ms]
+"""
+import asyncio
+import logging
+import os, sys
+import threading
+import time
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+from supabase import acreate_client
+
+from persistence import WriteBehindQueue
+from bench_rules import synthetic_paragraphs
+
+PORT = 54329
+# Any string shaped like a JWT passes the client's key check
+API_KEY = "bench.bench.bench"
+
+
+def stand_in(latency):
+    rows = {"count": 0}
+
+    async def write(request):
+        body = await request.body()
+        rows["count"] += body.count(b"paragraph_order")
+        await asyncio.sleep(latency)
+        return Response(status_code=201)
+
+    app = Starlette(routes=[
+        Route("/rest/v1/{table}", write, methods=["POST"]),
+        Route("/rest/v1/rpc/{fn}", write, methods=["POST"]),
+    ])
+    return app, rows
+
+
+async def save(paragraphs, **options):
+    async def connect():
+        return await acreate_client(f"http://127.0.0.1:{PORT}", API_KEY)
+
+    queue = WriteBehindQueue(connect, workers=1, **options)
+    await queue.start()
+    start = time.perf_counter()
+    await queue.enqueue("bench", {"id": "bench"}, paragraphs)
+    await queue.stop(timeout=600)
+    elapsed = time.perf_counter() - start
+    assert queue.status("bench")["status"] == "saved", queue.status("bench")
+    return elapsed
+
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("persistence").setLevel(logging.WARNING)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    app, rows = stand_in(latency)
+    server = uvicorn.Server(uvicorn.Config(app, port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    paragraphs = [{"document_id": "bench", "paragraph_order": i, "paragraph_id": str(i),
+                   "paragraph_style": "Normal", "content": p["content"]}
+                  for i, p in enumerate(synthetic_paragraphs(n))]
+    runs = {
+        "fixed 100, serial": dict(batch_rows=100, batch_bytes=10 ** 9, concurrency=1),
+        "256 KiB, 4 in flight": dict(concurrency=4),
+        "single rpc": dict(rpc="insert_document_paragraphs"),
+    }
+    print(f"paragraphs: {n}, latency: {latency * 1000:.0f} ms")
+    baseline = None
+    for name, options in runs.items():
+        rows["count"] = 0
+        elapsed = asyncio.run(save(paragraphs, **options))
+        assert rows["count"] == n
+        baseline = baseline or elapsed
+        print(f"{name:22s} {elapsed * 1000:8.1f} ms  speedup: {baseline / elapsed:5.1f}x")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
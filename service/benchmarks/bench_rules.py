@@ -0,0 +1,59 @@
+"""Benchmark the compiled rule engine against the per-section helpers.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_rules.py [paragraphs] [repeats]
+"""
+import random
+import sys, os
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from main import _check_front_matter, _check_body_sections, _check_sections, _extract_uvod
+
+WORDS = ("raziskava", "podatki", "metoda", "rezultat", "analiza", "sistem",
+         "model", "uporaba", "učenje", "vrednost", "primer", "pristop")
+
+
+def synthetic_paragraphs(n, seed=0):
+    """Body-heavy thesis without most front-matter headings (the worst case)."""
+    rnd = random.Random(seed)
+    out = [{"content": "Magistrsko delo"}, {"content": "1. UVOD"}]
+    for i in range(n - 2):
+        if i % 50 == 0:
+            out.append({"content": f"{i // 50 + 2}. Poglavje {i}"})
+        else:
+            words = rnd.choices(WORDS, k=rnd.randint(20, 60))
+            out.append({"content": " ".join(words).capitalize() + "."})
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    paragraphs = synthetic_paragraphs(n)
+
+    def helpers():
+        uvod = _extract_uvod(paragraphs)
+        return _check_front_matter(paragraphs), _check_body_sections(paragraphs), uvod
+
+    def engine():
+        uvod = _extract_uvod(paragraphs)
+        return _check_sections(paragraphs, uvod), uvod
+
+    assert helpers()[:2] == engine()[0]
+
+    old = min(timeit.repeat(helpers, number=1, repeat=repeats))
+    new = min(timeit.repeat(engine, number=1, repeat=repeats))
+    print(f"paragraphs: {n}")
+    print(f"helpers:    {old * 1000:8.1f} ms")
+    print(f"engine:     {new * 1000:8.1f} ms")
+    print(f"speedup:    {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Per-stage benchmark suite with regression gates.
+
+Generates synthetic theses (see `thesis_generator.py`) at several sizes and
+times every stage of document analysis: DOCX reading (with the lxml
+reader unless DOCX_READER says otherwise, which also applies to
+`_analyze_docx`), PyMuPDF extraction, each step of the multi-pass pipeline, both analyzers and the
+end-to-end `_analyze_docx`. For every stage it records the best wall time
+over the repeats and the peak traced memory of one run.
+
+Results are compared with a stored baseline and the script exits with
+status 1 when a stage got slower or hungrier than the tolerance allows.
+Baselines are machine-specific: record one on the machine that runs the
+gate with --update.
+
+Usage (from the service directory):
+
+    python benchmarks/bench_suite.py [--sizes 100,1000,10000] [--repeats 3]
+        [--stages read_docx,analyze] [--baseline FILE] [--update]
+        [--time-tolerance 0.25] [--memory-tolerance 0.10]
+"""
+import argparse
+import json
+import os, sys
+import platform
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+os.environ.setdefault("DOCX_READER", "lxml")
+import main
+import pdf_extract
+from thesis_generator import generate_thesis, thesis_docx, thesis_pdf
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Differences below these are noise whatever the tolerance says
+MIN_SECONDS = 0.002
+MIN_PEAK_BYTES = 256 * 1024
+
+
+def _dicts(pairs):
+    return [{"id": str(i), "style": style, "content": text} for i, (style, text) in enumerate(pairs)]
+
+
+def stages(size):
+    """`(name, setup, run)` for every stage; `run(setup())` is what gets measured."""
+    pairs = generate_thesis(size)
+    docx = thesis_docx(size)
+    pdf_path = os.path.join(tempfile.mkdtemp(), "thesis.pdf")
+    thesis_pdf(pdf_path, size)
+
+    # Inputs of the later pipeline steps, as `_analyze_paragraphs` builds them
+    styled = main._style_special_sections(_dicts(pairs))
+    filtered, skip = [], False
+    for p in styled:
+        if main.TOC_SECTION_RE.match(p["content"].strip().lower()):
+            skip = True
+            continue
+        if skip and main.NUMBERED_RE.match(p["content"]):
+            skip = False
+        if not skip:
+            filtered.append(p)
+    toc = main._extract_toc(filtered)
+    uvod = main._extract_uvod(styled)
+    fresh = lambda: _dicts(pairs)
+    same = lambda value: lambda: value
+
+    return [
+        (f"read_docx.{main.DOCX_READER}", same(docx), lambda data: list(main._read_docx(data))),
+        ("read_pdf.pymupdf", same(pdf_path), pdf_extract.extract_styled_text),
+        ("pipeline.style_special_sections", fresh, main._style_special_sections),
+        ("pipeline.extract_notranja_info", fresh, main._extract_notranja_info),
+        ("pipeline.extract_uvod", same(styled), main._extract_uvod),
+        ("pipeline.check_sections", same(styled), lambda ps: main._check_sections(ps, uvod)),
+        ("pipeline.extract_toc", same(filtered), main._extract_toc),
+        ("pipeline.apply_toc_styles", lambda: [dict(p) for p in filtered],
+         lambda ps: main._apply_toc_styles(ps, toc)),
+        ("pipeline.filter_out_toc_entries", same(filtered), main._filter_out_toc_entries),
+        ("analyze.pipeline", fresh, main._analyze_paragraphs),
+        ("analyze.fused", same(pairs), lambda ps: main._process_styled_text(ps, "fused")),
+        ("process_document", same(docx), main._analyze_docx),
+    ]
+
+
+def measure(setup, run, repeats):
+    """Best wall time over `repeats` runs and the peak traced bytes of one more."""
+    best = float("inf")
+    for _ in range(repeats):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - start)
+    arg = setup()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        run(arg)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Regressions of `results` against `baseline`, both `{size: {stage: measurement}}`."""
+    regressions = []
+    for size, measured in results.items():
+        for stage, now in measured.items():
+            before = baseline.get(size, {}).get(stage)
+            if before is None:
+                continue
+            if (now["seconds"] > before["seconds"] * (1 + time_tolerance)
+                    and now["seconds"] - before["seconds"] > MIN_SECONDS):
+                regressions.append(f"{size} {stage}: {now['seconds'] * 1000:.1f} ms, "
+                                   f"baseline {before['seconds'] * 1000:.1f} ms")
+            if (now["peak_bytes"] > before["peak_bytes"] * (1 + memory_tolerance)
+                    and now["peak_bytes"] - before["peak_bytes"] > MIN_PEAK_BYTES):
+                regressions.append(f"{size} {stage}: peak {now['peak_bytes'] / 2**20:.2f} MiB, "
+                                   f"baseline {before['peak_bytes'] / 2**20:.2f} MiB")
+    return regressions
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="100,1000,10000", help="thesis sizes in paragraphs")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--stages", default="", help="comma-separated stage name prefixes")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    prefixes = tuple(p for p in args.stages.split(",") if p)
+
+    results = {}
+    for size in (s.strip() for s in args.sizes.split(",")):
+        print(f"paragraphs: {size}")
+        results[size] = {}
+        for name, setup, run in stages(int(size)):
+            if prefixes and not name.startswith(prefixes):
+                continue
+            result = measure(setup, run, args.repeats)
+            results[size][name] = result
+            print(f"  {name:34s} {result['seconds'] * 1000:9.1f} ms  peak {result['peak_bytes'] / 2**20:7.2f} MiB")
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+
+    if args.update:
+        merged = stored.get("results", {})
+        for size, measured in results.items():
+            merged.setdefault(size, {}).update(measured)
+        stored = {"machine": platform.machine(), "python": platform.python_version(), "results": merged}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not stored:
+        print("no baseline to compare with, run with --update first")
+        return 0
+    regressions = compare(results, stored["results"], args.time_tolerance, args.memory_tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("no regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,197 @@
+"""Synthetic Slovenian theses for benchmarks.
+
+`generate_thesis(n)` returns `n` `(style, text)` paragraphs laid out like
+a real Maribor/Ljubljana thesis: cover and inner title pages, the front
+matter (Zahvala, Povzetek, Abstract, Izjava), a table of contents with
+dot leaders, lists of figures and tables, numbered chapters with sections
+and subsections, captions, stray page numbers, references and appendices.
+`thesis_docx` and `thesis_pdf` typeset the same paragraphs.
+"""
+import io
+import random
+
+WORDS = (
+    "raziskava", "podatki", "metoda", "rezultat", "analiza", "sistem", "model", "uporaba",
+    "učenje", "vrednost", "primer", "pristop", "omrežje", "algoritem", "zmogljivost",
+    "meritev", "vzorec", "ocena", "napoved", "besedilo", "korpus", "značilka", "postopek",
+    "okolje", "arhitektura", "aplikacija", "uporabnik", "zahteva", "rešitev", "preizkus",
+)
+LINKS = ("in", "ter", "za", "pri", "v", "z", "na", "ki", "je", "so", "smo", "bo", "da", "kot")
+# Chapters the section checks look for, in order; longer theses add more in between
+CHAPTERS = ("UVOD", "Pregled literature", "Metodologija", "Rezultati", "Zaključek")
+EXTRA_CHAPTERS = ("Teoretična izhodišča", "Zasnova sistema", "Implementacija", "Razprava")
+UVOD_SECTIONS = ("Opis problema", "Cilji in raziskovalna vprašanja", "Predpostavke in omejitve",
+                 "Struktura dela")
+SECTIONS = ("Ozadje", "Pregled obstoječih rešitev", "Zasnova", "Vrednotenje", "Primerjava",
+            "Podrobnosti izvedbe", "Ugotovitve")
+# Pages the front matter takes before chapter 1 (in Roman numerals)
+FRONT_PAGES = 12
+
+
+def _sentence(rnd):
+    words = [rnd.choice(WORDS if i % 3 else LINKS) for i in range(rnd.randint(8, 22))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rnd):
+    return " ".join(_sentence(rnd) for _ in range(rnd.randint(2, 6)))
+
+
+def _roman(n):
+    out = ""
+    for value, numeral in ((10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")):
+        while n >= value:
+            out += numeral
+            n -= value
+    return out
+
+
+def _front_matter(rnd):
+    title = "Uporaba strojnega učenja pri analizi slovenskih besedil"
+    return [
+        ("Title", "Janez Novak"),
+        ("Title", title),
+        ("Normal", "Magistrsko delo"),
+        ("Normal", "Maribor, september 2024"),
+        ("Normal", "Univerza v Mariboru"),
+        ("Normal", "Fakulteta za elektrotehniko, računalništvo in informatiko"),
+        ("Normal", title),
+        ("Normal", "Magistrsko delo"),
+        ("Normal", "Študent(ka): Janez Novak"),
+        ("Normal", "Študijski program: Računalništvo in informacijske tehnologije"),
+        ("Normal", "Magistrski študijski program"),
+        ("Normal", "Smer: Programska oprema"),
+        ("Normal", "Mentor(ica): red. prof. dr. Ana Kos"),
+        ("Normal", "Somentor(ica): doc. dr. Petra Žagar"),
+        ("Normal", "Lektor(ica): mag. Marko Kranjc"),
+        ("Normal", "Zahvala"),
+        ("Normal", "Zahvaljujem se mentorici in somentorici za pomoč pri nastajanju dela."),
+        ("Normal", _roman(3)),
+        ("Normal", "Povzetek"),
+        ("Normal", _paragraph(rnd)),
+        ("Normal", "Ključne besede: strojno učenje, obdelava naravnega jezika, besedila"),
+        ("Normal", "UDK: 004.8(043.2)"),
+        ("Normal", _roman(4)),
+        ("Normal", "Abstract"),
+        ("Normal", "We analyse Slovenian texts with machine learning methods."),
+        ("Normal", "Keywords: machine learning, natural language processing, texts"),
+        ("Normal", "UDC: 004.8(043.2)"),
+        ("Normal", "Izjava o avtorstvu"),
+        ("Normal", "Podpisani izjavljam, da je magistrsko delo rezultat lastnega dela."),
+        ("Normal", _roman(6)),
+    ]
+
+
+def _chapter_titles(count):
+    extra = [EXTRA_CHAPTERS[i] if i < len(EXTRA_CHAPTERS) else f"Poglavje {i + 1}"
+             for i in range(count - len(CHAPTERS))]
+    return [CHAPTERS[0], CHAPTERS[1], *extra[:len(extra) // 2], CHAPTERS[2],
+            *extra[len(extra) // 2:], CHAPTERS[3], CHAPTERS[4]]
+
+
+def _outline(rnd, paragraphs):
+    """Chapters as `(number, title, [(number, title)])`, more and longer for bigger theses."""
+    chapters = max(len(CHAPTERS), min(60, paragraphs // 150))
+    max_sections = 2 if paragraphs < 300 else 4
+    outline = []
+    for c, title in enumerate(_chapter_titles(chapters)):
+        names = UVOD_SECTIONS[:max_sections] if c == 0 else rnd.sample(SECTIONS, rnd.randint(1, max_sections))
+        outline.append((str(c + 1), title, [(f"{c + 1}.{s + 1}", name) for s, name in enumerate(names)]))
+    return outline
+
+
+def generate_thesis(paragraphs=1000, seed=0):
+    """`paragraphs` `(style, text)` pairs (at least about 80) of a complete synthetic thesis."""
+    rnd = random.Random(seed)
+    outline = _outline(rnd, paragraphs)
+    sections = [sub for _, _, subs in outline for sub in subs]
+    figures = [f"Slika {i + 1}: Arhitektura komponente {i + 1}" for i in range(min(len(sections), 40))]
+    tables = [f"Tabela {i + 1}: Rezultati meritev {i + 1}" for i in range(min(len(outline), 20))]
+    references = 5 if paragraphs < 1000 else 30
+
+    front = _front_matter(rnd)
+    back = [("Heading 1", "Viri in literatura")]
+    back += [("Normal", f"[{i + 1}] Priimek, I. ({2000 + i % 24}). {_sentence(rnd)} Ljubljana: Založba.")
+             for i in range(references)]
+    back += [("Heading 1", "Priloge"), ("Normal", "Priloga A: Izvorna koda"), ("Normal", _paragraph(rnd))]
+    toc_size = 1 + len(outline) + len(sections) + 3 + len(figures) + len(tables) + 3
+    headings = len(outline) + len(sections)
+    # Whatever is left is section text, split evenly
+    per_section, extra = divmod(max(paragraphs - len(front) - len(back) - toc_size - headings,
+                                    len(sections)), len(sections))
+    counts = [per_section + (i < extra) for i in range(len(sections))]
+
+    # Page numbers for the TOC: a page per ~6 body paragraphs
+    pages, page, i = {}, 1, 0
+    for num, _, subs in outline:
+        pages[num] = page
+        for sub_num, _ in subs:
+            pages[sub_num] = page
+            page += max(counts[i] // 6, 1)
+            i += 1
+
+    toc = [("Heading 1", "KAZALO VSEBINE")]
+    for num, title, subs in outline:
+        toc.append(("Normal", f"{num}. {title} {'.' * 20} {pages[num]}"))
+        toc += [("Normal", f"{sub_num} {name} {'.' * 20} {pages[sub_num]}") for sub_num, name in subs]
+    toc.append(("Normal", "Kazalo slik"))
+    toc += [("Normal", f"{caption} {'.' * 12} {rnd.randint(1, page)}") for caption in figures]
+    toc.append(("Normal", "Kazalo tabel"))
+    toc += [("Normal", f"{caption} {'.' * 12} {rnd.randint(1, page)}") for caption in tables]
+    toc.append(("Normal", "Kazalo grafov"))
+    toc += [("Normal", "Seznam uporabljenih simbolov in kratic"), ("Normal", "ML – strojno učenje"),
+            ("Normal", _roman(FRONT_PAGES))]
+
+    body, captions, page_number, i = [], figures + tables, 1, 0
+    for num, title, subs in outline:
+        body.append(("Heading 1", f"{num}. {title}"))
+        for sub_num, name in subs:
+            body.append(("Heading 2", f"{sub_num} {name}"))
+            for j in range(counts[i]):
+                if j % 17 == 16 and captions:
+                    body.append(("Caption", captions.pop(0)))
+                elif j % 6 == 5:
+                    body.append(("Normal", str(page_number)))
+                    page_number += 1
+                elif j % 25 == 12:
+                    body.append(("Heading 3", f"{sub_num}.{j // 25 + 1} Podrobnosti {rnd.choice(WORDS)}"))
+                else:
+                    body.append(("Normal", _paragraph(rnd)))
+            i += 1
+    return front + toc + body + back
+
+
+def thesis_docx(paragraphs=1000, seed=0):
+    """The synthetic thesis saved as DOCX bytes with python-docx."""
+    from docx import Document
+
+    doc = Document()
+    for style, text in generate_thesis(paragraphs, seed):
+        para = doc.add_paragraph(text)
+        if style != "Normal":
+            para.style = doc.styles[style]
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+# Base-14 PDF fonts cannot encode every Slovenian letter
+_ASCII = str.maketrans("čšžćđČŠŽĆĐ–", "cszcdCSZCD-")
+_PDF_FONTS = {"Title": (20, "hebo"), "Heading 1": (16, "hebo"), "Heading 2": (13, "hebo"),
+              "Heading 3": (11, "hebo")}
+
+
+def thesis_pdf(path, paragraphs=1000, seed=0):
+    """Typeset the synthetic thesis as a PDF, a new page per chapter."""
+    import fitz
+
+    doc = fitz.open()
+    page, y = None, 0
+    for style, text in generate_thesis(paragraphs, seed):
+        size, font = _PDF_FONTS.get(style, (11, "helv"))
+        if page is None or y > 760 or style == "Heading 1":
+            page, y = doc.new_page(), 72
+        rect = fitz.Rect(72, y, 523, 800)
+        height = page.insert_textbox(rect, text.translate(_ASCII), fontsize=size, fontname=font)
+        y = 800 - height + size if height >= 0 else 800
+    doc.save(path)
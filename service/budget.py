@@ -0,0 +1,56 @@
+"""CPU time budget for a single analysis.
+
+`cpu_budget(seconds)` arms a SIGVTALRM timer that counts the CPU time of
+the process and raises `BudgetExceeded` in the code running when it runs
+out. Python only delivers signals to the main thread, which is where pool
+workers run; anywhere else, and on platforms without `setitimer`, the
+budget is not enforced. The regex engine checks for signals while it
+matches, so a pattern stuck on a pathological line is interrupted too.
+
+`BudgetExceeded` derives from `BaseException` so that the `except
+Exception` handlers in the analysis code do not swallow it. The timer is
+ITIMER_VIRTUAL, leaving ITIMER_PROF to the sampling profiler.
+"""
+import signal
+import threading
+from contextlib import contextmanager
+
+
+class BudgetExceeded(BaseException):
+    """The call used up its CPU time budget."""
+
+    def __init__(self, seconds):
+        super().__init__(seconds)
+        self.seconds = seconds
+
+
+def enforced():
+    """Whether `cpu_budget` can interrupt code running on this thread."""
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def cpu_budget(seconds):
+    """Raise `BudgetExceeded` if the block uses more than `seconds` of CPU time.
+
+    A falsy `seconds` disables the budget. Budgets nest: the outer timer
+    is put back, less the time spent inside, when the block ends.
+    """
+    if not seconds or not enforced():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise BudgetExceeded(seconds)
+
+    previous_handler = signal.signal(signal.SIGVTALRM, expired)
+    previous_remaining, _ = signal.setitimer(signal.ITIMER_VIRTUAL, seconds)
+    try:
+        yield
+    finally:
+        remaining, _ = signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        signal.signal(signal.SIGVTALRM, previous_handler)
+        if previous_remaining:
+            # Never 0 here, which would disarm the outer timer instead of firing it
+            used = seconds - remaining
+            signal.setitimer(signal.ITIMER_VIRTUAL, max(previous_remaining - used, 1e-6))
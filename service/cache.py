@@ -0,0 +1,243 @@
+"""Caches for analysis results and read responses.
+
+Results are keyed by the SHA-256 of the uploaded bytes plus anything else
+that changes the output (file kind, PDF engine). Entries live in an
+in-memory LRU bounded by size and, optionally, as JSON files in a directory
+that survives restarts. Concurrent requests for the same key share one computation.
+
+The cache is tied to a rules fingerprint: disk entries written under a
+different fingerprint are removed when the cache is created.
+
+`ResponseCache` keeps JSON response bodies with their ETags for a few
+seconds, so repeated dashboard reads skip the database.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data, *parts: str) -> str:
+    """Hash uploaded content together with the options that affect the result.
+
+    `data` is either the raw bytes or a SHA-256 object already fed with them.
+    """
+    digest = hashlib.sha256(data) if isinstance(data, bytes) else data.copy()
+    for part in parts:
+        digest.update(b"\0" + part.encode())
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """Bounded LRU of analysis results with single-flight computation.
+
+    Memory is bounded by `max_bytes`, counting each entry at the length of
+    its JSON form; the objects themselves take a few times that, so treat
+    the limit as a budget rather than a measurement. Disk reads and writes,
+    and the serialization that sizes an entry, run on a worker thread.
+    """
+
+    def __init__(self, max_bytes: int, fingerprint: str, directory=None):
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._inflight = {}
+        self._dir = None
+        if directory:
+            self._dir = os.path.join(directory, fingerprint)
+            os.makedirs(self._dir, exist_ok=True)
+            self._prune_stale(directory)
+
+    def _prune_stale(self, directory):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name != self.fingerprint and os.path.isdir(path):
+                logger.info(f"Dropping analysis cache for old rules {name}")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "in_flight": len(self._inflight),
+            "fingerprint": self.fingerprint,
+            "persistent": self._dir is not None,
+        }
+
+    def get(self, key):
+        """Return a result held in memory or None, counting neither hit nor miss."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        return None
+
+    def put(self, key, result):
+        """Store a result in memory and on disk, blocking the caller while it writes."""
+        self._remember(key, result, self._save(key, result))
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self._bytes = 0
+        if self._dir:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            os.makedirs(self._dir, exist_ok=True)
+
+    async def get_or_compute(self, key, compute):
+        """Return the result for `key`, awaiting `compute()` at most once at a time.
+
+        Callers arriving while the same key is being computed wait for that
+        computation instead of starting their own. Failures are not cached
+        and are raised to every waiter.
+        """
+        while True:
+            result = await self._lookup(key)
+            if result is not None:
+                self.hits += 1
+                return result
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leading request was cancelled; compute it ourselves
+                if not pending.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure is not logged
+            future.exception()
+            raise
+        else:
+            # Waiters need not sit through the write
+            future.set_result(result)
+            size = await asyncio.to_thread(self._save, key, result)
+            self._remember(key, result, size)
+            return result
+        finally:
+            del self._inflight[key]
+
+    async def _lookup(self, key):
+        result = self.get(key)
+        if result is None and self._dir:
+            loaded = await asyncio.to_thread(self._load, key)
+            if loaded is not None:
+                result, size = loaded
+                self._remember(key, result, size)
+        return result
+
+    def _remember(self, key, result, size):
+        if size > self.max_bytes:
+            return
+        self._forget(key)
+        self._entries[key] = result
+        self._sizes[key] = size
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self._bytes -= self._sizes.pop(key)
+
+    def _path(self, key):
+        return os.path.join(self._dir, f"{key}.json")
+
+    def _load(self, key):
+        """Read a disk entry as (result, size in bytes), or None."""
+        try:
+            with open(self._path(key), "rb") as f:
+                payload = f.read()
+            return json.loads(payload), len(payload)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def _save(self, key, result):
+        """Write a result to disk if persistent; return its size in bytes."""
+        payload = json.dumps(result, ensure_ascii=False, default=str).encode()
+        if self._dir:
+            tmp = self._path(key) + ".tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp, self._path(key))
+            except OSError as e:
+                logger.warning(f"Could not persist cache entry {key}: {e}")
+        return len(payload)
+
+
+def etag_for(body) -> str:
+    """Strong ETag over the canonical JSON form of a response body."""
+    payload = json.dumps(body, sort_keys=True, default=str, ensure_ascii=False)
+    return '"' + hashlib.sha256(payload.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """Whether an If-None-Match header value covers `etag`."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ResponseCache:
+    """Short-lived cache of response bodies and their ETags (ttl 0 disables it)."""
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return `(etag, body)` if cached and fresh, else None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, etag, body = entry
+        if time.monotonic() >= expires:
+            del self._entries[key]
+            return None
+        return etag, body
+
+    def put(self, key, body):
+        """Cache a body and return `(etag, body)`."""
+        etag = etag_for(body)
+        if self.ttl > 0:
+            self._entries[key] = (time.monotonic() + self.ttl, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag, body
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,145 @@
+"""Streaming DOCX paragraph reader.
+
+Produces the same `(style, text)` pairs as `main._iter_styled_text`
+without building the python-docx object model: style names are resolved
+once from the styles part, and `word/document.xml` is iterparsed straight
+from the zip, dropping each body element once it has been read.
+
+Text and style semantics follow python-docx: only paragraphs directly in
+the body are read (not those in tables or content controls), paragraph
+text joins the runs and hyperlink runs that are direct children, and a
+missing or unknown style resolves to the default paragraph style.
+"""
+import io
+import posixpath
+import zipfile
+
+from lxml import etree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+STYLES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+
+W_BODY, W_P, W_R, W_HYPERLINK = W + "body", W + "p", W + "r", W + "hyperlink"
+W_T, W_TAB, W_PTAB, W_BR, W_CR, W_NB_HYPHEN = (
+    W + "t", W + "tab", W + "ptab", W + "br", W + "cr", W + "noBreakHyphen")
+W_PPR, W_PSTYLE, W_VAL, W_TYPE = W + "pPr", W + "pStyle", W + "val", W + "type"
+
+# python-docx shows these built-in style names capitalised (BabelFish)
+UI_NAMES = {"caption": "Caption", "footer": "Footer", "header": "Header"}
+UI_NAMES.update({f"heading {n}": f"Heading {n}" for n in range(1, 10)})
+
+
+class DocxError(Exception):
+    """The file is not a readable DOCX package."""
+
+
+def iter_styled_text(source):
+    """Yield `(style, text)` for each non-empty body paragraph of a DOCX.
+
+    The package and styles are read before this returns, so a file that is
+    not a DOCX fails immediately; later XML errors raise `DocxError` from
+    the iterator.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+        document_part = _main_part(zf)
+        styles, default_style = _read_styles(zf, document_part)
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError, OSError) as e:
+        raise DocxError(str(e)) from e
+    return _iter_body(zf, document_part, styles, default_style)
+
+
+def _rels(zf, part):
+    """Relationship type -> target part name for a package part."""
+    folder, name = posixpath.split(part)
+    rels_name = posixpath.join(folder, "_rels", name + ".rels")
+    if rels_name not in zf.namelist():
+        return {}
+    targets = {}
+    for rel in etree.fromstring(zf.read(rels_name)).iter(REL + "Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target")
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        targets.setdefault(rel.get("Type"), path)
+    return targets
+
+
+def _main_part(zf):
+    return _rels(zf, "").get(OFFICE_DOCUMENT, "word/document.xml")
+
+
+def _read_styles(zf, document_part):
+    """Paragraph style id -> display name, and the default paragraph style name."""
+    styles_part = _rels(zf, document_part).get(STYLES)
+    if styles_part is None:
+        # python-docx falls back to its template styles, whose default is Normal
+        return {}, "Normal"
+    styles, default_style = {}, None
+    for style in etree.fromstring(zf.read(styles_part)).iter(W + "style"):
+        if style.get(W_TYPE, "paragraph") != "paragraph":
+            continue
+        name_el = style.find(W + "name")
+        name = name_el.get(W_VAL) if name_el is not None else None
+        name = UI_NAMES.get(name, name)
+        styles.setdefault(style.get(W + "styleId"), name)
+        if style.get(W + "default") in ("1", "true", "on"):
+            default_style = name
+    return styles, default_style
+
+
+def _run_text(run):
+    parts = []
+    for el in run:
+        tag = el.tag
+        if tag == W_T:
+            parts.append(el.text or "")
+        elif tag == W_TAB or tag == W_PTAB:
+            parts.append("\t")
+        elif tag == W_BR:
+            if el.get(W_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag == W_CR:
+            parts.append("\n")
+        elif tag == W_NB_HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+
+def _paragraph_text(p):
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == W_R)
+    return "".join(parts)
+
+
+def _paragraph_style(p, styles, default_style):
+    ppr = p.find(W_PPR)
+    style_el = ppr.find(W_PSTYLE) if ppr is not None else None
+    if style_el is None:
+        return default_style
+    return styles.get(style_el.get(W_VAL), default_style)
+
+
+def _iter_body(zf, document_part, styles, default_style):
+    try:
+        with zf, zf.open(document_part) as xml:
+            for _, p in etree.iterparse(xml, events=("end",), tag=W_P):
+                parent = p.getparent()
+                if parent.tag != W_BODY:
+                    # Paragraphs in tables and content controls are not body paragraphs
+                    continue
+                txt = _paragraph_text(p).strip()
+                if txt:
+                    yield _paragraph_style(p, styles, default_style), txt
+                # Everything in the body up to here has been read; drop it
+                p.clear()
+                while p.getprevious() is not None:
+                    del parent[0]
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError, OSError) as e:
+        raise DocxError(str(e)) from e
@@ -0,0 +1,100 @@
+"""Response encoders for analysis results.
+
+The client picks the wire format with the `Accept` header: JSON (orjson by
+default, the stdlib encoder as a fallback backend) or MessagePack. Fields
+added per response, like the document id, are written after the encoded
+result instead of into a copy of it, so a cached result is never copied.
+"""
+import json
+
+import msgpack
+import orjson
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def _stdlib_json(body) -> bytes:
+    # Same output as Starlette's JSONResponse
+    return json.dumps(body, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def _orjson(body) -> bytes:
+    return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS)
+
+
+JSON_BACKENDS = {"orjson": _orjson, "json": _stdlib_json}
+
+
+class JSONEncoder:
+    media_type = JSON_MEDIA_TYPE
+
+    def __init__(self, backend="orjson"):
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+        self.backend = backend
+        self._dumps = JSON_BACKENDS[backend]
+
+    def encode(self, body: dict, extra=None) -> bytes:
+        """Encode `body` with the `extra` fields appended after its own."""
+        data = self._dumps(body)
+        if not extra:
+            return data
+        tail = self._dumps(extra)
+        if data == b"{}":
+            return tail
+        return data[:-1] + b"," + tail[1:]
+
+
+class MsgpackEncoder:
+    media_type = MSGPACK_MEDIA_TYPE
+    # Media types clients use for MessagePack
+    aliases = ("application/x-msgpack", "application/vnd.msgpack")
+
+    def encode(self, body: dict, extra=None) -> bytes:
+        """Encode `body` with the `extra` fields appended after its own."""
+        extra = extra or {}
+        packer = msgpack.Packer(autoreset=False, datetime=True)
+        packer.pack_map_header(len(body) + len(extra))
+        for items in (body.items(), extra.items()):
+            for key, value in items:
+                packer.pack(key)
+                packer.pack(value)
+        return packer.bytes()
+
+
+def _parse_accept(accept: str):
+    """Yield `(media_type, q)` for each entry of an Accept header."""
+    for entry in accept.split(","):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        yield media_type.lower(), q
+
+
+def negotiate(accept, encoders):
+    """Pick the encoder for an Accept header, or None if none is acceptable.
+
+    `encoders` is in order of preference; the first one serves a missing
+    header and wildcards.
+    """
+    if not accept:
+        return encoders[0]
+    best, best_q = None, 0.0
+    for media_type, q in _parse_accept(accept):
+        for encoder in encoders:
+            types = (encoder.media_type,) + getattr(encoder, "aliases", ())
+            if media_type in types or media_type == "*/*" or (
+                    media_type.endswith("/*") and encoder.media_type.startswith(media_type[:-1])):
+                if q > best_q:
+                    best, best_q = encoder, q
+                break
+    return best
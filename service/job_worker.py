@@ -0,0 +1,29 @@
+"""Work the /jobs queue without serving HTTP.
+
+Runs `JOB_WORKERS` consumers against the SQLite queue in `JOBS_DIR`, next
+to or instead of the consumers inside the API processes. Every process
+working one queue must see the same `JOBS_DIR`.
+
+Usage (from the service directory):
+
+    python job_worker.py
+"""
+import asyncio
+
+import main
+
+
+async def run():
+    await main.persistence_queue.start()
+    try:
+        await main.run_job_workers(max(main.JOB_WORKERS, 1))
+    finally:
+        await main.persistence_queue.stop(main.PERSIST_DRAIN_TIMEOUT)
+        main._shutdown_executor()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
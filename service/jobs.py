@@ -0,0 +1,228 @@
+"""Durable job queue for background document analysis, stored in SQLite.
+
+`POST /jobs` records an upload here and returns at once; workers in any
+process that opens the same database file claim jobs, analyze them and
+store the result. A claimed job is leased for a visibility timeout which
+the worker extends while it runs. When a worker dies the lease expires and
+another worker picks the job up again, so every job is processed at least
+once (and possibly more than once: the work must be idempotent).
+
+Every call opens its own connection, so one queue object can be used from
+several threads. Changes take the write lock with BEGIN IMMEDIATE, so two
+workers never hold the same lease; status reads take no lock beyond the
+one their SELECT needs. By default the database runs in WAL mode, which
+keeps readers and the writer out of each other's way but relies on
+shared memory: every process must run on the same host. To share the
+queue between hosts over a network filesystem, open it with
+`journal_mode="DELETE"` (the rollback journal), and only on a filesystem
+whose locks work across hosts.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    engine TEXT,
+    filename TEXT NOT NULL,
+    input_path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease TEXT,
+    lease_until REAL,
+    worker TEXT,
+    error TEXT,
+    result TEXT,
+    document_id TEXT,
+    save_status TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+JOURNAL_MODES = ("WAL", "DELETE")
+
+
+class Job:
+    """A claimed job; `lease` must accompany every update made by its worker."""
+    __slots__ = ("id", "kind", "engine", "filename", "input_path", "attempts", "lease")
+
+    def __init__(self, id, kind, engine, filename, input_path, attempts, lease):
+        self.id = id
+        self.kind = kind
+        self.engine = engine
+        self.filename = filename
+        self.input_path = input_path
+        self.attempts = attempts
+        self.lease = lease
+
+
+class JobQueue:
+    """SQLite-backed queue of analysis jobs with leases and retries.
+
+    `clock` returns the current time in seconds; the database is created
+    on first use. `journal_mode` is one of JOURNAL_MODES: "WAL" for a
+    queue used from one host, "DELETE" for one shared between hosts.
+    """
+
+    def __init__(self, path, visibility_timeout=300.0, max_attempts=3, retry_delay=5.0, clock=time.time,
+                 journal_mode="WAL"):
+        if journal_mode.upper() not in JOURNAL_MODES:
+            raise ValueError(f"journal_mode must be one of {', '.join(JOURNAL_MODES)}, not {journal_mode!r}")
+        self.path = path
+        self.journal_mode = journal_mode.upper()
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self._ready = False
+
+    @contextmanager
+    def _connection(self):
+        """Autocommit connection: each statement is its own transaction."""
+        if not self._ready:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as db:
+            db.row_factory = sqlite3.Row
+            if not self._ready:
+                db.execute(f"PRAGMA journal_mode={self.journal_mode}")
+                db.executescript(SCHEMA)
+                self._ready = True
+            yield db
+
+    @contextmanager
+    def _transaction(self):
+        """Connection holding the write lock until the block ends."""
+        with self._connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def submit(self, kind, filename, input_path, engine=None):
+        """Queue a job for an input file and return its id."""
+        job_id = str(uuid.uuid4())
+        now = self.clock()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, kind, engine, filename, input_path, available_at,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, kind, engine, filename, input_path, now, now, now))
+        return job_id
+
+    def claim(self, worker):
+        """Lease the oldest available job to `worker`, or return None.
+
+        Running jobs whose lease has expired are available again, unless
+        they have used up their attempts, in which case they fail.
+        """
+        now = self.clock()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease = NULL, updated_at = ?"
+                " WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, "Worker lease expired too many times", now, RUNNING, now, self.max_attempts))
+            row = db.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?)"
+                " OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            lease = uuid.uuid4().hex
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease = ?, lease_until = ?,"
+                " worker = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, lease, now + self.visibility_timeout, worker, now, row["id"]))
+        return Job(row["id"], row["kind"], row["engine"], row["filename"], row["input_path"],
+                   row["attempts"] + 1, lease)
+
+    def heartbeat(self, job):
+        """Extend the lease; False if the job was given to another worker."""
+        now = self.clock()
+        with self._transaction() as db:
+            cur = db.execute("UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND lease = ?",
+                             (now + self.visibility_timeout, now, job.id, job.lease))
+        return cur.rowcount == 1
+
+    def complete(self, job, result, document_id=None, save_status=None):
+        """Store the result; False if the lease was lost (another worker owns the job)."""
+        now = self.clock()
+        with self._transaction() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, document_id = ?, save_status = ?, error = NULL,"
+                " lease = NULL, input_path = NULL, updated_at = ? WHERE id = ? AND lease = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), document_id, save_status, now,
+                 job.id, job.lease))
+        return cur.rowcount == 1
+
+    def fail(self, job, error, retry=True):
+        """Record a failure and return the job's new status (None if the lease was lost).
+
+        Retryable failures are queued again after an exponential delay
+        until the job runs out of attempts.
+        """
+        now = self.clock()
+        status = QUEUED if retry and job.attempts < self.max_attempts else FAILED
+        available_at = now + self.retry_delay * 2 ** (job.attempts - 1)
+        with self._transaction() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease = NULL, updated_at = ?"
+                " WHERE id = ? AND lease = ?",
+                (status, error, available_at, now, job.id, job.lease))
+        return status if cur.rowcount == 1 else None
+
+    def release(self, job):
+        """Hand a job back without counting the attempt, e.g. on shutdown."""
+        now = self.clock()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, available_at = ?, lease = NULL,"
+                " updated_at = ? WHERE id = ? AND lease = ?",
+                (QUEUED, now, now, job.id, job.lease))
+
+    def get(self, job_id):
+        """Status record of a job, with its result once done, or None."""
+        with self._connection() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "filename": row["filename"],
+            "attempts": row["attempts"],
+            "error": row["error"],
+            "document_id": row["document_id"],
+            "save_status": row["save_status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+    def purge(self, max_age):
+        """Delete finished jobs last updated more than `max_age` seconds ago.
+
+        Returns the input files of failed jobs among them, for the caller
+        to remove.
+        """
+        cutoff = self.clock() - max_age
+        with self._transaction() as db:
+            rows = db.execute("SELECT input_path FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                              (DONE, FAILED, cutoff)).fetchall()
+            db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff))
+        return [row["input_path"] for row in rows if row["input_path"]]
@@ -1,15 +1,41 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
-import uuid, io, tempfile, os, re, requests
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+import uuid, io, tempfile, os, re, requests, string, asyncio, hashlib, json, base64, sys, zipfile, socket, time, hmac
+import contextvars
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, closing, contextmanager
+from itertools import islice
+import multiprocessing
 from docx import Document
 from pdf2docx import Converter
+import fitz
 from dotenv import load_dotenv
 from pathlib import Path
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client
 from datetime import datetime
+from typing import List, Optional
 import logging
 
+import pdf_extract
+import docx_reader
+from cache import AnalysisCache, ResponseCache, content_key, etag_matches
+from persistence import WriteBehindQueue
+from encoders import JSONEncoder, MsgpackEncoder, negotiate
+from jobs import JobQueue, FAILED as JOB_FAILED
+import metrics
+import profiling
+import revisions
+import budget
+import search
+import similarity
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,7 +57,28 @@ else:
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
     logger.info("Supabase client initialized successfully")
 
-app = FastAPI()
+_async_supabase = None
+
+async def _connect_supabase():
+    """Shared async client, whose pooled connections serve reads and background saves."""
+    global _async_supabase
+    if _async_supabase is None:
+        _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _async_supabase
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await persistence_queue.start()
+    job_workers = [asyncio.ensure_future(_job_worker(f"{socket.gethostname()}:{os.getpid()}:{i}"))
+                   for i in range(JOB_WORKERS)]
+    yield
+    for task in job_workers:
+        task.cancel()
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    await persistence_queue.stop(PERSIST_DRAIN_TIMEOUT)
+    _shutdown_executor()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -42,6 +89,142 @@ app.add_middleware(
 
 # --- Configuration ---
 
+# Worker processes for DOCX parsing, PDF conversion and analysis (0 = run on a thread)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(os.cpu_count() or 1)))
+# Uploads allowed to wait for a busy pool before new ones are turned away with 503
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "8"))
+ANALYSIS_RETRY_AFTER = int(os.getenv("ANALYSIS_RETRY_AFTER", "5"))
+
+# How /upload-pdf reads PDFs: "pdf2docx" converts to DOCX first, "pymupdf"
+# extracts text blocks directly. Overridable per request with ?engine=
+PDF_ENGINES = ("pdf2docx", "pymupdf")
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pdf2docx")
+# Page ranges one pdf2docx conversion is split into, converted side by side in the pool
+PDF_CONVERT_PARALLELISM = int(os.getenv("PDF_CONVERT_PARALLELISM", "1"))
+# Smaller ranges cost more in per-Converter setup than they save
+MIN_PAGES_PER_RANGE = 4
+# Pages per converted range on the progress-reporting upload endpoints
+PDF_PROGRESS_STEP = int(os.getenv("PDF_PROGRESS_STEP", "20"))
+
+# How DOCX files are read: "python-docx" builds the full object model, "lxml"
+# streams paragraphs straight from word/document.xml
+DOCX_READERS = ("python-docx", "lxml")
+DOCX_READER = os.getenv("DOCX_READER", "python-docx")
+if DOCX_READER not in DOCX_READERS:
+    raise ValueError(f"DOCX_READER must be one of {', '.join(DOCX_READERS)}, not {DOCX_READER!r}")
+
+# "pipeline" runs the multi-pass helpers, "fused" the single-pass StreamingAnalyzer
+ANALYZER_MODES = ("pipeline", "fused")
+ANALYZER_MODE = os.getenv("ANALYZER_MODE", "pipeline")
+
+# POST /quick-check reads only the title pages: this many DOCX paragraphs
+# or PDF pages (PDFs are read with PyMuPDF, never converted)
+QUICK_CHECK_PARAGRAPHS = int(os.getenv("QUICK_CHECK_PARAGRAPHS", "40"))
+QUICK_CHECK_PAGES = int(os.getenv("QUICK_CHECK_PAGES", "3"))
+
+# Seconds of CPU time one pool call (extraction, conversion or analysis) may
+# use before it fails with 422 (0 disables the budget). Enforced in pool
+# processes only, not when ANALYSIS_WORKERS is 0
+ANALYSIS_TIME_BUDGET = float(os.getenv("ANALYSIS_TIME_BUDGET", "300"))
+
+# Largest accepted upload; bigger files are rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Allowance for multipart boundaries and part headers in Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+# /upload-batch: documents analyzed at the same time, and the most documents
+# (counting zip members) and request bytes one batch may carry
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "100"))
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(1024 * 1024 * 1024)))
+
+# Background Supabase writers: concurrent workers, attempts per document,
+# first retry delay in seconds (doubling) and shutdown grace period
+PERSIST_WORKERS = int(os.getenv("PERSIST_WORKERS", "2"))
+PERSIST_MAX_ATTEMPTS = int(os.getenv("PERSIST_MAX_ATTEMPTS", "5"))
+PERSIST_RETRY_DELAY = float(os.getenv("PERSIST_RETRY_DELAY", "1"))
+PERSIST_DRAIN_TIMEOUT = float(os.getenv("PERSIST_DRAIN_TIMEOUT", "10"))
+# Paragraph upserts: payload bytes per batch and batches in flight per document
+PERSIST_BATCH_BYTES = int(os.getenv("PERSIST_BATCH_BYTES", str(256 * 1024)))
+PERSIST_INSERT_CONCURRENCY = int(os.getenv("PERSIST_INSERT_CONCURRENCY", "4"))
+# Database function that stores all paragraphs in one call (sql/document_paragraphs_bulk.sql)
+PERSIST_PARAGRAPH_RPC = os.getenv("PERSIST_PARAGRAPH_RPC")
+
+# Paragraphs returned per page by GET /documents/{id} and its /paragraphs pages
+PARAGRAPH_PAGE_SIZE = int(os.getenv("PARAGRAPH_PAGE_SIZE", "200"))
+MAX_PARAGRAPH_PAGE_SIZE = 1000
+PARAGRAPH_FIELDS = ("paragraph_order", "paragraph_id", "paragraph_style", "content")
+# Columns read without a `fields=` projection: never the search index
+# columns (sql/paragraph_search.sql), nor the revision hashes and MinHash
+# signature of a document, which can be larger than the rest of the row
+PARAGRAPH_COLUMNS = ("document_id",) + PARAGRAPH_FIELDS
+# The `documents` columns are those `_document_row` writes plus `created_at`,
+# which the database fills in; keep the two in step when adding a column
+DOCUMENT_COLUMNS = (
+    "id", "filename", "file_type", "created_at", "title", "document_type", "student_name",
+    "study_program", "study_direction", "mentor", "co_mentor", "lecturer", "overall_score",
+    "total_sections", "found_sections", "missing_critical_count", "uvod_quality",
+    "front_matter_analysis", "body_sections_analysis", "missing_sections", "missing_body_sections",
+    "recommendations", "table_of_contents", "uvod_content", "base_document_id", "paragraph_sources",
+)
+# Documents per page of GET /documents, and seconds a page is served from memory
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "50"))
+MAX_DOCUMENTS_PAGE_SIZE = 500
+DOCUMENTS_CACHE_TTL = float(os.getenv("DOCUMENTS_CACHE_TTL", "5"))
+# GET /search: results per page, and words of paragraph text per snippet
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+MAX_SEARCH_PAGE_SIZE = 100
+SEARCH_SNIPPET_WORDS = int(os.getenv("SEARCH_SNIPPET_WORDS", "30"))
+# GET /documents/{id}/similar: documents returned, candidate pairs read
+# from the band index per kind, band keys held by more rows than this
+# skipped (boilerplate found in many documents), and the least similarity
+# reported
+SIMILAR_LIMIT = int(os.getenv("SIMILAR_LIMIT", "10"))
+MAX_SIMILAR_LIMIT = 100
+SIMILAR_CANDIDATES = int(os.getenv("SIMILAR_CANDIDATES", "200"))
+SIMILAR_MAX_KEY_ROWS = int(os.getenv("SIMILAR_MAX_KEY_ROWS", "100"))
+SIMILAR_MIN_DOCUMENT = float(os.getenv("SIMILAR_MIN_DOCUMENT", "0.1"))
+SIMILAR_MIN_PARAGRAPH = float(os.getenv("SIMILAR_MIN_PARAGRAPH", "0.5"))
+
+# Bytes of analysis results (as JSON) kept in memory per process, keyed by
+# upload content (0 disables caching)
+ANALYSIS_CACHE_BYTES = int(os.getenv("ANALYSIS_CACHE_BYTES", str(32 * 1024 * 1024)))
+# Optional directory where cached results also survive restarts
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR")
+# Bump when analysis logic changes in a way the rule tables do not capture
+ANALYSIS_VERSION = 1
+
+# Background jobs (/jobs): directory holding the SQLite queue and the uploads
+# waiting in it, shared by every process that serves or works the queue
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "thesis-jobs"))
+# Queue consumers per process, and seconds between polls of an empty queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# SQLite journal of the queue: WAL when every process runs on one host,
+# DELETE (rollback journal) when hosts share JOBS_DIR over the network
+JOB_JOURNAL_MODE = os.getenv("JOB_JOURNAL_MODE", "WAL")
+# Seconds a claimed job stays hidden from other workers unless its worker
+# checks in, attempts per job, and first retry delay in seconds (doubling)
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# Seconds finished jobs and their results are kept
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+
+# Per-request profiling (?profile=true on /upload-docx and /upload-pdf, with
+# the X-Admin-Token header): the admin token (unset disables profiling),
+# where reports are kept and how many, sampling interval in seconds and
+# entries per report table
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILES_DIR = os.getenv("PROFILES_DIR", os.path.join(tempfile.gettempdir(), "thesis-profiles"))
+MAX_PROFILES = int(os.getenv("MAX_PROFILES", "100"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
+
+# JSON library for upload responses: "orjson" or the stdlib "json"
+RESPONSE_JSON_BACKEND = os.getenv("RESPONSE_JSON_BACKEND", "orjson")
+
 MANDATORY_FRONT_MATTER = {
     "Naslovna stran na platnici": [],
     "Notranja naslovna stran v zaključnem delu": [],
@@ -54,7 +237,10 @@ MANDATORY_FRONT_MATTER = {
     "Kazalo slik": [r"kazalo slik"],
     "Kazalo grafov": [r"kazalo grafov"],
     "Kazalo tabel": [r"kazalo tabel"],
-    "Seznam simbolov in kratic": [r"seznam.*simbol", r"seznam.*kratic", r"uporabljene.*kratice"],
+    # "a(?:(?!a)[^\n])*?b" finds "a...b" on one line like "a.*b", but scans
+    # the line once instead of once for every "a" in it
+    "Seznam simbolov in kratic": [r"seznam(?:(?!seznam)[^\n])*?simbol", r"seznam(?:(?!seznam)[^\n])*?kratic",
+                                  r"uporabljene(?:(?!uporabljene)[^\n])*?kratice"],
     "Vsebina zaključnega dela": [r"\buvod\b", r"^1\."],
     "Seznam virov in literature": [r"viri in literatura", r"seznam virov"],
     "Priloge": [r"priloge"],
@@ -67,6 +253,17 @@ CITYDATE_PATTERN = re.compile(
     re.IGNORECASE
 )
 
+# Inner title page labels, checked in order against each paragraph
+NOTRANJA_FIELDS = [
+    ("Študent", "student"),
+    ("Študijski program", "program"),
+    ("Smer", "smer"),
+    ("Mentor", "mentor"),
+    ("Somentor", "somentor"),
+    ("Lektor", "lektor"),
+]
+NOTRANJA_LABELS = ["Študent(ka):", "Študijski program:", "Smer:", "Mentor(ica):", "Lektor(ica):"]
+
 SUBSECTION_PATTERNS = [r"cilj", r"predpostavk", r"raziskovaln", r"omejit"]
 SECTION_PATTERNS = {
     "Uvod":               r"^\d+\.\s*UVOD|^UVOD",
@@ -76,98 +273,743 @@ SECTION_PATTERNS = {
     "Zaključek":          r"^\d+\.\s*(?:Zaključek|Sklep)|^(?:Zaključek|Sklep)",
 }
 
+# Every pattern here and in the rule tables runs in time linear in the
+# paragraph length; tests/test_adversarial.py holds inputs that would show
+# otherwise. Avoid unbounded repeats next to each other that can match the
+# same characters ("\s+.*?\s*"), and nested under a repeat that can give
+# characters back.
 ROMAN_RE = re.compile(r"^[IVXLCDM]+$", re.IGNORECASE)
+PAGE_NUMBER_RE = re.compile(r"\d+")
+NUMBERED_RE = re.compile(r"^\d+\.")
+ZAHVALA_RE = re.compile(r"^zahvala\b", re.IGNORECASE)
+SPECIAL_HEADING_RE = re.compile(r"(?:ključne besede|udk|keywords|udc)[:]? ", re.IGNORECASE)
+TOC_SECTION_RE = re.compile(r"^(kazalo vsebine|kazalo slik|kazalo grafov|kazalo tabel)")
+TOC_START_RE = re.compile(r"kazalo vsebine", re.IGNORECASE)
+TOC_END_RE = re.compile(r"^(kazalo slik|kazalo tabel|seznam virov|priloge)", re.IGNORECASE)
+# TOC entries ("1.2 Naslov ...... 14") are matched in two steps, see
+# `_toc_entry`: the number from the start of the text and the dot leader
+# and page number from the start of the reversed text
+TOC_NUMBER_RE = re.compile(r"\s*(?P<num>\d+(?:\.\d+)*)\.?(?P<space>\s*)")
+TOC_LEADER_REVERSED_RE = re.compile(r"\s*\d+\s*(?P<dots>\.{2,})\s*")
+CAPTION_RE = re.compile(r"^(Slika|Tabela)\s*\d+:", re.IGNORECASE)
+# Numbered headings, matched through `_numbered_heading`: a line break
+# after the number makes these try every shorter number
+SIMPLE_NUM_RE = re.compile(r"""
+    ^\s*
+    (?P<num>\d+(?:\.\d+)*)
+    \.?
+    (?=[^.\s])
+    (?P<title>.+)$
+""", re.VERBOSE)
+# any numbered prefix with at least one dot (1.1, 5.5.4, etc.)
+SUBSEC_RE = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)+)\.?\s*(?P<title>.+)$")
+# What SUBSEC_RE allows before a line break that its title follows
+SUBSEC_HEAD_RE = re.compile(r"\s*(?P<num>\d+(?:\.\d+)+)\.?\s*")
+SUBSEC_TITLE_RE = re.compile(r"\s*(?P<title>.+)")
+UVOD_HEADING_RE = re.compile(r"^\d+\.\s+UVOD", re.IGNORECASE)
+SECTION_NUMBER_RE = re.compile(r"^\d+\.\s+")
+
+# --- Metrics ---
+
+# Served by GET /metrics. Workers time their steps with `metrics.stage`;
+# `_run_in_pool` brings the timings back and records them here.
+registry = metrics.Registry()
+UPLOAD_BYTES = registry.histogram(
+    "thesis_upload_size_bytes", "Size of uploaded documents and archives", ["kind"], metrics.SIZE_BUCKETS)
+STAGE_SECONDS = registry.histogram(
+    "thesis_stage_duration_seconds", "Time spent in each document processing stage", ["stage"])
+SUPABASE_SECONDS = registry.histogram(
+    "thesis_supabase_request_duration_seconds", "Latency of Supabase requests made by saves", ["operation"])
+SUPABASE_ERRORS = registry.counter(
+    "thesis_supabase_request_errors_total", "Failed Supabase requests, retries included", ["operation"])
+BATCH_DOCUMENTS = registry.histogram(
+    "thesis_batch_documents", "Documents per /upload-batch request", buckets=(1, 2, 5, 10, 25, 50, 100))
+BATCH_RESULTS = registry.counter(
+    "thesis_batch_results_total", "Documents analyzed in batches, by their line's status", ["status"])
+ACTIVE_UPLOADS = registry.gauge(
+    "thesis_analysis_uploads_active", "Uploads holding or waiting for a worker pool slot")
+HTTP_IN_FLIGHT = registry.gauge(
+    "thesis_http_requests_in_flight", "Requests being served, streamed ones until their last byte", ["endpoint"])
+HTTP_SECONDS = registry.histogram(
+    "thesis_http_request_duration_seconds", "Time until the response is sent in full", ["endpoint"])
+HTTP_ERRORS = registry.counter(
+    "thesis_http_errors_total", "Responses with a 4xx or 5xx status", ["endpoint", "status"])
+
+def _record_stages(stages):
+    for name, seconds in stages:
+        STAGE_SECONDS.labels(name).observe(seconds)
+
+def _record_supabase_request(operation: str, seconds: float, error):
+    SUPABASE_SECONDS.labels(operation).observe(seconds)
+    if error is not None:
+        SUPABASE_ERRORS.labels(operation).inc()
+
+# --- Compiled rule engine ---
+
+# Case folding used by the rule prefilter. IGNORECASE treats the extra
+# characters as equal to ASCII letters even though str.lower() does not.
+RULE_FOLD = str.maketrans({
+    **{c: c.lower() for c in string.ascii_uppercase + "ČŠŽĐĆ"},
+    "\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k",
+})
+_FOLD_SAFE = frozenset(string.ascii_lowercase + string.digits + "čšžđć .,:;-")
+# Characters for which str.lower() does not produce the RULE_FOLD result.
+_FOLD_EXOTIC = re.compile("[\u0130\u0131\u017f]")
+
+def _fold(text):
+    """Fold `text` so IGNORECASE matches of safe literals become substrings."""
+    return text.translate(RULE_FOLD) if _FOLD_EXOTIC.search(text) else text.lower()
+
+def _required_literals(items):
+    """Return literals of which at least one occurs (folded) in every match.
+
+    `items` is a parsed pattern sequence. Returns None when no safe literal
+    can be derived, in which case the rule is never prefiltered.
+    """
+    candidates, run = [], ""
+    for op, av in items:
+        ch = chr(av).translate(RULE_FOLD) if op is _sre_parse.LITERAL else None
+        if ch is not None and ch in _FOLD_SAFE:
+            run += ch
+            continue
+        if run:
+            candidates.append((run,))
+            run = ""
+        sub = None
+        if op is _sre_parse.BRANCH:
+            branches = [_required_literals(list(b)) for b in av[1]]
+            sub = tuple(l for b in branches for l in b) if all(branches) else None
+        elif op is _sre_parse.SUBPATTERN:
+            sub = _required_literals(list(av[-1]))
+        elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) and av[0] >= 1:
+            sub = _required_literals(list(av[2]))
+        if sub:
+            candidates.append(sub)
+    if run:
+        candidates.append((run,))
+    return max(candidates, key=lambda c: min(map(len, c)), default=None)
+
+def _may_match(literals, folded):
+    """Cheap necessary condition for a prefiltered pattern to match."""
+    return literals is None or any(l in folded for l in literals)
+
+def _prefilter_literals(prefilter):
+    """Flatten prefilter literals; None if some rule cannot be prefiltered."""
+    if any(lits is None for _, lits in prefilter):
+        return None
+    return list(dict.fromkeys(l for _, lits in prefilter for l in lits))
+
+def _compile_rule_matcher(front_matter, sections):
+    """Combine the front-matter and body-section tables into one matcher.
+
+    Every rule pattern sits in its own optional lookahead, so a single
+    `match` call reports all rules a paragraph hits, including overlapping
+    ones (e.g. "1. UVOD" is both "Vsebina zaključnega dela" and "Uvod").
+    Returns the compiled pattern, a dict mapping group number to
+    `(kind, name)` and a prefilter list of `(kind, name), literals` pairs.
+    """
+    parts, rules, prefilter = [], [], []
+    tables = [("front", name, pats) for name, pats in front_matter.items()]
+    tables += [("body", name, [pat]) for name, pat in sections.items()]
+    for kind, name, pats in tables:
+        for pat in pats:
+            parts.append(f"(?=(?:(?s:.*?)(?P<r{len(rules)}>{pat}))?)")
+            rules.append((kind, name))
+            prefilter.append(((kind, name), _required_literals(list(_sre_parse.parse(pat)))))
+    matcher = re.compile("".join(parts), re.IGNORECASE)
+    groups = {matcher.groupindex[f"r{i}"]: rule for i, rule in enumerate(rules)}
+    return matcher, groups, prefilter
+
+RULE_MATCHER, RULE_GROUPS, RULE_PREFILTER = _compile_rule_matcher(MANDATORY_FRONT_MATTER, SECTION_PATTERNS)
+TYPE_LITERALS = _required_literals(list(_sre_parse.parse(TYPE_PATTERN.pattern)))
+TOC_START_LITERALS = _required_literals(list(_sre_parse.parse(TOC_START_RE.pattern)))
+
+def _rules_fingerprint():
+    """Digest of the rule tables and patterns that decide analysis results."""
+    patterns = sorted((name, value.pattern, value.flags) for name, value in globals().items()
+                      if isinstance(value, re.Pattern))
+    rules = (ANALYSIS_VERSION, MANDATORY_FRONT_MATTER, SECTION_PATTERNS, SUBSECTION_PATTERNS,
+             NOTRANJA_FIELDS, NOTRANJA_LABELS, patterns)
+    return hashlib.sha256(repr(rules).encode()).hexdigest()[:16]
+
+RULES_FINGERPRINT = _rules_fingerprint()
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_BYTES, RULES_FINGERPRINT, ANALYSIS_CACHE_DIR)
+documents_cache = ResponseCache(DOCUMENTS_CACHE_TTL)
+persistence_queue = WriteBehindQueue(
+    _connect_supabase if supabase else None,
+    workers=PERSIST_WORKERS,
+    max_attempts=PERSIST_MAX_ATTEMPTS,
+    retry_delay=PERSIST_RETRY_DELAY,
+    batch_bytes=PERSIST_BATCH_BYTES,
+    concurrency=PERSIST_INSERT_CONCURRENCY,
+    rpc=PERSIST_PARAGRAPH_RPC,
+    on_saved=lambda document_id: documents_cache.clear(),
+    on_request=_record_supabase_request,
+)
+job_queue = JobQueue(os.path.join(JOBS_DIR, "jobs.sqlite3"), JOB_VISIBILITY_TIMEOUT,
+                     JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, journal_mode=JOB_JOURNAL_MODE)
+profile_store = profiling.ProfileStore(PROFILES_DIR, MAX_PROFILES)
 
 # --- Supabase Helper Functions ---
 
-async def save_document_to_supabase(filename: str, file_type: str, analysis_result: dict):
-    """Save document analysis to Supabase"""
-    if not supabase:
-        logger.warning("Supabase not configured, skipping database save")
+def _document_row(document_id: str, filename: str, file_type: str, analysis_result: dict,
+                  revision: dict, minhash: Optional[list] = None):
+    """Map an analysis result, its revision plan and signature onto a `documents` table row."""
+    notranja = analysis_result.get("notranja_naslovna", {})
+    structure = analysis_result.get("structure_analysis", {})
+    
+    return {
+        "id": document_id,
+        "filename": filename,
+        "file_type": file_type,
+        "title": notranja.get("title"),
+        "document_type": notranja.get("type"),
+        "student_name": notranja.get("student"),
+        "study_program": notranja.get("program"),
+        "study_direction": notranja.get("smer"),
+        "mentor": notranja.get("mentor"),
+        "co_mentor": notranja.get("somentor"),
+        "lecturer": notranja.get("lektor"),
+        "overall_score": structure.get("overall_score"),
+        "total_sections": structure.get("total_sections"),
+        "found_sections": structure.get("found_sections"),
+        "missing_critical_count": structure.get("missing_critical"),
+        "uvod_quality": structure.get("uvod_quality"),
+        "front_matter_analysis": analysis_result.get("front_matter_found", {}),
+        "body_sections_analysis": analysis_result.get("body_sections_found", {}),
+        "missing_sections": analysis_result.get("missing_sections", []),
+        "missing_body_sections": analysis_result.get("missing_body_sections", []),
+        "recommendations": structure.get("recommendations", []),
+        "table_of_contents": analysis_result.get("table_of_contents", []),
+        "uvod_content": analysis_result.get("uvod", []),
+        "base_document_id": revision["base_document_id"],
+        "paragraph_hashes": revision["paragraph_hashes"],
+        "paragraph_sources": revision["paragraph_sources"],
+        "minhash": minhash,
+    }
+
+def _paragraph_rows(document_id: str, paragraphs: list, stored: Optional[list] = None):
+    """Map analyzed paragraphs onto `document_paragraphs` table rows.
+
+    With `stored`, only the paragraphs at those positions get rows.
+    """
+    positions = range(len(paragraphs)) if stored is None else stored
+    return [
+        {
+            "document_id": document_id,
+            "paragraph_order": idx,
+            "paragraph_id": paragraphs[idx].get("id"),
+            "paragraph_style": paragraphs[idx].get("style"),
+            "content": paragraphs[idx].get("content", ""),
+            "search_terms": search.index_terms(paragraphs[idx].get("content", "")),
+        }
+        for idx in positions
+    ]
+
+def _revision_plan(paragraphs: list, base: Optional[dict] = None):
+    """Paragraph hashes and, for a revision of `base`, which paragraphs need rows.
+
+    `base` is the base's `documents` row. A base saved without hashes is
+    not diffed against: the revision then stores all of its paragraphs.
+    """
+    hashes = revisions.paragraph_hashes(paragraphs)
+    plan = {"base_document_id": None, "paragraph_hashes": hashes, "paragraph_sources": None,
+            "stored": None}
+    if base is not None:
+        plan["base_document_id"] = base["id"]
+        if base.get("paragraph_hashes") is not None:
+            plan["paragraph_sources"], plan["stored"] = revisions.plan_delta(
+                hashes, base["id"], base["paragraph_hashes"], base.get("paragraph_sources"))
+    return plan
+
+def _revision_summary(plan: dict):
+    paragraphs = len(plan["paragraph_hashes"])
+    stored = paragraphs if plan["stored"] is None else len(plan["stored"])
+    return {"base_document_id": plan["base_document_id"], "paragraphs": paragraphs,
+            "stored_paragraphs": stored}
+
+async def _revision_base(base_document_id: Optional[str]):
+    """The `documents` row a revised upload is diffed against, or None without one.
+
+    Waits for the base's own save when it is still queued.
+    """
+    if not base_document_id or not persistence_queue.enabled:
         return None
+    await persistence_queue.wait(base_document_id)
+    try:
+        db = await _connect_supabase()
+        result = await db.table("documents").select("id,paragraph_hashes,paragraph_sources") \
+            .eq("id", base_document_id).execute()
+    except Exception as e:
+        logger.error(f"Error fetching base document {base_document_id}: {str(e)}")
+        raise HTTPException(500, f"Error fetching base document: {str(e)}")
+    if not result.data:
+        raise HTTPException(404, "Base document not found")
+    return result.data[0]
+
+async def save_document_to_supabase(filename: str, file_type: str, analysis_result: dict,
+                                    document_id: Optional[str] = None, wait: bool = False,
+                                    revision: Optional[dict] = None):
+    """Queue the document analysis for saving to Supabase.
+
+    Returns the document id (pre-generated unless given) and the save job
+    status, or `(None, None)` when the database is not configured. With
+    `wait`, returns once the save has succeeded or failed. A `revision`
+    plan from `_revision_plan` stores only the paragraphs its base lacks.
+    The document's MinHash signature and band rows are saved with it; they
+    and the rows are built by the persistence worker, and a document whose
+    fingerprint fails is saved without one.
+    """
+    if not persistence_queue.enabled:
+        logger.warning("Supabase not configured, skipping database save")
+        return None, None
     
+    document_id = document_id or str(uuid.uuid4())
+    paragraphs = analysis_result.get("paragraphs", [])
+    if revision is None:
+        revision = await _in_thread(_revision_plan, paragraphs)
+
+    async def prepare():
+        try:
+            # Paragraphs another document stores are indexed under that document
+            minhash, bands = await _run_in_pool(
+                similarity.fingerprint, [p.get("content", "") for p in paragraphs], revision["stored"])
+        except Exception as e:
+            logger.error(f"Fingerprinting document {document_id} failed, saving it without: {e}")
+            minhash, bands = None, []
+        rows = await _in_thread(_paragraph_rows, document_id, paragraphs, revision["stored"])
+        return (
+            _document_row(document_id, filename, file_type, analysis_result, revision, minhash),
+            rows,
+            [{"document_id": document_id, "paragraph_order": order, "band": band, "band_key": key}
+             for order, band, key in bands],
+        )
+
+    status = await persistence_queue.enqueue(document_id, prepare=prepare)
+    if status is None:
+        logger.error("Persistence queue is not running, document not saved")
+        return None, None
+    if wait:
+        status = await persistence_queue.wait(document_id)
+    return document_id, status["status"]
+
+# --- Worker pool ---
+
+class DocumentError(Exception):
+    """Failure inside a pool worker that maps onto an HTTP error response."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+_executor = None
+_active_uploads = 0
+
+def _get_executor():
+    """Lazily start the analysis process pool (None runs work on a thread)."""
+    global _executor
+    if _executor is None and ANALYSIS_WORKERS > 0:
+        _executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def _shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+@contextmanager
+def _analysis_slot():
+    """Admit one upload to the worker pool, or fail fast when the queue is full."""
+    global _active_uploads
+    if _active_uploads >= max(ANALYSIS_WORKERS, 1) + ANALYSIS_QUEUE_DEPTH:
+        raise HTTPException(503, "Server is busy, please retry later.",
+                            headers={"Retry-After": str(ANALYSIS_RETRY_AFTER)})
+    _active_uploads += 1
     try:
-        # Extract data from analysis result
-        notranja = analysis_result.get("notranja_naslovna", {})
-        structure = analysis_result.get("structure_analysis", {})
-        
-        # Prepare document data
-        document_data = {
-            "filename": filename,
-            "file_type": file_type,
-            "title": notranja.get("title"),
-            "document_type": notranja.get("type"),
-            "student_name": notranja.get("student"),
-            "study_program": notranja.get("program"),
-            "study_direction": notranja.get("smer"),
-            "mentor": notranja.get("mentor"),
-            "co_mentor": notranja.get("somentor"),
-            "lecturer": notranja.get("lektor"),
-            "overall_score": structure.get("overall_score"),
-            "total_sections": structure.get("total_sections"),
-            "found_sections": structure.get("found_sections"),
-            "missing_critical_count": structure.get("missing_critical"),
-            "uvod_quality": structure.get("uvod_quality"),
-            "front_matter_analysis": analysis_result.get("front_matter_found", {}),
-            "body_sections_analysis": analysis_result.get("body_sections_found", {}),
-            "missing_sections": analysis_result.get("missing_sections", []),
-            "missing_body_sections": analysis_result.get("missing_body_sections", []),
-            "recommendations": structure.get("recommendations", []),
-            "table_of_contents": analysis_result.get("table_of_contents", []),
-            "uvod_content": analysis_result.get("uvod", []),
-        }
-        
-        # Insert document record
-        document_result = supabase.table("documents").insert(document_data).execute()
-        
-        if document_result.data:
-            document_id = document_result.data[0]["id"]
-            logger.info(f"Document saved with ID: {document_id}")
-            
-            # Save paragraphs
-            paragraphs = analysis_result.get("paragraphs", [])
-            if paragraphs:
-                await save_paragraphs_to_supabase(document_id, paragraphs)
-            
-            return document_id
+        yield
+    finally:
+        _active_uploads -= 1
+
+@asynccontextmanager
+async def _job_analysis_slot():
+    """Admit a background job to the worker pool once one of its workers is free.
+
+    Jobs wait instead of being turned away, so a busy server never costs
+    them an attempt, and they leave the queue depth to uploads.
+    """
+    global _active_uploads
+    while _active_uploads >= max(ANALYSIS_WORKERS, 1):
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+    _active_uploads += 1
+    try:
+        yield
+    finally:
+        _active_uploads -= 1
+
+def _within_budget(seconds, fn, *args):
+    """Call `fn(*args)` under a CPU time budget (in the pool process)."""
+    try:
+        with budget.cpu_budget(seconds):
+            return fn(*args)
+    except budget.BudgetExceeded:
+        raise DocumentError(422, f"Analysis exceeded its time budget of {seconds:g}s of CPU time; "
+                                 f"the document may be malformed.")
+
+async def _run_in_pool(fn, *args):
+    """Run a CPU-bound function off the event loop, recording the stages it times.
+
+    The call fails with 422 when it uses up ANALYSIS_TIME_BUDGET. Inside
+    `_profiled`, it runs under the profiler and its report is added to the
+    request's profile.
+    """
+    loop = asyncio.get_running_loop()
+    calls = _profile_calls.get()
+    call = (_within_budget, ANALYSIS_TIME_BUDGET, fn, *args)
+    try:
+        if calls is None:
+            result, stages = await loop.run_in_executor(_get_executor(), metrics.collect_stages, *call)
         else:
-            logger.error("Failed to save document to Supabase")
-            return None
-            
+            (result, stages), report = await loop.run_in_executor(
+                _get_executor(), profiling.profile_call, metrics.collect_stages, call,
+                PROFILE_INTERVAL, PROFILE_TOP)
+            calls.append({"function": fn.__name__, "stages": stages, **report})
+    except DocumentError as e:
+        if calls is not None and getattr(e, "profile", None):
+            calls.append({"function": fn.__name__, **e.profile})
+        raise HTTPException(e.status_code, e.detail)
+    except BrokenProcessPool:
+        logger.error("Analysis worker died, restarting the pool")
+        _shutdown_executor()
+        raise HTTPException(500, "Analysis worker crashed")
+    _record_stages(stages)
+    return result
+
+def _page_ranges(page_count: int, parallelism: int):
+    """Split pages into at most `parallelism` contiguous `(start, end)` ranges."""
+    size = max(-(-page_count // max(parallelism, 1)), MIN_PAGES_PER_RANGE)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+async def _convert_pdf_parallel(pdf_path: str, step: Optional[int] = None, progress=None):
+    """Convert page ranges of a PDF in separate workers and merge paragraphs in page order.
+
+    With `step`, ranges hold at most that many pages and run
+    `PDF_CONVERT_PARALLELISM` at a time, calling `progress("converting",
+    pages_done=..., pages_total=...)` as each one finishes.
+    """
+    page_count = await _run_in_pool(_pdf_page_count, pdf_path)
+    if step:
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    else:
+        ranges = _page_ranges(page_count, PDF_CONVERT_PARALLELISM)
+    slots = asyncio.Semaphore(max(PDF_CONVERT_PARALLELISM, 1))
+    pages_done = 0
+
+    async def convert(start, end):
+        nonlocal pages_done
+        async with slots:
+            part = await _run_in_pool(_convert_pdf_range, pdf_path, start, end)
+        pages_done += end - start
+        if progress:
+            progress("converting", pages_done=pages_done, pages_total=page_count)
+        return part
+
+    parts = await asyncio.gather(*(convert(start, end) for start, end in ranges))
+    return [p for part in parts for p in part]
+
+# --- Background jobs ---
+
+async def _in_thread(fn, *args):
+    """Run a blocking call off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+async def run_job_workers(count: int):
+    """Work the job queue with `count` consumers until cancelled."""
+    await asyncio.gather(*(_job_worker(f"{socket.gethostname()}:{os.getpid()}:{i}") for i in range(count)))
+
+async def _job_worker(worker: str):
+    last_purge = 0.0
+    while True:
+        try:
+            job = await _in_thread(job_queue.claim, worker)
+        except Exception as e:
+            logger.error(f"Job queue unavailable: {e}")
+            job = None
+        if job is not None:
+            try:
+                await _run_job(job)
+            except Exception as e:
+                # E.g. the queue failing to record the outcome: the lease
+                # runs out and the job is retried, this worker goes on
+                logger.error(f"Job {job.id} could not be finished: {e}")
+            continue
+        if time.monotonic() - last_purge > 3600:
+            last_purge = time.monotonic()
+            try:
+                for path in await _in_thread(job_queue.purge, JOB_RETENTION):
+                    _remove_quietly(path)
+            except Exception as e:
+                logger.error(f"Purging finished jobs failed: {e}")
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def _run_job(job):
+    """Analyze and save one claimed job, keeping its lease alive meanwhile.
+
+    The job id doubles as the document id, so a job processed twice
+    overwrites its document instead of duplicating it.
+    """
+    heartbeat = asyncio.ensure_future(_job_heartbeat(job))
+    try:
+        digest = await _in_thread(_file_digest, job.input_path)
+        result = await _analyze_upload(job.input_path, digest, job.kind, job.engine, background=True)
+        document_id, save_status = await save_document_to_supabase(
+            job.filename, job.kind, result, document_id=job.id, wait=True)
+    except asyncio.CancelledError:
+        await _in_thread(job_queue.release, job)
+        raise
+    except HTTPException as e:
+        # Unreadable documents fail for good, server trouble is retried
+        status = await _in_thread(job_queue.fail, job, e.detail, e.status_code >= 500)
     except Exception as e:
-        logger.error(f"Error saving document to Supabase: {str(e)}")
+        logger.error(f"Job {job.id} failed: {e}")
+        status = await _in_thread(job_queue.fail, job, str(e))
+    else:
+        if await _in_thread(job_queue.complete, job, result, document_id, save_status):
+            _remove_quietly(job.input_path)
+        return
+    finally:
+        heartbeat.cancel()
+    if status == JOB_FAILED:
+        _remove_quietly(job.input_path)
+
+async def _job_heartbeat(job):
+    while True:
+        await asyncio.sleep(JOB_VISIBILITY_TIMEOUT / 3)
+        if not await _in_thread(job_queue.heartbeat, job):
+            logger.warning(f"Lost the lease on job {job.id} to another worker")
+            return
+
+def _file_digest(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest
+
+def _remove_quietly(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+class _SpooledStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs `cleanup` however the response ends.
+
+    A body generator's own `finally` never runs when the client goes away
+    before the body starts, so spooled files are removed here too; the
+    generator is closed first, to stop the work it started.
+    """
+
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self.cleanup()
+
+# --- Upload streaming ---
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject uploads that declare an oversize body before any of it is read."""
+    length = request.headers.get("content-length", "")
+    limit = MAX_BATCH_BYTES if request.url.path == "/upload-batch" else MAX_UPLOAD_BYTES
+    if request.method == "POST" and length.isdigit() and int(length) > limit + MULTIPART_OVERHEAD:
+        return JSONResponse({"detail": _too_large_message(limit)}, status_code=413)
+    return await call_next(request)
+
+def _too_large_message(limit=None):
+    return f"File too large, the limit is {limit or MAX_UPLOAD_BYTES} bytes."
+
+async def _spool_upload(file: UploadFile, suffix: str, directory: Optional[str] = None):
+    """Copy an upload to a temp file chunk by chunk, hashing it on the way.
+
+    Returns the temp file path, which the caller must unlink, and the
+    SHA-256 digest of the content.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as tmp:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(413, _too_large_message())
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    UPLOAD_BYTES.labels(suffix.lstrip(".")).observe(size)
+    return tmp.name, digest
+
+def _spool_zip_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Decompress one archive member to a temp file like `_spool_upload`.
+
+    The size is checked while decompressing, since the sizes recorded in
+    the archive cannot be trusted.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    suffix = os.path.splitext(info.filename)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp, zf.open(info) as member:
+        try:
+            while chunk := member.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise DocumentError(413, _too_large_message())
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    UPLOAD_BYTES.labels(suffix.lstrip(".")).observe(size)
+    return tmp.name, digest
+
+def _upload_kind(filename: str):
+    """"docx", "pdf" or "zip" by file extension, None for anything else."""
+    ext = os.path.splitext(filename.lower())[1].lstrip(".")
+    return ext if ext in ("docx", "pdf", "zip") else None
+
+# --- Request metrics ---
+
+def _endpoint_label(path: str):
+    """Route template a path belongs to, so ids do not each get their own series."""
+    for route in app.router.routes:
+        if route.path_regex.match(path):
+            return route.path
+    return "unmatched"
+
+class _RequestMetrics:
+    """ASGI middleware recording requests in flight, durations and errors per endpoint.
+
+    Streamed responses count as in flight until their last byte is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = _endpoint_label(scope["path"])
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            HTTP_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+            if status >= 400:
+                HTTP_ERRORS.labels(endpoint, str(status)).inc()
+
+# Outermost, so requests the upload size limit turns away are counted too
+app.add_middleware(_RequestMetrics)
+
+# --- Profiling ---
+
+# Pool call reports of the request being profiled, None when not profiling
+_profile_calls = contextvars.ContextVar("profile_calls", default=None)
+
+def _require_admin(request: Request):
+    token = request.headers.get("x-admin-token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(403, "This requires the admin token.")
+
+def _profile_id(request: Request, profile: bool):
+    """A new profile id when an admin asked to profile the request, else None."""
+    if not profile:
         return None
+    _require_admin(request)
+    return str(uuid.uuid4())
 
-async def save_paragraphs_to_supabase(document_id: str, paragraphs: list):
-    """Save document paragraphs to Supabase"""
-    if not supabase:
+@asynccontextmanager
+async def _profiled(profile_id: Optional[str], endpoint: str, filename: str, **options):
+    """Profile the pool calls made in the block and store the report under `profile_id`.
+
+    The report is stored even when the block fails; the cache is bypassed
+    meanwhile (see `_analyze_upload`).
+    """
+    if profile_id is None:
+        yield
         return
-    
+    calls = []
+    token = _profile_calls.set(calls)
+    start = time.perf_counter()
+    error = None
     try:
-        # Prepare paragraph data
-        paragraph_data = []
-        for idx, paragraph in enumerate(paragraphs):
-            paragraph_data.append({
-                "document_id": document_id,
-                "paragraph_order": idx,
-                "paragraph_id": paragraph.get("id"),
-                "paragraph_style": paragraph.get("style"),
-                "content": paragraph.get("content", "")
-            })
-        
-        # Insert paragraphs in batches (Supabase has limits)
-        batch_size = 100
-        for i in range(0, len(paragraph_data), batch_size):
-            batch = paragraph_data[i:i + batch_size]
-            result = supabase.table("document_paragraphs").insert(batch).execute()
-            
-            if not result.data:
-                logger.error(f"Failed to save paragraph batch {i // batch_size + 1}")
-        
-        logger.info(f"Saved {len(paragraphs)} paragraphs for document {document_id}")
-        
+        yield
     except Exception as e:
-        logger.error(f"Error saving paragraphs to Supabase: {str(e)}")
+        error = e
+        raise
+    finally:
+        _profile_calls.reset(token)
+        report = {
+            "profile_id": profile_id,
+            "endpoint": endpoint,
+            "filename": filename,
+            "options": options,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "seconds": round(time.perf_counter() - start, 6),
+            "error": getattr(error, "detail", None) or (repr(error) if error else None),
+            "calls": calls,
+        }
+        try:
+            await _in_thread(profile_store.save, profile_id, report)
+        except OSError as e:
+            logger.error(f"Could not store profile {profile_id}: {e}")
+
+def _with_profile_id(profile_id: Optional[str], response: Response):
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+# --- Response encoding ---
+
+# In order of preference: JSON answers requests without an Accept header
+RESPONSE_ENCODERS = (JSONEncoder(RESPONSE_JSON_BACKEND), MsgpackEncoder())
+
+def _response_encoder(request: Request):
+    """Encoder for the client's Accept header; checked before any work is done."""
+    encoder = negotiate(request.headers.get("accept"), RESPONSE_ENCODERS)
+    if encoder is None:
+        types = ", ".join(e.media_type for e in RESPONSE_ENCODERS)
+        raise HTTPException(406, f"Unsupported Accept header, use one of: {types}")
+    return encoder
+
+def _analysis_response(encoder, result: dict, **extra):
+    """Encode an analysis result, appending `extra` fields without copying the result."""
+    return Response(encoder.encode(result, extra), media_type=encoder.media_type,
+                    headers={"Vary": "Accept"})
 
 # --- API Endpoints ---
 
@@ -180,100 +1022,716 @@ def health_check():
     """Health check endpoint"""
     return {"status": "ok", "message": "Service is running"}
 
+async def _analyze_upload(path: str, digest, kind: str, engine: Optional[str] = None, progress=None,
+                          background: bool = False):
+    """Analyze a spooled DOCX or PDF in the worker pool, unless already analyzed.
+
+    With a `progress(stage, **data)` callback, reading and analysis run as
+    separate pool calls so each stage can be reported as it finishes.
+    `background` work (jobs) waits for a free worker instead of being
+    refused with 503 when the server is busy.
+    """
+    async def run():
+        if progress:
+            return await _analyze_in_stages(path, kind, engine, progress)
+        if kind == "docx":
+            return await _run_in_pool(_analyze_docx, path)
+        if engine == "pdf2docx" and PDF_CONVERT_PARALLELISM > 1:
+            paragraphs = await _convert_pdf_parallel(path)
+            return await _run_in_pool(_process_styled_text, paragraphs)
+        return await _run_in_pool(_analyze_pdf, path, engine)
+
+    async def analyze():
+        if background:
+            async with _job_analysis_slot():
+                return await run()
+        with _analysis_slot():
+            return await run()
+    if _profile_calls.get() is not None:
+        # A cached result would leave nothing to profile
+        return await analyze()
+    key = content_key(digest, "docx", DOCX_READER) if kind == "docx" else content_key(digest, "pdf", engine)
+    return await analysis_cache.get_or_compute(key, analyze)
+
+async def _analyze_in_stages(path: str, kind: str, engine: Optional[str], progress):
+    if kind == "docx":
+        paragraphs = await _run_in_pool(_extract_docx, path)
+    elif engine == "pdf2docx":
+        paragraphs = await _convert_pdf_parallel(path, PDF_PROGRESS_STEP, progress)
+    else:
+        page_count = await _run_in_pool(_pdf_page_count, path)
+        paragraphs = await _run_in_pool(_extract_pdf, path)
+        progress("converting", pages_done=page_count, pages_total=page_count)
+    progress("extracted", paragraphs=len(paragraphs))
+    result = await _run_in_pool(_process_styled_text, paragraphs)
+    progress("checked")
+    return result
+
 @app.post("/upload-docx")
-async def upload_docx(file: UploadFile = File(...)):
+async def upload_docx(request: Request, file: UploadFile = File(...), profile: bool = False,
+                      base_document_id: Optional[str] = None):
     if not file.filename.lower().endswith(".docx"):
         raise HTTPException(400, "Please upload a DOCX file.")
-    data = await file.read()
+    encoder = _response_encoder(request)
+    profile_id = _profile_id(request, profile)
+    base = await _revision_base(base_document_id)
+    docx_path, digest = await _spool_upload(file, ".docx")
     try:
-        doc = Document(io.BytesIO(data))
-    except Exception as e:
-        raise HTTPException(400, f"Error reading DOCX: {e}")
-    
-    # Process document
-    analysis_result = _process_document(doc)
+        async with _profiled(profile_id, "/upload-docx", file.filename):
+            analysis_result = await _analyze_upload(docx_path, digest, "docx")
+    finally:
+        os.unlink(docx_path)
     
-    # Save to Supabase
-    document_id = await save_document_to_supabase(file.filename, "docx", analysis_result)
+    # Save to Supabase, only the paragraphs a base lacks
+    revision = await _in_thread(_revision_plan, analysis_result["paragraphs"], base) if base else None
+    document_id, save_status = await save_document_to_supabase(file.filename, "docx", analysis_result,
+                                                               revision=revision)
     
     # Add document_id to response
-    response_data = analysis_result.copy()
-    response_data["document_id"] = document_id
-    
-    return JSONResponse(response_data)
+    extra = {"revision": _revision_summary(revision)} if revision else {}
+    return _with_profile_id(profile_id, _analysis_response(
+        encoder, analysis_result, document_id=document_id, save_status=save_status, **extra))
 
 @app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(request: Request, file: UploadFile = File(...), engine: Optional[str] = None,
+                     profile: bool = False, base_document_id: Optional[str] = None):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(400, "Please upload a PDF file.")
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-        tmp.write(await file.read())
-        pdf_path = tmp.name
-    docx_path = pdf_path[:-4] + ".docx"
+    engine = engine or PDF_ENGINE
+    if engine not in PDF_ENGINES:
+        raise HTTPException(400, f"Unknown PDF engine '{engine}', use one of: {', '.join(PDF_ENGINES)}")
+    encoder = _response_encoder(request)
+    profile_id = _profile_id(request, profile)
+    base = await _revision_base(base_document_id)
+    pdf_path, digest = await _spool_upload(file, ".pdf")
     try:
-        conv = Converter(pdf_path)
-        conv.convert(docx_path)
-        conv.close()
-    except Exception as e:
+        async with _profiled(profile_id, "/upload-pdf", file.filename, engine=engine):
+            analysis_result = await _analyze_upload(pdf_path, digest, "pdf", engine)
+    finally:
         os.unlink(pdf_path)
-        raise HTTPException(500, f"Conversion failed: {e}")
+    
+    # Save to Supabase, only the paragraphs a base lacks
+    revision = await _in_thread(_revision_plan, analysis_result["paragraphs"], base) if base else None
+    document_id, save_status = await save_document_to_supabase(file.filename, "pdf", analysis_result,
+                                                               revision=revision)
+    
+    # Add document_id to response
+    extra = {"revision": _revision_summary(revision)} if revision else {}
+    return _with_profile_id(profile_id, _analysis_response(
+        encoder, analysis_result, document_id=document_id, save_status=save_status, **extra))
+
+@app.post("/quick-check")
+async def quick_check(file: UploadFile = File(...)):
+    """Title-page checks of a DOCX or PDF, reading only its first paragraphs or pages"""
+    kind = _upload_kind(file.filename or "")
+    if kind not in ("docx", "pdf"):
+        raise HTTPException(400, "Please upload a DOCX or PDF file.")
+    path, _ = await _spool_upload(file, "." + kind)
     try:
-        doc = Document(docx_path)
-    except Exception as e:
-        raise HTTPException(500, f"Error reading converted DOCX: {e}")
+        with _analysis_slot():
+            limit = QUICK_CHECK_PARAGRAPHS if kind == "docx" else QUICK_CHECK_PAGES
+            return await _run_in_pool(_quick_check, path, kind, limit)
     finally:
-        os.unlink(pdf_path); os.unlink(docx_path)
-    
-    # Process document
-    analysis_result = _process_document(doc)
+        os.unlink(path)
+
+@app.post("/upload-docx/stream")
+async def upload_docx_stream(file: UploadFile = File(...)):
+    """`/upload-docx` reporting its progress as server-sent events."""
+    if not file.filename.lower().endswith(".docx"):
+        raise HTTPException(400, "Please upload a DOCX file.")
+    docx_path, digest = await _spool_upload(file, ".docx")
+    return _event_stream(_stream_analysis(file.filename, docx_path, digest, "docx"), docx_path)
+
+@app.post("/upload-pdf/stream")
+async def upload_pdf_stream(file: UploadFile = File(...), engine: Optional[str] = None):
+    """`/upload-pdf` reporting its progress as server-sent events."""
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(400, "Please upload a PDF file.")
+    engine = engine or PDF_ENGINE
+    if engine not in PDF_ENGINES:
+        raise HTTPException(400, f"Unknown PDF engine '{engine}', use one of: {', '.join(PDF_ENGINES)}")
+    pdf_path, digest = await _spool_upload(file, ".pdf")
+    return _event_stream(_stream_analysis(file.filename, pdf_path, digest, "pdf", engine), pdf_path)
+
+def _event_stream(events, path: str):
+    # Proxies must pass events through as they come instead of buffering them
+    return _SpooledStreamingResponse(events, lambda: _remove_quietly(path), media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _sse(event: str, data: bytes) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+async def _stream_analysis(filename: str, path: str, digest, kind: str, engine: Optional[str] = None):
+    """Server-sent events for one upload, ending with its analysis.
+
+    `progress` events carry a `stage`: received, converting (PDF, with
+    `pages_done`/`pages_total`), extracted, checked and persisted. Cached
+    results skip straight to persisted. The last event is `result`, with
+    the body `/upload-docx` or `/upload-pdf` would return, or `error`, with
+    `status` and `detail`.
+    """
+    encoder = RESPONSE_ENCODERS[0]
+    events = asyncio.Queue()
+
+    def progress(stage, **data):
+        events.put_nowait(_sse("progress", encoder.encode({"stage": stage, **data})))
+
+    async def run():
+        try:
+            result = await _analyze_upload(path, digest, kind, engine, progress)
+            document_id, save_status = await save_document_to_supabase(filename, kind, result)
+            progress("persisted", document_id=document_id, save_status=save_status)
+            events.put_nowait(_sse("result", encoder.encode(
+                result, {"document_id": document_id, "save_status": save_status})))
+        except HTTPException as e:
+            events.put_nowait(_sse("error", encoder.encode({"status": e.status_code, "detail": e.detail})))
+        except Exception as e:
+            logger.error(f"Error analyzing {filename}: {e}")
+            events.put_nowait(_sse("error", encoder.encode({"status": 500, "detail": f"Error analyzing document: {e}"})))
+        finally:
+            events.put_nowait(None)
+
+    progress("received", filename=filename, bytes=os.path.getsize(path))
+    task = asyncio.ensure_future(run())
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+    finally:
+        # Also reached when the client disconnects: stop the analysis
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        _remove_quietly(path)
+
+@app.post("/upload-batch")
+async def upload_batch(files: List[UploadFile] = File(...), engine: Optional[str] = None):
+    """Analyze several DOCX and PDF files, or zip archives of them, as NDJSON.
+
+    Documents are analyzed `BATCH_CONCURRENCY` at a time and each one's
+    line is sent as soon as it is done, so lines arrive in completion
+    order; `index` is the document's position in the upload. A document
+    that fails gets a line with its `status` and `detail` instead of
+    failing the batch.
+    """
+    engine = engine or PDF_ENGINE
+    if engine not in PDF_ENGINES:
+        raise HTTPException(400, f"Unknown PDF engine '{engine}', use one of: {', '.join(PDF_ENGINES)}")
     
-    # Save to Supabase
-    document_id = await save_document_to_supabase(file.filename, "pdf", analysis_result)
+    # Spool everything first: the uploaded files are closed once the response starts
+    items = []
+    try:
+        for file in files:
+            kind = _upload_kind(file.filename or "")
+            if kind is None:
+                items.append(_BatchItem(file.filename, error=(400, "Please upload DOCX, PDF or ZIP files.")))
+                continue
+            path, digest = await _spool_upload(file, "." + kind)
+            if kind != "zip":
+                items.append(_BatchItem(file.filename, kind, path, digest))
+                continue
+            try:
+                loop = asyncio.get_running_loop()
+                items += await loop.run_in_executor(
+                    None, _unpack_batch_zip, file.filename, path, MAX_BATCH_FILES - len(items))
+            except DocumentError as e:
+                raise HTTPException(e.status_code, e.detail)
+            finally:
+                os.unlink(path)
+        if len(items) > MAX_BATCH_FILES:
+            raise HTTPException(400, _too_many_files_message())
+    except BaseException:
+        _remove_batch_files(items)
+        raise
     
-    # Add document_id to response
-    response_data = analysis_result.copy()
-    response_data["document_id"] = document_id
+    BATCH_DOCUMENTS.observe(len(items))
+    return _SpooledStreamingResponse(_stream_batch(items, engine), lambda: _remove_batch_files(items),
+                                     media_type="application/x-ndjson")
+
+class _BatchItem:
+    """One document of a batch: a spooled file, or the error it was refused with."""
+    __slots__ = ("filename", "kind", "path", "digest", "error")
+
+    def __init__(self, filename, kind=None, path=None, digest=None, error=None):
+        self.filename = filename
+        self.kind = kind
+        self.path = path
+        self.digest = digest
+        self.error = error
+
+def _too_many_files_message():
+    return f"Too many documents, the limit is {MAX_BATCH_FILES} per batch."
+
+def _unpack_batch_zip(archive: str, zip_path: str, room: int):
+    """Spool the DOCX and PDF members of a zip archive as batch items.
+
+    Other members become error items; more than `room` documents fail the
+    whole batch.
+    """
+    items = []
+    try:
+        try:
+            zf = zipfile.ZipFile(zip_path)
+        except zipfile.BadZipFile:
+            return [_BatchItem(archive, error=(400, "Not a valid zip archive."))]
+        with zf:
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                    continue
+                filename = f"{archive}/{name}"
+                kind = _upload_kind(name)
+                if kind not in ("docx", "pdf"):
+                    items.append(_BatchItem(filename, error=(400, "Only DOCX and PDF files are read from archives.")))
+                    continue
+                if len(items) >= room:
+                    raise DocumentError(400, _too_many_files_message())
+                try:
+                    path, digest = _spool_zip_member(zf, info)
+                except DocumentError as e:
+                    items.append(_BatchItem(filename, error=(e.status_code, e.detail)))
+                    continue
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError, ValueError) as e:
+                    items.append(_BatchItem(filename, error=(400, f"Error reading archive member: {e}")))
+                    continue
+                items.append(_BatchItem(filename, kind, path, digest))
+    except BaseException:
+        _remove_batch_files(items)
+        raise
+    return items
+
+def _remove_batch_files(items):
+    for item in items:
+        if item.path:
+            os.unlink(item.path)
+            item.path = None
+
+async def _stream_batch(items, engine: str):
+    """Yield the NDJSON line of every batch item, in the order they finish."""
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(index, item):
+        async with slots:
+            return await _batch_line(index, item, engine)
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client went away or the batch is done; stop what is left
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        _remove_batch_files(items)
+
+async def _batch_line(index: int, item: _BatchItem, engine: str) -> bytes:
+    encoder = RESPONSE_ENCODERS[0]
+    header = {"index": index, "filename": item.filename}
+
+    def error_line(status, detail):
+        BATCH_RESULTS.labels(str(status)).inc()
+        return encoder.encode({**header, "status": status, "detail": detail}) + b"\n"
+
+    if item.error:
+        return error_line(*item.error)
+    try:
+        result = await _analyze_upload(item.path, item.digest, item.kind, engine)
+        document_id, save_status = await save_document_to_supabase(item.filename, item.kind, result)
+    except HTTPException as e:
+        return error_line(e.status_code, e.detail)
+    except Exception as e:
+        logger.error(f"Error analyzing {item.filename} in batch: {e}")
+        return error_line(500, f"Error analyzing document: {e}")
+    finally:
+        os.unlink(item.path)
+        item.path = None
+    BATCH_RESULTS.labels("200").inc()
+    return encoder.encode(result, {**header, "status": 200,
+                                   "document_id": document_id, "save_status": save_status}) + b"\n"
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), engine: Optional[str] = None):
+    """Queue a DOCX or PDF for background analysis and return its job id"""
+    kind = _upload_kind(file.filename or "")
+    if kind not in ("docx", "pdf"):
+        raise HTTPException(400, "Please upload a DOCX or PDF file.")
+    engine = engine or PDF_ENGINE
+    if kind == "pdf" and engine not in PDF_ENGINES:
+        raise HTTPException(400, f"Unknown PDF engine '{engine}', use one of: {', '.join(PDF_ENGINES)}")
     
-    return JSONResponse(response_data)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path, _ = await _spool_upload(file, "." + kind, JOBS_DIR)
+    try:
+        job_id = await _in_thread(job_queue.submit, kind, file.filename, path,
+                                  engine if kind == "pdf" else None)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return JSONResponse({"job_id": job_id, "status": "queued"}, status_code=202,
+                        headers={"Location": f"/jobs/{job_id}"})
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """Get the status of a background job, and its analysis once done"""
+    encoder = _response_encoder(request)
+    job = await _in_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return _analysis_response(encoder, job)
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Analysis result cache counters"""
+    return analysis_cache.stats()
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(request: Request, profile_id: str, format: str = "json"):
+    """Get a stored request profile (admin only); format=collapsed gives flame graph input"""
+    _require_admin(request)
+    if format not in ("json", "collapsed"):
+        raise HTTPException(400, "Unknown format, use json or collapsed.")
+    report = await _in_thread(profile_store.get, profile_id)
+    if report is None:
+        raise HTTPException(404, "Profile not found")
+    if format == "collapsed":
+        stacks = "\n".join(call["collapsed"] for call in report["calls"] if call.get("collapsed"))
+        return Response(stacks + "\n", media_type="text/plain; charset=utf-8")
+    return JSONResponse(report)
+
+@app.get("/metrics")
+def get_metrics():
+    """Request, stage and database metrics in the Prometheus text format"""
+    ACTIVE_UPLOADS.set(_active_uploads)
+    return Response(registry.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/documents")
-async def get_documents():
-    """Get list of all documents"""
+async def get_documents(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=MAX_DOCUMENTS_PAGE_SIZE),
+    document_type: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    """Get a page of documents, newest first"""
     if not supabase:
         raise HTTPException(500, "Database not configured")
     
+    key = str(sorted(request.query_params.multi_items()))
+    cached = documents_cache.get(key)
+    if cached is None:
+        after = _decode_cursor(cursor) if cursor else None
+        try:
+            page = await _documents_page(limit, after, document_type, created_from, created_to)
+        except Exception as e:
+            logger.error(f"Error fetching documents: {str(e)}")
+            raise HTTPException(500, f"Error fetching documents: {str(e)}")
+        cached = documents_cache.put(key, page)
+    
+    etag, page = cached
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(page, headers={"ETag": etag})
+
+async def _documents_page(limit, after, document_type, created_from, created_to):
+    """Keyset page of `document_summary` ordered by (created_at, id) descending."""
+    db = await _connect_supabase()
+    query = db.table("document_summary").select("*")
+    if document_type:
+        query = query.eq("document_type", document_type)
+    if created_from:
+        query = query.gte("created_at", created_from.isoformat())
+    if created_to:
+        query = query.lt("created_at", created_to.isoformat())
+    if after:
+        created_at, document_id = after
+        query = query.or_(f'created_at.lt."{created_at}",'
+                          f'and(created_at.eq."{created_at}",id.lt."{document_id}")')
+    result = await query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    rows = result.data
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"documents": rows[:limit], "next_cursor": next_cursor}
+
+def _encode_cursor(row: dict):
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    """`(created_at, id)` of a cursor, parsed and written out again.
+
+    The values end up in a PostgREST filter string, so only a timestamp
+    and a UUID get through, in their canonical form.
+    """
     try:
-        result = supabase.table("document_summary").select("*").order("created_at", desc=True).execute()
-        return {"documents": result.data}
-    except Exception as e:
-        logger.error(f"Error fetching documents: {str(e)}")
-        raise HTTPException(500, f"Error fetching documents: {str(e)}")
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, document_id = json.loads(raw)
+        return _parse_timestamp(created_at).isoformat(), str(uuid.UUID(document_id))
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(400, "Invalid cursor")
+
+def _parse_timestamp(value: str):
+    # Postgres trims trailing zeros of the fraction and may write UTC as Z,
+    # neither of which fromisoformat takes before Python 3.11
+    value = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), value, count=1)
+    return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
 
 @app.get("/documents/{document_id}")
-async def get_document(document_id: str):
-    """Get specific document with paragraphs"""
+async def get_document(
+    document_id: str,
+    fields: Optional[str] = None,
+    limit: int = Query(PARAGRAPH_PAGE_SIZE, ge=1, le=MAX_PARAGRAPH_PAGE_SIZE),
+):
+    """Get specific document with the first page of its paragraphs"""
     if not supabase:
         raise HTTPException(500, "Database not configured")
+    columns = _paragraph_columns(fields)
     
     try:
-        # Get document
-        doc_result = supabase.table("documents").select("*").eq("id", document_id).execute()
+        # Get document and first paragraph page concurrently
+        db = await _connect_supabase()
+        doc_result, (paragraphs, next_cursor) = await asyncio.gather(
+            db.table("documents").select(",".join(DOCUMENT_COLUMNS)).eq("id", document_id).execute(),
+            _paragraph_page(db, document_id, columns, limit),
+        )
         if not doc_result.data:
             raise HTTPException(404, "Document not found")
         
-        # Get paragraphs
-        para_result = supabase.table("document_paragraphs").select("*").eq("document_id", document_id).order("paragraph_order").execute()
-        
         document = doc_result.data[0]
-        document["paragraphs"] = para_result.data
+        sources = document.pop("paragraph_sources", None)
+        if sources:
+            # A revision: its own rows are only the paragraphs that changed
+            paragraphs, next_cursor = await _paragraph_page(db, document_id, columns, limit, sources=sources)
+        document["paragraphs"] = paragraphs
         
-        return {"document": document}
+        return {"document": document, "next_cursor": next_cursor}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error fetching document {document_id}: {str(e)}")
         raise HTTPException(500, f"Error fetching document: {str(e)}")
 
+@app.get("/documents/{document_id}/paragraphs")
+async def get_document_paragraphs(
+    document_id: str,
+    after: Optional[int] = None,
+    fields: Optional[str] = None,
+    limit: int = Query(PARAGRAPH_PAGE_SIZE, ge=1, le=MAX_PARAGRAPH_PAGE_SIZE),
+):
+    """Get the page of paragraphs following `after` (a paragraph_order cursor)"""
+    if not supabase:
+        raise HTTPException(500, "Database not configured")
+    columns = _paragraph_columns(fields)
+    
+    try:
+        db = await _connect_supabase()
+        doc_result, (paragraphs, next_cursor) = await asyncio.gather(
+            db.table("documents").select("paragraph_sources").eq("id", document_id).execute(),
+            _paragraph_page(db, document_id, columns, limit, after),
+        )
+        sources = doc_result.data[0].get("paragraph_sources") if doc_result.data else None
+        if sources:
+            paragraphs, next_cursor = await _paragraph_page(db, document_id, columns, limit, after, sources)
+        return {"paragraphs": paragraphs, "next_cursor": next_cursor}
+    except Exception as e:
+        logger.error(f"Error fetching paragraphs of {document_id}: {str(e)}")
+        raise HTTPException(500, f"Error fetching paragraphs: {str(e)}")
+
+def _paragraph_columns(fields: Optional[str]):
+    """PostgREST select list for a `fields=` projection; the cursor column is always kept."""
+    if not fields:
+        return ",".join(PARAGRAPH_COLUMNS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in PARAGRAPH_FIELDS]
+    if unknown:
+        raise HTTPException(400, f"Unknown paragraph fields: {', '.join(unknown)}")
+    return ",".join(["paragraph_order"] + [f for f in requested if f != "paragraph_order"])
+
+async def _paragraph_page(db, document_id: str, columns: str, limit: int, after: Optional[int] = None,
+                          sources: Optional[list] = None):
+    """Fetch `limit` paragraphs past the cursor, and the cursor of the next page if any.
+
+    A revision's `paragraph_sources` say which rows, of its own or of
+    earlier versions, hold each paragraph.
+    """
+    if sources:
+        return await _revision_page(db, document_id, columns, limit, after, sources)
+    query = db.table("document_paragraphs").select(columns).eq("document_id", document_id)
+    if after is not None:
+        query = query.gt("paragraph_order", after)
+    # One extra row tells whether another page follows
+    result = await query.order("paragraph_order").limit(limit + 1).execute()
+    rows = result.data
+    next_cursor = rows[limit - 1]["paragraph_order"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+async def _revision_page(db, document_id: str, columns: str, limit: int, after: Optional[int],
+                         sources: list):
+    start = 0 if after is None else after + 1
+    located = revisions.locate_range(sources, start, start + limit + 1)
+
+    async def fetch(source, rows):
+        result = await db.table("document_paragraphs").select(columns) \
+            .eq("document_id", source or document_id).in_("paragraph_order", list(rows)).execute()
+        return source, result.data
+
+    page = []
+    for source, data in await asyncio.gather(*(fetch(source, rows) for source, rows in located.items())):
+        for row in data:
+            # Shown as paragraphs of this document, at their place in it
+            for order in located[source][row["paragraph_order"]]:
+                paragraph = {**row, "paragraph_order": order}
+                if "document_id" in paragraph:
+                    paragraph["document_id"] = document_id
+                page.append(paragraph)
+    page.sort(key=lambda row: row["paragraph_order"])
+    next_cursor = page[limit - 1]["paragraph_order"] if len(page) > limit else None
+    return page[:limit], next_cursor
+
+@app.get("/search")
+async def search_paragraphs(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+):
+    """Search stored paragraphs; every word of `q` must occur, in any inflected form.
+
+    Results are ranked, with a snippet of the paragraph around the matching
+    words. A paragraph that revisions share with their base is found once,
+    under the document that stores it.
+    """
+    if not supabase:
+        raise HTTPException(500, "Database not configured")
+    terms = search.query_terms(q)
+    if not terms:
+        raise HTTPException(400, "The query has no words to search for")
+
+    key = "search:" + str(sorted(request.query_params.multi_items()))
+    cached = documents_cache.get(key)
+    if cached is None:
+        try:
+            db = await _connect_supabase()
+            result = await db.rpc("search_paragraphs", {
+                "p_query": search.tsquery(terms), "p_limit": limit + 1, "p_offset": offset}).execute()
+        except Exception as e:
+            logger.error(f"Error searching paragraphs: {str(e)}")
+            raise HTTPException(500, f"Error searching paragraphs: {str(e)}")
+        rows = result.data
+        results = []
+        for row in rows[:limit]:
+            text, highlights = search.snippet(row["content"], terms, SEARCH_SNIPPET_WORDS)
+            results.append({
+                "document_id": row["document_id"],
+                "paragraph_order": row["paragraph_order"],
+                "paragraph_style": row["paragraph_style"],
+                "rank": row["rank"],
+                "snippet": text,
+                "highlights": highlights,
+            })
+        next_offset = offset + limit if len(rows) > limit else None
+        cached = documents_cache.put(key, {"query": q, "terms": terms, "results": results,
+                                           "next_offset": next_offset})
+
+    etag, page = cached
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(page, headers={"ETag": etag})
+
+@app.get("/documents/{document_id}/similar")
+async def get_similar_documents(
+    document_id: str,
+    limit: int = Query(SIMILAR_LIMIT, ge=1, le=MAX_SIMILAR_LIMIT),
+):
+    """Stored documents most like this one, and the paragraphs they share with it
+
+    Candidates come from the MinHash band index; documents are scored by
+    estimated similarity of their signatures, paragraphs by the exact
+    similarity of their five-word shingles. A paragraph that revisions
+    share with their base is matched under the document that stores it.
+    """
+    if not supabase:
+        raise HTTPException(500, "Database not configured")
+    if persistence_queue.enabled:
+        await persistence_queue.wait(document_id)
+
+    try:
+        db = await _connect_supabase()
+        document, documents, paragraphs = await asyncio.gather(
+            db.table("documents").select("id,minhash").eq("id", document_id).execute(),
+            db.rpc("similar_candidates", {"p_document_id": document_id, "p_paragraphs": False,
+                                          "p_limit": SIMILAR_CANDIDATES,
+                                          "p_max_key_rows": SIMILAR_MAX_KEY_ROWS}).execute(),
+            db.rpc("similar_candidates", {"p_document_id": document_id, "p_paragraphs": True,
+                                          "p_limit": SIMILAR_CANDIDATES,
+                                          "p_max_key_rows": SIMILAR_MAX_KEY_ROWS}).execute(),
+        )
+        if not document.data:
+            raise HTTPException(404, "Document not found")
+
+        pairs = await _similar_paragraphs(db, document_id, paragraphs.data)
+        candidates = list(dict.fromkeys([row["document_id"] for row in documents.data]
+                                        + [pair["document_id"] for pair in pairs]))
+        stored = await db.table("documents").select("id,filename,title,minhash") \
+            .in_("id", candidates).execute() if candidates else None
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error finding documents similar to {document_id}: {str(e)}")
+        raise HTTPException(500, f"Error finding similar documents: {str(e)}")
+
+    minhash = document.data[0].get("minhash")
+    shared = {}
+    for pair in pairs:
+        shared[pair["document_id"]] = shared.get(pair["document_id"], 0) + 1
+    similar = []
+    for row in stored.data if stored else []:
+        score = similarity.estimate(minhash, row["minhash"]) if minhash and row.get("minhash") else 0.0
+        if score >= SIMILAR_MIN_DOCUMENT or row["id"] in shared:
+            similar.append({"document_id": row["id"], "filename": row.get("filename"), "title": row.get("title"),
+                            "similarity": round(score, 3), "shared_paragraphs": shared.get(row["id"], 0)})
+    similar.sort(key=lambda d: (-d["similarity"], -d["shared_paragraphs"], d["document_id"]))
+    shown = {d["document_id"] for d in similar[:limit]}
+    return {"document_id": document_id, "documents": similar[:limit],
+            "paragraphs": [pair for pair in pairs if pair["document_id"] in shown]}
+
+async def _similar_paragraphs(db, document_id: str, candidates: list):
+    """Candidate paragraph pairs at least SIMILAR_MIN_PARAGRAPH alike, most alike first."""
+    if not candidates:
+        return []
+    wanted = {document_id: {row["paragraph_order"] for row in candidates}}
+    for row in candidates:
+        wanted.setdefault(row["document_id"], set()).add(row["match_order"])
+
+    async def fetch(source, orders):
+        result = await db.table("document_paragraphs").select("paragraph_order,content") \
+            .eq("document_id", source).in_("paragraph_order", sorted(orders)).execute()
+        return source, {row["paragraph_order"]: row["content"] for row in result.data}
+
+    contents = dict(await asyncio.gather(*(fetch(source, orders) for source, orders in wanted.items())))
+
+    def score():
+        pairs = []
+        for row in candidates:
+            content = contents[document_id].get(row["paragraph_order"])
+            match = contents[row["document_id"]].get(row["match_order"])
+            if content is None or match is None:
+                continue
+            value = similarity.jaccard(content, match)
+            if value >= SIMILAR_MIN_PARAGRAPH:
+                pairs.append({"paragraph_order": row["paragraph_order"], "document_id": row["document_id"],
+                              "match_paragraph_order": row["match_order"], "similarity": round(value, 3),
+                              "content": content, "match_content": match})
+        pairs.sort(key=lambda p: (-p["similarity"], p["paragraph_order"], p["document_id"]))
+        return pairs
+    return await _in_thread(score)
+
+@app.get("/documents/{document_id}/status")
+def get_document_status(document_id: str):
+    """Get the save status of a recently uploaded document"""
+    status = persistence_queue.status(document_id)
+    if status is None:
+        raise HTTPException(404, "No save job for this document")
+    return status
+
 @app.delete("/documents/{document_id}")
 async def delete_document(document_id: str):
     """Delete a document and its paragraphs"""
@@ -281,8 +1739,14 @@ async def delete_document(document_id: str):
         raise HTTPException(500, "Database not configured")
     
     try:
-        result = supabase.table("documents").delete().eq("id", document_id).execute()
+        db = await _connect_supabase()
+        dependents = await db.table("documents").select("id").eq("base_document_id", document_id) \
+            .limit(1).execute()
+        if dependents.data:
+            raise HTTPException(409, "Document has revisions stored against it, delete those first")
+        result = await db.table("documents").delete().eq("id", document_id).execute()
         if result.data:
+            documents_cache.clear()
             return {"message": "Document deleted successfully"}
         else:
             raise HTTPException(404, "Document not found")
@@ -292,66 +1756,200 @@ async def delete_document(document_id: str):
         logger.error(f"Error deleting document {document_id}: {str(e)}")
         raise HTTPException(500, f"Error deleting document: {str(e)}")
 
-# --- Core processing (unchanged) ---
+# --- Core processing ---
+
+def _analyze_docx(source):
+    """Pool worker: parse a DOCX file path or bytes and analyze it."""
+    try:
+        # The lxml reader streams, its parsing counts as analysis time
+        with metrics.stage("docx_parse"):
+            paragraphs = _read_docx(source)
+    except Exception as e:
+        raise DocumentError(400, f"Error reading DOCX: {e}")
+    try:
+        return _process_styled_text(paragraphs)
+    except docx_reader.DocxError as e:
+        raise DocumentError(400, f"Error reading DOCX: {e}")
+
+def _read_docx(source):
+    """`(style, text)` pairs of a DOCX path or bytes, read with the configured reader."""
+    if DOCX_READER == "lxml":
+        return docx_reader.iter_styled_text(source)
+    return _iter_styled_text(Document(io.BytesIO(source) if isinstance(source, bytes) else source))
+
+def _extract_docx(source):
+    """Pool worker: the `(style, text)` pairs of a DOCX as a list."""
+    try:
+        with metrics.stage("docx_parse"):
+            return list(_read_docx(source))
+    except Exception as e:
+        raise DocumentError(400, f"Error reading DOCX: {e}")
+
+def _analyze_pdf(pdf_path: str, engine: str = "pdf2docx"):
+    """Pool worker: read a PDF with the chosen engine and analyze it."""
+    if engine == "pymupdf":
+        return _process_styled_text(_extract_pdf(pdf_path))
+
+    return _process_styled_text(_convert_pdf_range(pdf_path))
+
+def _extract_pdf(pdf_path: str):
+    """Pool worker: the `(style, text)` pairs of a PDF read with PyMuPDF."""
+    try:
+        with metrics.stage("pdf_extract"):
+            return pdf_extract.extract_styled_text(pdf_path)
+    except Exception as e:
+        raise DocumentError(500, f"Error reading PDF: {e}")
 
-def _process_document(doc: Document):
+def _quick_check(path: str, kind: str, limit: int):
+    """Pool worker: inner title page fields and title-page checks from the start of a document.
+
+    Reads at most `limit` DOCX paragraphs, streamed from the XML, or the
+    first `limit` PDF pages. Fields that only appear later in the document
+    are not seen.
+    """
+    try:
+        with metrics.stage("quick_check_read"):
+            if kind == "docx":
+                with closing(docx_reader.iter_styled_text(path)) as reader:
+                    pairs = list(islice(reader, limit))
+            else:
+                with fitz.open(path) as pdf:
+                    pages = range(min(limit, pdf.page_count))
+                pairs = pdf_extract.extract_styled_text(path, pages)
+    except Exception as e:
+        raise DocumentError(400, f"Error reading {kind.upper()}: {e}")
+    paragraphs = [{"style": style, "content": text} for style, text in pairs]
+    with metrics.stage("quick_check"):
+        return {
+            "notranja_naslovna": _extract_notranja_info(paragraphs),
+            "front_matter_found": {
+                "Naslovna stran na platnici": _validate_naslovna_stran(paragraphs),
+                "Notranja naslovna stran v zaključnem delu": _validate_notranja_stran(paragraphs),
+            },
+            "paragraphs_read": len(paragraphs),
+        }
+
+def _pdf_page_count(pdf_path: str):
+    """Pool worker: number of pages in a PDF."""
+    try:
+        with fitz.open(pdf_path) as pdf:
+            return pdf.page_count
+    except Exception as e:
+        raise DocumentError(500, f"Conversion failed: {e}")
+
+def _convert_pdf_range(pdf_path: str, start: int = 0, end: Optional[int] = None):
+    """Pool worker: convert pages `start:end` with pdf2docx and read their `(style, text)` pairs."""
+    docx_path = f"{pdf_path[:-4]}.{start}.docx"
+    # Removed however the worker stops, BudgetExceeded (a BaseException) included
+    try:
+        try:
+            with metrics.stage("pdf_convert"):
+                conv = Converter(pdf_path)
+                conv.convert(docx_path, start=start, end=end)
+                conv.close()
+        except Exception as e:
+            raise DocumentError(500, f"Conversion failed: {e}")
+        try:
+            with metrics.stage("docx_parse"):
+                return list(_read_docx(docx_path))
+        except Exception as e:
+            raise DocumentError(500, f"Error reading converted DOCX: {e}")
+    finally:
+        if os.path.exists(docx_path):
+            os.unlink(docx_path)
+
+def _process_document(doc: Document, mode=None):
     # 1. Extract all paragraphs
-    paragraphs = _extract_paragraphs(doc)
+    return _process_styled_text(_iter_styled_text(doc), mode)
 
+def _process_styled_text(pairs, mode=None):
+    """Analyze `(style, text)` pairs straight from an extractor.
+
+    The fused analyzer keeps them as compact `Paragraph` records; the
+    pipeline gets the usual paragraph dicts.
+    """
+    mode = mode or ANALYZER_MODE
+    if mode == "fused":
+        with metrics.stage("fused_analysis"):
+            return _analyze_stream(Paragraph(style, text) for style, text in pairs)
+    return _process_paragraphs(
+        ({"id": str(uuid.uuid4()), "style": style, "content": text} for style, text in pairs), mode)
+
+def _process_paragraphs(paragraphs, mode=None):
+    """Analyze paragraph records from any extractor with the configured analyzer."""
+    mode = mode or ANALYZER_MODE
+    if mode not in ANALYZER_MODES:
+        raise ValueError(f"Unknown analyzer mode: {mode}")
+    if mode == "fused":
+        with metrics.stage("fused_analysis"):
+            return _analyze_stream(paragraphs)
+    with metrics.stage("read_paragraphs"):
+        paragraphs = list(paragraphs)
+    return _analyze_paragraphs(paragraphs)
+
+def _analyze_paragraphs(paragraphs):
     # 2. Style special sections
-    styled = _style_special_sections(paragraphs)
+    with metrics.stage("style_special_sections"):
+        styled = _style_special_sections(paragraphs)
 
     # 3. Remove all TOC sections (basic TOC skip based on title)
-    filtered = []
-    skip = False
-    for p in styled:
-        txt_low = p["content"].strip().lower()
-        if re.match(r"^(kazalo vsebine|kazalo slik|kazalo grafov|kazalo tabel)", txt_low):
-            skip = True
-            continue
-        if skip and re.match(r"^\d+\.", p["content"]):
-            skip = False
-        if skip:
-            continue
-        filtered.append(p)
+    with metrics.stage("skip_toc_sections"):
+        filtered = []
+        skip = False
+        for p in styled:
+            txt_low = p["content"].strip().lower()
+            if TOC_SECTION_RE.match(txt_low):
+                skip = True
+                continue
+            if skip and NUMBERED_RE.match(p["content"]):
+                skip = False
+            if skip:
+                continue
+            filtered.append(p)
 
     # 4. Run checks on full styled content
-    notranja      = _extract_notranja_info(paragraphs)
-    front         = _check_front_matter(styled)
+    with metrics.stage("extract_notranja_info"):
+        notranja  = _extract_notranja_info(paragraphs)
+    with metrics.stage("extract_uvod"):
+        uvod      = _extract_uvod(styled)
+    with metrics.stage("check_sections"):
+        front, body = _check_sections(styled, uvod)
     missing_front = [s for s, ok in front.items() if not ok]
-    uvod          = _extract_uvod(styled)
-    body          = _check_body_sections(styled)
     missing_body  = [s for s, ok in body.items() if not ok]
 
     # 5. Apply TOC-based heading styles
-    toc        = _extract_toc(filtered)
-    final_para = _apply_toc_styles(filtered, toc)
+    with metrics.stage("extract_toc"):
+        toc        = _extract_toc(filtered)
+    with metrics.stage("apply_toc_styles"):
+        final_para = _apply_toc_styles(filtered, toc)
 
     # 6. Remove numbered TOC entries with dot leaders and page numbers
-    final_para = _filter_out_toc_entries(final_para)
+    with metrics.stage("filter_out_toc_entries"):
+        final_para = _filter_out_toc_entries(final_para)
 
     # 7. Trim everything before "Zahvala" and remove unwanted lines
-    output_para = []
-    saw_zahvala = False
-    for p in final_para:
-        text = p["content"].strip()
-
-        # a) Wait until we hit "Zahvala"
-        if not saw_zahvala:
-            if re.match(r"^zahvala\b", text, re.IGNORECASE):
-                saw_zahvala = True
-            else:
-                continue
+    with metrics.stage("trim_output"):
+        output_para = []
+        saw_zahvala = False
+        for p in final_para:
+            text = p["content"].strip()
 
-        # b) Skip standalone Roman numerals
-        if ROMAN_RE.match(text):
-            continue
+            # a) Wait until we hit "Zahvala"
+            if not saw_zahvala:
+                if ZAHVALA_RE.match(text):
+                    saw_zahvala = True
+                else:
+                    continue
 
-        # c) Skip standalone page numbers (e.g. "1", "11", "123")
-        if re.fullmatch(r"\d+", text):
-            continue
+            # b) Skip standalone Roman numerals
+            if ROMAN_RE.match(text):
+                continue
+
+            # c) Skip standalone page numbers (e.g. "1", "11", "123")
+            if PAGE_NUMBER_RE.fullmatch(text):
+                continue
 
-        output_para.append(p)
+            output_para.append(p)
 
     # 8. Calculate enhanced metrics
     structure_analysis = _calculate_structure_metrics(front, body, uvod)
@@ -369,7 +1967,197 @@ def _process_document(doc: Document):
     }
 
 
-# --- Helper functions (unchanged) ---
+class Paragraph:
+    """Compact paragraph record for the fused analyzer.
+
+    The style name is interned and the id is only generated when the
+    paragraph is serialized, so dropped paragraphs never get one.
+    """
+    __slots__ = ("style", "content", "_id")
+
+    def __init__(self, style, content, id=None):
+        self.style = sys.intern(style) if type(style) is str else style
+        self.content = content
+        self._id = id
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+
+    def as_dict(self):
+        return {"id": self.id, "style": self.style, "content": self.content}
+
+def _analyze_stream(paragraphs):
+    """Run the fused analyzer over an iterable of `Paragraph` records or paragraph dicts."""
+    analyzer = StreamingAnalyzer()
+    for p in paragraphs:
+        analyzer.feed(p)
+    return analyzer.result()
+
+class StreamingAnalyzer:
+    """Single-pass state machine producing the `_analyze_paragraphs` result.
+
+    Feed paragraphs in document order and call `result()` once. Every
+    step of the pipeline keeps its own small state here, so each paragraph
+    is inspected once. The only deferred work is styling plain numbered
+    headings ("1.Uvod") whose TOC entry is seen later in the stream.
+    """
+
+    def __init__(self):
+        self.notranja = {"title": None, "type": None, "student": None,
+                         "program": None, "smer": None,
+                         "mentor": None, "somentor": None, "lektor": None}
+        self._title_lines = []
+        self._program_pending = False
+        self._first_page = []
+        self._notranja_flags = [False] * (len(NOTRANJA_LABELS) + 1)
+        self._rules = _RuleScan()
+        self._uvod = []
+        self._uvod_state = "before"
+        self._toc_skip = False
+        self._toc_state = "before"
+        self._toc = []
+        self._level_map = {}
+        self._deferred = []
+        self._saw_zahvala = False
+        self._output = []
+
+    def feed(self, p):
+        if not isinstance(p, Paragraph):
+            p = Paragraph(p["style"], p["content"], p.get("id"))
+        content = p.content
+        # Stripped and folded once here for every step below
+        text = content.strip()
+        folded = _fold(content)
+
+        # Title pages and section checks see every paragraph
+        self._feed_title_pages(p, content, text, folded)
+        style = _special_section_style(text)
+        if style:
+            p.style = style
+        self._rules.feed(content, folded)
+        self._feed_uvod(content)
+
+        # Skip TOC sections until the next numbered paragraph
+        if TOC_SECTION_RE.match(text.lower()):
+            self._toc_skip = True
+            return
+        if self._toc_skip:
+            if not NUMBERED_RE.match(content):
+                return
+            self._toc_skip = False
+
+        # TOC extraction and TOC-based heading styles
+        self._feed_toc(content, folded)
+        style, key, listed_only = _toc_heading_style(content)
+        if key in self._level_map:
+            style = f"Heading {self._level_map[key]}"
+        elif listed_only:
+            self._deferred.append((p, key))
+            style = None
+        if style:
+            p.style = style
+
+        # Drop TOC entries, everything before "Zahvala" and bare numbers
+        if _is_toc_line(content):
+            return
+        if not self._saw_zahvala:
+            if not ZAHVALA_RE.match(text):
+                return
+            self._saw_zahvala = True
+        if ROMAN_RE.match(text) or PAGE_NUMBER_RE.fullmatch(text):
+            return
+        self._output.append(p)
+
+    def _feed_title_pages(self, p, content, text, folded):
+        info = self.notranja
+        if len(self._first_page) < 6:
+            self._first_page.append(text)
+        if self._program_pending:
+            self._program_pending = False
+            if text and ":" not in text:
+                info["program"] += " — " + text
+
+        is_type = _may_match(TYPE_LITERALS, folded) and TYPE_PATTERN.search(text)
+        if is_type:
+            info["type"] = text
+            if self._title_lines:
+                info["title"] = " ".join(self._title_lines)
+            self._title_lines = []
+        elif not text:
+            self._title_lines = []
+        elif not CITYDATE_PATTERN.match(text):
+            self._title_lines.append(text)
+
+        flags = self._notranja_flags
+        flags[0] = flags[0] or bool(is_type)
+        for i, label in enumerate(NOTRANJA_LABELS, 1):
+            flags[i] = flags[i] or label in content
+
+        for prefix, key in NOTRANJA_FIELDS:
+            if text.startswith(prefix):
+                info[key] = text.split(":",1)[1].strip()
+                self._program_pending = key == "program"
+                break
+
+    def _feed_uvod(self, content):
+        if self._uvod_state == "after":
+            return
+        if UVOD_HEADING_RE.match(content) or content.strip().upper() == "UVOD":
+            self._uvod_state = "inside"
+        elif self._uvod_state == "inside":
+            if SECTION_NUMBER_RE.match(content):
+                self._uvod_state = "after"
+            else:
+                self._uvod.append(content)
+
+    def _feed_toc(self, content, folded):
+        if self._toc_state == "before":
+            if _may_match(TOC_START_LITERALS, folded) and TOC_START_RE.search(content):
+                self._toc_state = "inside"
+        elif self._toc_state == "inside":
+            if TOC_END_RE.match(content):
+                self._toc_state = "after"
+                return
+            entry = _toc_entry(content)
+            if entry:
+                n, title = entry
+                entry = {"number": n, "title": title, "level": n.count(".")+1}
+                self._toc.append(entry)
+                self._level_map[(entry["number"], entry["title"])] = entry["level"]
+
+    def result(self):
+        for p, key in self._deferred:
+            if key in self._level_map:
+                p.style = f"Heading {self._level_map[key]}"
+
+        uvod = self._uvod
+        front, body = self._rules.results(_validate_naslovna_lines(self._first_page),
+                                          all(self._notranja_flags), uvod)
+        return {
+            "notranja_naslovna": self.notranja,
+            "paragraphs": self._serialize_output(),
+            "front_matter_found": front,
+            "missing_sections": [s for s, ok in front.items() if not ok],
+            "uvod": uvod,
+            "body_sections_found": body,
+            "missing_body_sections": [s for s, ok in body.items() if not ok],
+            "table_of_contents": self._toc,
+            "structure_analysis": _calculate_structure_metrics(front, body, uvod)
+        }
+
+    def _serialize_output(self):
+        """Turn the kept records into dicts in place, freeing each record as it goes."""
+        self._deferred = []
+        output, self._output = self._output, []
+        for i, p in enumerate(output):
+            output[i] = p.as_dict()
+        return output
+
+
+# --- Helper functions ---
 
 def _calculate_structure_metrics(front_matter, body_sections, uvod):
     """Calculate comprehensive structure analysis metrics"""
@@ -430,16 +2218,20 @@ def _generate_recommendations(found, total, missing_critical, uvod):
     return recommendations
 
 def _filter_out_toc_entries(paragraphs):
-    toc_line_re = re.compile(r"^\s*\d+(\.\d+)*\.?\s+.+?\.{2,}\s*\d+\s*$")
-    return [p for p in paragraphs if not toc_line_re.match(p["content"])]
+    return [p for p in paragraphs if not _is_toc_line(p["content"])]
 
 def _extract_paragraphs(doc: Document):
-    out = []
+    return list(_iter_paragraphs(doc))
+
+def _iter_paragraphs(doc: Document):
+    for style, txt in _iter_styled_text(doc):
+        yield {"id": str(uuid.uuid4()), "style": style, "content": txt}
+
+def _iter_styled_text(doc: Document):
     for para in doc.paragraphs:
         txt = para.text.strip()
         if txt:
-            out.append({"id": str(uuid.uuid4()), "style": para.style.name, "content": txt})
-    return out
+            yield para.style.name, txt
 
 def _extract_notranja_info(paragraphs):
     info = {"title": None, "type": None, "student": None,
@@ -464,46 +2256,34 @@ def _extract_notranja_info(paragraphs):
                 j -= 1
                 info["title"] = " ".join(title_lines)
         
-        if c.startswith("Študent"):
-            info["student"] = c.split(":",1)[1].strip()
-        elif c.startswith("Študijski program"):
-            prog = c.split(":",1)[1].strip()
-            info["program"] = prog
-            nxt = paragraphs[idx+1]["content"].strip() if idx+1<len(paragraphs) else ""
-            if nxt and ":" not in nxt:
-                info["program"] += " — " + nxt
-        elif c.startswith("Smer"):
-            info["smer"] = c.split(":",1)[1].strip()
-        elif c.startswith("Mentor"):
-            info["mentor"] = c.split(":",1)[1].strip()
-        elif c.startswith("Somentor"):
-            info["somentor"] = c.split(":",1)[1].strip()
-        elif c.startswith("Lektor"):
-            info["lektor"] = c.split(":",1)[1].strip()
+        for prefix, key in NOTRANJA_FIELDS:
+            if c.startswith(prefix):
+                info[key] = c.split(":",1)[1].strip()
+                if key == "program":
+                    nxt = paragraphs[idx+1]["content"].strip() if idx+1<len(paragraphs) else ""
+                    if nxt and ":" not in nxt:
+                        info["program"] += " — " + nxt
+                break
     return info
 
 def _style_special_sections(paragraphs):
     styled = []
     for p in paragraphs:
-        t = p["content"].strip()
-        low = t.lower()
-        if low == "zahvala":
-            p["style"] = "Heading 1"
-        elif re.match(r"ključne besede[:]? ", t, re.IGNORECASE):
-            p["style"] = "Heading 2"
-        elif re.match(r"udk[:]? ", t, re.IGNORECASE):
-            p["style"] = "Heading 2"
-        elif low == "povzetek":
-            p["style"] = "Heading 2"
-        elif re.match(r"keywords[:]? ", t, re.IGNORECASE):
-            p["style"] = "Heading 2"
-        elif re.match(r"udc[:]? ", t, re.IGNORECASE):
-            p["style"] = "Heading 2"
-        elif low == "abstract":
-            p["style"] = "Heading 2"
+        style = _special_section_style(p["content"].strip())
+        if style:
+            p["style"] = style
         styled.append(p)
     return styled
 
+def _special_section_style(t):
+    """Heading style forced on front-matter labels, or None."""
+    low = t.lower()
+    if low == "zahvala":
+        return "Heading 1"
+    if low in ("povzetek", "abstract") or SPECIAL_HEADING_RE.match(t):
+        return "Heading 2"
+    return None
+
 def _check_front_matter(paragraphs):
     result = {}
     for sec, pats in MANDATORY_FRONT_MATTER.items():
@@ -529,8 +2309,75 @@ def _check_body_sections(paragraphs):
         res[name] = any(re.search(pat, par["content"], re.IGNORECASE) for par in paragraphs)
     return res
 
+class _RuleScan:
+    """Incremental rule classification used by `_check_sections`.
+
+    Paragraphs that contain none of the literals required by a still
+    missing rule are skipped; the rest are classified once with
+    `RULE_MATCHER`.
+    """
+
+    def __init__(self):
+        self.hits = set()
+        self.pending = RULE_PREFILTER
+        self.literals = _prefilter_literals(self.pending)
+
+    def feed(self, text, folded=None):
+        if not self.pending:
+            return
+        if self.literals is not None:
+            if folded is None:
+                folded = _fold(text)
+            for lit in self.literals:
+                if lit in folded:
+                    break
+            else:
+                return
+        m = RULE_MATCHER.match(text)
+        for idx, val in zip(RULE_GROUPS, m.group(*RULE_GROUPS)):
+            if val is not None:
+                self.hits.add(RULE_GROUPS[idx])
+        self.pending = [(rule, lits) for rule, lits in self.pending if rule not in self.hits]
+        self.literals = _prefilter_literals(self.pending)
+
+    def results(self, naslovna, notranja, uvod):
+        """Build the front-matter and body dicts from the collected hits."""
+        front = {}
+        for sec in MANDATORY_FRONT_MATTER:
+            if sec == "Naslovna stran na platnici":
+                front[sec] = naslovna
+            elif sec == "Notranja naslovna stran v zaključnem delu":
+                front[sec] = notranja
+            else:
+                front[sec] = ("front", sec) in self.hits
+        body = {"Uvod (s podsekcijami)": bool(uvod) and all(
+            any(re.search(pat, line, re.IGNORECASE) for line in uvod)
+            for pat in SUBSECTION_PATTERNS
+        )}
+        for name in SECTION_PATTERNS:
+            body[name] = ("body", name) in self.hits
+        return front, body
+
+def _check_sections(paragraphs, uvod=None):
+    """Single-pass equivalent of `_check_front_matter` and `_check_body_sections`.
+
+    Returns the same `(front_matter_found, body_sections_found)` dicts.
+    Pass an already extracted `uvod` to avoid scanning for it again.
+    """
+    scan = _RuleScan()
+    for par in paragraphs:
+        if not scan.pending:
+            break
+        scan.feed(par["content"])
+    if uvod is None:
+        uvod = _extract_uvod(paragraphs)
+    return scan.results(_validate_naslovna_stran(paragraphs),
+                        _validate_notranja_stran(paragraphs), uvod)
+
 def _validate_naslovna_stran(paragraphs):
-    block = [par["content"].strip() for par in paragraphs][:6]
+    return _validate_naslovna_lines([par["content"].strip() for par in paragraphs][:6])
+
+def _validate_naslovna_lines(block):
     checks = [
         any(NAME_PATTERN.match(l) for l in block),
         any(TYPE_PATTERN.search(l) for l in block),
@@ -542,116 +2389,146 @@ def _validate_naslovna_stran(paragraphs):
     return all(checks)
 
 def _validate_notranja_stran(paragraphs):
-    flags = [
-        any(TYPE_PATTERN.search(p["content"]) for p in paragraphs),
-        any("Študent(ka):" in p["content"] for p in paragraphs),
-        any("Študijski program:" in p["content"] for p in paragraphs),
-        any("Smer:" in p["content"] for p in paragraphs),
-        any("Mentor(ica):" in p["content"] for p in paragraphs),
-        any("Lektor(ica):" in p["content"] for p in paragraphs),
-    ]
+    flags = [any(TYPE_PATTERN.search(p["content"]) for p in paragraphs)]
+    flags += [any(label in p["content"] for p in paragraphs) for label in NOTRANJA_LABELS]
     return all(flags)
 
 def _extract_toc(paragraphs):
     toc = []
     in_toc = False
-    entry_re = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)*)\.?\s+(?P<title>.*?)\s*\.{2,}\s*(?P<page>\d+)\s*$")
-    end_re   = re.compile(r"^(kazalo slik|kazalo tabel|seznam virov|priloge)", re.IGNORECASE)
     for par in paragraphs:
         txt = par["content"]
         if not in_toc:
-            if re.search(r"kazalo vsebine", txt, re.IGNORECASE):
+            if TOC_START_RE.search(txt):
                 in_toc = True
             continue
-        if end_re.match(txt):
+        if TOC_END_RE.match(txt):
             break
-        m = entry_re.match(txt)
-        if m:
-            n = m.group("num")
-            toc.append({"number": n, "title": m.group("title").strip(), "level": n.count(".")+1})
+        entry = _toc_entry(txt)
+        if entry:
+            n, title = entry
+            toc.append({"number": n, "title": title, "level": n.count(".")+1})
     return toc
 
+def _toc_entry(text):
+    r"""`(number, title)` of a TOC entry line "1.2 Naslov ...... 14", or None.
+
+    Gives the same result as matching
+    `^\s*(\d+(?:\.\d+)*)\.?\s+(.*?)\s*\.{2,}\s*\d+\s*$` and stripping the
+    title, in linear time: the title ends where the dot leader, with the
+    spaces before it, begins.
+    """
+    head = TOC_NUMBER_RE.match(text)
+    if not head or not head.group("space"):
+        return None
+    tail = TOC_LEADER_REVERSED_RE.match(text[::-1])
+    if not tail:
+        return None
+    title = text[head.end():len(text) - tail.end()]
+    if "\n" in title:
+        return None
+    return head.group("num"), title
+
+def _is_toc_line(text):
+    r"""Whether `text` matches `^\s*\d+(\.\d+)*\.?\s+.+?\.{2,}\s*\d+\s*$`, in linear time.
+
+    Here the title must not be empty, but it may take one of the spaces
+    after the number or all but two dots of the leader.
+    """
+    head = TOC_NUMBER_RE.match(text)
+    if not head or not head.group("space"):
+        return False
+    tail = TOC_LEADER_REVERSED_RE.match(text[::-1])
+    if not tail:
+        return False
+    # The shortest title that can work ends two dots before the page number
+    end = len(text) - tail.start("dots") - 2
+    start = min(head.end(), end - 1)
+    return start > head.start("space") and "\n" not in text[start:end]
+
 
 def _apply_toc_styles(paragraphs, toc):
     styled = []
 
-    # Regexes
-    caption_re = re.compile(r"^(Slika|Tabela)\s*\d+:", re.IGNORECASE)
-    toc_entry_re = re.compile(r"""
-        ^\s*
-        (?P<num>\d+(?:\.\d+)*)
-        \.?\s+
-        (?P<title>.*?)
-        \s*\.{2,}\s*\d+\s*$
-    """, re.VERBOSE)
-    simple_num_re = re.compile(r"""
-        ^\s*
-        (?P<num>\d+(?:\.\d+)*)
-        \.?
-        (?=[^.\s])
-        (?P<title>.+)$
-    """, re.VERBOSE)
-    # now match any numbered prefix with at least one dot (1.1, 5.5.4, etc.)
-    subsec_re = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)+)\.?\s*(?P<title>.+)$")
-
     # build lookup from TOC
     level_map = {(e["number"], e["title"]): e["level"] for e in toc}
 
     for p in paragraphs:
-        txt = p["content"]
+        style, key, listed_only = _toc_heading_style(p["content"])
+        if key in level_map:
+            style = f"Heading {level_map[key]}"
+        elif listed_only:
+            style = None
+        if style:
+            p["style"] = style
+        styled.append(p)
 
-        # 1) Caption entries
-        if caption_re.match(txt):
-            p["style"] = "Caption"
-            styled.append(p)
-            continue
+    return styled
 
-        # 2) Explicit numeric subsections (e.g. "1.1", "5.5.4")
-        m_sub = subsec_re.match(txt)
-        if m_sub:
-            num = m_sub.group("num")
-            level = num.count('.') + 1
-            p["style"] = f"Heading {level}"
-            styled.append(p)
-            continue
+def _numbered_heading(pattern, text):
+    """`(num, title)` where SIMPLE_NUM_RE or SUBSEC_RE matches `text`, else None, in linear time.
 
-        # 3) ToC‐style entries with dot‐leaders
-        m_toc = toc_entry_re.match(txt)
-        if m_toc:
-            num   = m_toc.group("num")
-            title = m_toc.group("title").strip()
-            lvl   = level_map.get((num, title), num.count('.') + 1)
-            p["style"] = f"Heading {lvl}"
-            styled.append(p)
-            continue
+    Their title cannot span a line break, so it sits on the last line
+    (bar one trailing line break). Run on text with a line break past the
+    leading whitespace, the regexes would rescan up to it for every
+    shorter number; the lines before the last are checked first instead.
+    """
+    body = text[:-1] if text.endswith("\n") else text
+    last = body.rfind("\n") + 1
+    if not body[:last] or body[:last].isspace():
+        m = pattern.match(text)
+        return (m.group("num"), m.group("title")) if m else None
+    if pattern is not SUBSEC_RE:
+        return None
+    # Only SUBSEC_RE has whitespace, line breaks included, after the number
+    head = SUBSEC_HEAD_RE.fullmatch(body, 0, last)
+    tail = SUBSEC_TITLE_RE.match(body, last)
+    if not head or not tail:
+        return None
+    return head.group("num"), tail.group("title")
 
-        # 4) Simple numbered headings fallback
-        m_simple = simple_num_re.match(txt)
-        if m_simple:
-            num   = m_simple.group("num")
-            title = m_simple.group("title").strip()
-            if (num, title) in level_map:
-                lvl = level_map[(num, title)]
-                p["style"] = f"Heading {lvl}"
-            elif title.isupper():
-                p["style"] = f"Heading {num.count('.') + 1}"
-            elif num.count('.') >= 2:
-                p["style"] = f"Heading {num.count('.') + 1}"
+def _toc_heading_style(txt):
+    """Classify a paragraph by its numbering for `_apply_toc_styles`.
 
-        styled.append(p)
+    Returns `(style, key, listed_only)`: the style to apply (or None), the
+    `(number, title)` key whose TOC level overrides it, and whether the
+    style only applies when that key is listed in the TOC.
+    """
+    # 1) Caption entries
+    if CAPTION_RE.match(txt):
+        return "Caption", None, False
 
-    return styled
+    # 2) Explicit numeric subsections (e.g. "1.1", "5.5.4")
+    m_sub = _numbered_heading(SUBSEC_RE, txt)
+    if m_sub:
+        return f"Heading {m_sub[0].count('.') + 1}", None, False
+
+    # 3) ToC‐style entries with dot‐leaders
+    entry = _toc_entry(txt)
+    if entry:
+        num, title = entry
+        return f"Heading {num.count('.') + 1}", (num, title), False
+
+    # 4) Simple numbered headings fallback
+    m_simple = _numbered_heading(SIMPLE_NUM_RE, txt)
+    if m_simple:
+        num   = m_simple[0]
+        title = m_simple[1].strip()
+        listed_only = not (title.isupper() or num.count('.') >= 2)
+        return f"Heading {num.count('.') + 1}", (num, title), listed_only
+
+    return None, None, False
 
 def _extract_uvod(paragraphs):
     uvod = []
     in_sec = False
     for p in paragraphs:
         c = p['content']
-        if re.match(r"^\d+\.\s+UVOD", c, re.IGNORECASE) or c.strip().upper() == "UVOD":
+        if UVOD_HEADING_RE.match(c) or c.strip().upper() == "UVOD":
             in_sec = True
             continue
-        if in_sec and re.match(r"^\d+\.\s+", c):
+        if in_sec and SECTION_NUMBER_RE.match(c):
             break
         if in_sec:
             uvod.append(c)
-    return uvod
\ No newline at end of file
+    return uvod
@@ -0,0 +1,237 @@
+"""In-process metrics served in the Prometheus text format.
+
+Counters, gauges and histograms live in a `Registry` and are rendered on
+demand by `Registry.render()`. A labelled metric keeps one child per label
+combination; look the child up once (`metric.labels("docx")`) and the hot
+path is a lock and an addition. Histogram bucket counts are stored per
+bucket and only summed into cumulative `le` buckets when rendered.
+
+Analysis runs in pool processes that cannot reach the server's registry.
+Code there times its steps with `stage(name)`; `collect_stages(fn, *args)`
+runs `fn` in the worker and returns the timings along with its result, for
+the server to record. Outside `collect_stages`, `stage` does nothing.
+
+Every server process has its own registry: with several processes, scrape
+each of them.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a quick paragraph check to a long PDF conversion
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Bytes, 16 KiB to 128 MiB in powers of four
+SIZE_BUCKETS = tuple(16 * 1024 * 4 ** i for i in range(8))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self._default = self.labels()
+
+    def labels(self, *values: str):
+        """The child for these label values, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names) or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"{self.name} takes string labels {self.label_names}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _samples(self):
+        """`(suffix, label text, value)` for every sample, children in creation order."""
+        for values, child in list(self._children.items()):
+            yield from self._child_samples(values, child)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {_number(value)}" for suffix, labels, value in self._samples()]
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. errors; named `..._total` by convention."""
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def _child_samples(self, values, child):
+        yield "", _label_text(self.label_names, values), child.value
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def _child_samples(self, values, child):
+        yield "", _label_text(self.label_names, values), child.value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed upper bounds."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help, labels)
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _child_samples(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield "_bucket", _label_text(self.label_names, values, f'le="{_number(bound)}"'), cumulative
+        labels = _label_text(self.label_names, values)
+        yield "_sum", labels, total
+        yield "_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a processing step for the enclosing `collect_stages` call, if any."""
+    timings = getattr(_local, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, time.perf_counter() - start))
+
+
+def collect_stages(fn, *args):
+    """Call `fn(*args)` and return its result with the `(stage, seconds)` timed inside it."""
+    outer = getattr(_local, "timings", None)
+    _local.timings = timings = []
+    try:
+        return fn(*args), timings
+    finally:
+        _local.timings = outer
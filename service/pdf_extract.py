@@ -0,0 +1,96 @@
+"""Direct PDF paragraph extraction with PyMuPDF.
+
+Builds the same `(style, text)` pairs as `main._iter_styled_text`
+without converting the PDF to DOCX first. Heading styles are inferred from
+font statistics: the size covering most characters is body text, larger
+sizes used on several pages become Heading 1..3 by rank, and short bold
+lines at body size become the next heading level.
+"""
+from collections import Counter
+
+import fitz
+
+MAX_HEADING_LEVEL = 3
+# Longer paragraphs are never treated as headings, whatever their font
+MAX_HEADING_CHARS = 200
+MAX_BOLD_HEADING_CHARS = 100
+# Sizes closer than this (in points) are considered equal
+SIZE_TOLERANCE = 0.5
+
+
+def extract_styled_text(pdf_path, pages=None):
+    """Return `(style, text)` pairs for the paragraphs of a PDF file.
+
+    `pages` optionally limits extraction to a range of page numbers.
+    """
+    with fitz.open(pdf_path) as doc:
+        paras = _group_paragraphs(_iter_lines(doc, pages))
+    return [(style, text) for text, style in _infer_styles(paras)]
+
+
+def _iter_lines(doc, pages=None):
+    """Yield `(block_key, text, size, bold)` for every non-empty text line."""
+    for pno in pages if pages is not None else range(doc.page_count):
+        page = doc[pno]
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if not text:
+                    continue
+                # The font covering most characters decides the line's look
+                weights = Counter()
+                for span in line["spans"]:
+                    size = round(span["size"] * 2) / 2
+                    bold = bool(span["flags"] & fitz.TEXT_FONT_BOLD) or "Bold" in span["font"]
+                    weights[size, bold] += len(span["text"].strip())
+                (size, bold), _ = weights.most_common(1)[0]
+                yield (pno, block["number"]), text, size, bold
+
+
+def _group_paragraphs(lines):
+    """Merge consecutive lines of one block that share size and weight."""
+    paras = []
+    prev_key = None
+    for key, text, size, bold in lines:
+        if paras and key == prev_key and paras[-1][1:3] == [size, bold]:
+            paras[-1][0] += " " + text
+        else:
+            paras.append([text, size, bold, key[0]])
+        prev_key = key
+    return paras
+
+
+def _infer_styles(paras):
+    """Yield `(text, style)` pairs with heading levels from font statistics."""
+    if not paras:
+        return
+    chars = Counter()
+    for text, size, _, _ in paras:
+        chars[size] += len(text)
+    body = chars.most_common(1)[0][0]
+
+    pages = {}
+    for text, size, _, pno in paras:
+        if size > body + SIZE_TOLERANCE and len(text) <= MAX_HEADING_CHARS:
+            pages.setdefault(size, set()).add(pno)
+    # Sizes confined to one page (cover titles) borrow the level of the next ranked size
+    ranked = sorted((s for s, p in pages.items() if len(p) > 1), reverse=True)
+    if not ranked:
+        ranked = sorted(pages, reverse=True)
+
+    def level(size):
+        for i, ranked_size in enumerate(ranked):
+            if size >= ranked_size - SIZE_TOLERANCE:
+                return min(i + 1, MAX_HEADING_LEVEL)
+        return min(len(ranked) + 1, MAX_HEADING_LEVEL)
+
+    for text, size, bold, _ in paras:
+        if size in pages and len(text) <= MAX_HEADING_CHARS:
+            style = f"Heading {level(size)}"
+        elif bold and abs(size - body) <= SIZE_TOLERANCE and len(text) <= MAX_BOLD_HEADING_CHARS:
+            style = f"Heading {min(len(ranked) + 1, MAX_HEADING_LEVEL)}"
+        else:
+            style = "Normal"
+        yield text, style
@@ -0,0 +1,255 @@
+"""Write-behind persistence of analysis results to Supabase.
+
+Uploads enqueue a save job and return at once with a pre-generated
+document id. A job may carry a `prepare` coroutine that builds its rows,
+so that work happens in the worker too, not while the upload waits.
+Background workers write the document row and its paragraph
+rows through one async Supabase client, whose HTTP connections are pooled
+and kept alive, retrying failed jobs with exponential backoff. The state
+of every recent job can be polled by document id.
+
+Paragraphs are upserted in batches sized by JSON payload bytes, several
+batches in flight at once, each retried on its own. Alternatively the
+whole set goes through one call to a database function (see
+`sql/document_paragraphs_bulk.sql`). Similarity index rows
+(`document_minhash_bands`) follow in batches the same way.
+
+Jobs live in memory only: saves still queued when the process dies are lost.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from postgrest.types import ReturnMethod
+
+logger = logging.getLogger(__name__)
+
+PENDING, SAVING, SAVED, FAILED = "pending", "saving", "saved", "failed"
+
+# Unique keys that make re-sent rows overwrite instead of duplicate
+PARAGRAPH_KEY = "document_id,paragraph_order"
+BAND_KEY = "document_id,paragraph_order,band"
+
+
+def batch_rows(rows, max_bytes, max_rows):
+    """Split rows into consecutive batches of bounded JSON size and length."""
+    batch, size = [], 0
+    for row in rows:
+        row_bytes = len(json.dumps(row, ensure_ascii=False).encode())
+        if batch and (size + row_bytes > max_bytes or len(batch) >= max_rows):
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += row_bytes
+    if batch:
+        yield batch
+
+
+class SaveJob:
+    __slots__ = ("document_id", "document", "paragraphs", "bands", "prepare", "status", "attempts", "error",
+                 "finished")
+
+    def __init__(self, document_id, document, paragraphs, bands=(), prepare=None):
+        self.document_id = document_id
+        self.document = document
+        self.paragraphs = paragraphs
+        self.bands = bands
+        self.prepare = prepare
+        self.status = PENDING
+        self.attempts = 0
+        self.error = None
+        self.finished = asyncio.Event()
+
+    def as_dict(self):
+        return {
+            "document_id": self.document_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+
+class WriteBehindQueue:
+    """Queue of document saves drained by background workers.
+
+    `connect` is an async callable returning a Supabase async client; with
+    None the queue is disabled and `enqueue` returns None. When `rpc` names
+    a database function, paragraphs are sent to it in a single call instead
+    of in batches. `on_saved(document_id)` runs after each successful save
+    and `on_request(operation, seconds, error)` after every database request,
+    `operation` being the table or function name.
+    """
+
+    def __init__(self, connect, workers=2, max_attempts=5, retry_delay=1.0,
+                 batch_bytes=256 * 1024, batch_rows=1000, concurrency=4,
+                 batch_attempts=3, rpc=None, on_saved=None, on_request=None,
+                 max_queued=1000, status_limit=10000):
+        self.connect = connect
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.batch_bytes = batch_bytes
+        self.batch_rows = batch_rows
+        self.concurrency = concurrency
+        self.batch_attempts = batch_attempts
+        self.rpc = rpc
+        self.on_saved = on_saved
+        self.on_request = on_request
+        self.max_queued = max_queued
+        self.status_limit = status_limit
+        self.client = None
+        self._queue = None
+        self._tasks = []
+        self._jobs = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.connect is not None
+
+    async def start(self):
+        if not self.enabled or self._tasks:
+            return
+        self.client = await self.connect()
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10.0):
+        """Give queued saves `timeout` seconds to finish, then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} unsaved documents on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, document_id, document=None, paragraphs=(), bands=(), prepare=None):
+        """Queue a save and return its status record, or None when disabled.
+
+        With `prepare`, an async callable returning `(document, paragraphs,
+        bands)`, the worker builds the rows itself before the first attempt;
+        if it raises, the job fails without touching the database. Waits
+        while the queue is full, so a slow database slows uploads instead
+        of growing memory without bound.
+        """
+        if not self._tasks:
+            return None
+        job = SaveJob(document_id, document, paragraphs, bands, prepare)
+        self._jobs[document_id] = job
+        while len(self._jobs) > self.status_limit:
+            self._jobs.popitem(last=False)
+        await self._queue.put(job)
+        return job.as_dict()
+
+    def status(self, document_id):
+        job = self._jobs.get(document_id)
+        return job.as_dict() if job else None
+
+    async def wait(self, document_id):
+        """Wait until a queued save is saved or has failed, and return its status record."""
+        job = self._jobs.get(document_id)
+        if job is None:
+            return None
+        await job.finished.wait()
+        return job.as_dict()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        if job.prepare:
+            try:
+                job.document, job.paragraphs, job.bands = await job.prepare()
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e)
+                job.finished.set()
+                logger.error(f"Preparing document {job.document_id} for saving failed: {e}")
+                return
+            finally:
+                job.prepare = None
+        while True:
+            job.status = SAVING
+            job.attempts += 1
+            try:
+                await self._save(job)
+            except Exception as e:
+                job.error = str(e)
+                if job.attempts >= self.max_attempts:
+                    job.status = FAILED
+                    job.finished.set()
+                    logger.error(f"Giving up saving document {job.document_id}: {e}")
+                    return
+                job.status = PENDING
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                logger.warning(f"Saving document {job.document_id} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+            else:
+                job.status = SAVED
+                job.error = None
+                # The rows are in the database now, drop them from memory
+                job.document = job.paragraphs = job.bands = None
+                job.finished.set()
+                logger.info(f"Document saved with ID: {job.document_id}")
+                if self.on_saved:
+                    self.on_saved(job.document_id)
+                return
+
+    async def _save(self, job):
+        # Upserts keep a retried job from duplicating rows it already wrote
+        client = self.client
+        await self._execute("documents", lambda: client.table("documents").upsert(
+            job.document, returning=ReturnMethod.minimal))
+        if self.rpc:
+            await self._execute(self.rpc, lambda: client.rpc(
+                self.rpc, {"p_document_id": job.document_id, "p_paragraphs": job.paragraphs}))
+        else:
+            await self._upsert_batches("document_paragraphs", job.paragraphs, PARAGRAPH_KEY)
+        # Last, so a document is only found by similarity once its paragraphs can be read
+        await self._upsert_batches("document_minhash_bands", job.bands, BAND_KEY)
+
+    async def _upsert_batches(self, table, rows, key):
+        client = self.client
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def insert(batch):
+            async with slots:
+                await self._execute(table, lambda: client.table(table).upsert(
+                    batch, on_conflict=key, returning=ReturnMethod.minimal))
+
+        results = await asyncio.gather(
+            *(insert(batch) for batch in batch_rows(rows, self.batch_bytes, self.batch_rows)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _execute(self, operation, query):
+        """Run `query().execute()`, retrying transient failures of this one request."""
+        for attempt in range(1, self.batch_attempts + 1):
+            start = time.perf_counter()
+            try:
+                result = await query().execute()
+            except Exception as e:
+                self._observe(operation, start, e)
+                if attempt == self.batch_attempts:
+                    raise
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            else:
+                self._observe(operation, start, None)
+                return result
+
+    def _observe(self, operation, start, error):
+        if self.on_request:
+            self.on_request(operation, time.perf_counter() - start, error)
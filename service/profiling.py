@@ -0,0 +1,214 @@
+"""Opt-in profiling of single requests.
+
+`profile_call(fn, args)` runs a pool worker function under a sampling
+profiler and `tracemalloc`, in the process and thread that does the work,
+and returns a JSON-ready report with its result. Sampling the call stack
+every few milliseconds costs next to nothing; tracing allocations slows
+the call down several times, so compare timings between profiled runs
+only. The report lists the functions and lines seen most often, the
+stacks in collapsed form for flame graph tools, the peak traced memory and
+the allocation sites still holding the most memory when the call returns.
+
+`tracemalloc` traces the whole process: when other work runs in the same
+process at the same time (threaded mode), its allocations are counted too.
+
+`ProfileStore` keeps reports as JSON files under their profile id.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+
+def _short_path(filename):
+    """Last two path components, enough to tell modules apart."""
+    parts = filename.replace("\\", "/").rsplit("/", 2)
+    return "/".join(parts[-2:])
+
+
+class SamplingProfiler:
+    """Samples the call stack of the calling thread at a fixed interval.
+
+    Only frames below `root` (the caller's frame, by default) are kept. On
+    the main thread, which is where process pool workers run, a SIGPROF
+    timer interrupts the code every `interval` seconds of CPU time. Other
+    threads are sampled every `interval` seconds of wall time by a
+    background thread. That thread can only look when it gets the GIL, so
+    calls that release it (I/O, `os.urandom`) show up more than their
+    share.
+    """
+
+    def __init__(self, interval=0.005, root=None):
+        self.interval = interval
+        self.root = root if root is not None else sys._getframe(1)
+        self.thread_id = threading.get_ident()
+        self.clock = "cpu" if (hasattr(signal, "setitimer")
+                               and threading.current_thread() is threading.main_thread()) else "wall"
+        self.stacks = Counter()
+        self.lines = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._previous_handler = None
+
+    def __enter__(self):
+        if self.clock == "cpu":
+            self._previous_handler = signal.signal(signal.SIGPROF, lambda signum, frame: self._sample(frame))
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.clock == "cpu":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler)
+        else:
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample(sys._current_frames().get(self.thread_id))
+
+    def _sample(self, frame):
+        stack = []
+        leaf = None
+        while frame is not None and frame is not self.root:
+            code = frame.f_code
+            if leaf is None:
+                leaf = (code.co_filename, frame.f_lineno, code.co_name)
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        if frame is None or not stack:
+            # Outside the profiled call, e.g. before it started
+            return
+        self.stacks[tuple(reversed(stack))] += 1
+        self.lines[leaf] += 1
+        self.samples += 1
+
+    def report(self, top=25):
+        """Most sampled functions (alone and with callees), lines and the collapsed stacks."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+
+        def entries(counter, label):
+            return [{"function": label(key), "samples": count,
+                     "percent": round(100 * count / self.samples, 1)}
+                    for key, count in counter.most_common(top)] if self.samples else []
+
+        def function_label(key):
+            filename, line, name = key
+            return f"{name} ({_short_path(filename)}:{line})"
+
+        return {
+            "clock": self.clock,
+            "interval": self.interval,
+            "samples": self.samples,
+            "top_self": entries(own, function_label),
+            "top_total": entries(total, function_label),
+            "hot_lines": entries(self.lines, function_label),
+            "collapsed": "\n".join(
+                ";".join(f"{name} ({_short_path(filename)})" for filename, _, name in stack) + f" {count}"
+                for stack, count in self.stacks.most_common()),
+        }
+
+
+def _allocation_report(snapshot, peak, top):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return {
+        "peak_bytes": peak,
+        "top_allocations": [
+            {"location": f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+             "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:top]
+        ],
+    }
+
+
+def profile_call(fn, args=(), interval=0.005, top=25):
+    """Run `fn(*args)` profiled and return `(result, report)`.
+
+    When `fn` raises, the report is attached to the exception as `profile`
+    (it survives pickling back from a pool process).
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    error = None
+    try:
+        with SamplingProfiler(interval, root=sys._getframe()) as profiler:
+            result = fn(*args)
+    except Exception as e:
+        error = e
+    seconds = time.perf_counter() - start
+    try:
+        peak = tracemalloc.get_traced_memory()[1] - base
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    report = {"seconds": round(seconds, 6), **profiler.report(top),
+              "memory": _allocation_report(snapshot, peak, top)}
+    if error is not None:
+        report["error"] = repr(error)
+        error.profile = report
+        raise error
+    return result, report
+
+
+class ProfileStore:
+    """Profile reports as JSON files in `directory`, keeping the newest `max_profiles`."""
+
+    def __init__(self, directory, max_profiles=100):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id):
+        # Ids are uuids; anything else could name a path outside the directory
+        return os.path.join(self.directory, f"{uuid.UUID(profile_id)}.json")
+
+    def save(self, profile_id, report):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(profile_id)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._prune()
+
+    def get(self, profile_id):
+        """The stored report, or None."""
+        try:
+            with open(self._path(profile_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        if len(entries) <= self.max_profiles:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_profiles]:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
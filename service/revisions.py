@@ -0,0 +1,87 @@
+"""Delta storage for revised uploads.
+
+An upload may name an earlier document as its base. Its paragraphs are
+matched to the base's by a hash of style and content, and only the ones
+the base does not have get paragraph rows of their own; the rest refer to
+rows that are already stored.
+
+`paragraph_sources` describes where a document's paragraphs are stored as
+runs `[order, length, source, source_order]`: paragraphs `order` to
+`order + length - 1` are the rows `source_order` onwards of document
+`source`, where a null source is the document itself. A document stored in
+full has no sources. References always name the document holding the
+rows, never a base that refers on to another one, so reading a paragraph
+takes one lookup however long the chain of revisions gets.
+"""
+import hashlib
+from bisect import bisect_right
+
+
+def paragraph_hash(style, content):
+    """Short stable hash of a paragraph's style and text."""
+    data = f"{style}\x00{content}".encode()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def paragraph_hashes(paragraphs):
+    return [paragraph_hash(p.get("style"), p.get("content", "")) for p in paragraphs]
+
+
+def _locate(sources, order):
+    """`(source, source_order)` of paragraph `order` given a document's sources."""
+    i = bisect_right(sources, [order, float("inf")]) - 1
+    if i < 0 or order >= sources[i][0] + sources[i][1]:
+        raise ValueError(f"Paragraph {order} is not covered by the sources")
+    start, _, source, source_order = sources[i]
+    return source, source_order + order - start
+
+
+def plan_delta(hashes, base_id, base_hashes, base_sources=None):
+    """Match paragraphs to the base and return `(sources, stored)`.
+
+    `stored` lists the positions that need rows of their own. A paragraph
+    found more than once in the base is matched to the occurrence right
+    after the previous match where possible, so unchanged stretches stay
+    in one run.
+    """
+    positions = {}
+    for position, h in enumerate(base_hashes):
+        positions.setdefault(h, position)
+
+    sources, stored, previous = [], [], None
+    for order, h in enumerate(hashes):
+        if previous is not None and previous + 1 < len(base_hashes) and base_hashes[previous + 1] == h:
+            previous += 1
+        else:
+            previous = positions.get(h)
+        if previous is None:
+            source, source_order = None, order
+            stored.append(order)
+        elif base_sources:
+            source, source_order = _locate(base_sources, previous)
+            # The base's own rows
+            source = base_id if source is None else source
+        else:
+            source, source_order = base_id, previous
+
+        run = sources[-1] if sources else None
+        if run and run[2] == source and run[3] + run[1] == source_order:
+            run[1] += 1
+        else:
+            sources.append([order, 1, source, source_order])
+    return sources, stored
+
+
+def locate_range(sources, start, stop):
+    """Where paragraphs `start` to `stop - 1` are stored, as `{source: {source_order: [order]}}`.
+
+    Orders past the end of the document are left out.
+    """
+    located = {}
+    i = max(bisect_right(sources, [start, float("inf")]) - 1, 0)
+    for run_start, length, source, source_order in sources[i:]:
+        if run_start >= stop:
+            break
+        for order in range(max(start, run_start), min(stop, run_start + length)):
+            located.setdefault(source, {}).setdefault(source_order + order - run_start, []).append(order)
+    return located
@@ -0,0 +1,114 @@
+"""Slovenian full-text search over stored paragraphs.
+
+Postgres ships no Slovenian stemmer, so the service normalizes text
+itself. `index_terms(text)` lowercases a paragraph, drops diacritics
+(č, š, ž, ć, đ become c, s, z, c, d) and trims common inflectional
+endings, giving the space-separated terms saved in
+`document_paragraphs.search_terms`. The database indexes them as a
+"simple" tsvector (sql/paragraph_search.sql) and ranks matches.
+
+Queries get the same treatment. Every query term must occur, as a prefix
+of an indexed term: stemming is deliberately light, and prefix matching
+covers most forms it leaves apart ("sistem" is "sist", "sistema"
+"sistem"). Snippets are cut out of the original text around the words
+that matched.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+# Case and number endings of nouns and adjectives, tried longest first; a
+# stem keeps at least MIN_STEM characters
+SUFFIXES = sorted({
+    "ijami", "ovega", "ovemu", "ovimi",
+    "ama", "ami", "ega", "emu", "ija", "ije", "iji", "ijo", "ima", "imi", "ovi", "ova", "ove",
+    "ah", "am", "em", "ih", "im", "om", "ov", "ev",
+    "a", "e", "i", "o", "u",
+}, key=len, reverse=True)
+MIN_STEM = 3
+
+# Letters NFKD does not take apart
+_FOLD = str.maketrans({"đ": "d", "ł": "l", "ø": "o", "ß": "ss", "æ": "ae", "œ": "oe"})
+
+
+def fold(text):
+    """Lowercase `text` and strip its diacritics."""
+    decomposed = unicodedata.normalize("NFKD", text.lower().translate(_FOLD))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def stem(word):
+    """Trim the longest known ending of a folded word."""
+    if word.isdigit():
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def term(word):
+    """Search term of a word as written; words repeat a lot, so it is cached."""
+    return stem(fold(word))
+
+
+def _terms(text):
+    # Composed, the letters folding changes are word characters before and after
+    return [term(word) for word in WORD_RE.findall(unicodedata.normalize("NFC", text).lower())]
+
+
+def index_terms(text):
+    """Terms of `text` to index, in order, as one space-separated string."""
+    return " ".join(_terms(text))
+
+
+def query_terms(query):
+    """Distinct terms of a search query, in order."""
+    return list(dict.fromkeys(_terms(query)))
+
+
+def tsquery(terms):
+    """Postgres `to_tsquery` text requiring every term as a prefix."""
+    return " & ".join(f"'{term}':*" for term in terms)
+
+
+def _matches(word, terms):
+    found = term(word.lower())
+    return any(found.startswith(t) for t in terms)
+
+
+def snippet(text, terms, words=30, lead=3):
+    """About `words` words of `text` around the most matches, and where they are.
+
+    The window starts `lead` words before its first match where it can.
+    Returns `(snippet, highlights)`: highlights are `[start, end]` offsets
+    of the matching words in the snippet. Cut ends are marked with "…".
+    """
+    bounds = [m.span() for m in WORD_RE.finditer(text)]
+    hits = [_matches(text[s:e], terms) for s, e in bounds]
+    first = 0
+    if len(bounds) > words:
+        best = count = sum(hits[:words])
+        for i in range(1, len(bounds) - words + 1):
+            count += hits[i + words - 1] - hits[i - 1]
+            if count > best:
+                best, first = count, i
+        if best:
+            first = hits.index(True, first)
+        first = max(min(first - lead, len(bounds) - words), 0)
+    last = min(first + words, len(bounds)) - 1
+
+    start = bounds[first][0] if first else 0
+    end = bounds[last][1] if last < len(bounds) - 1 else len(text)
+    body = text[start:end]
+    start += len(body) - len(body.lstrip())
+    body = body.strip()
+    prefix = "…" if first else ""
+    suffix = "…" if last < len(bounds) - 1 else ""
+    offset = start - len(prefix)
+    highlights = [[s - offset, e - offset] for (s, e), hit in zip(bounds[first:last + 1], hits[first:last + 1])
+                  if hit]
+    return prefix + body + suffix, highlights
@@ -0,0 +1,34 @@
+"""Fill in the search terms of paragraphs saved before search existed.
+
+Run once after applying sql/paragraph_search.sql; rows saved since carry
+their terms already. Safe to stop and run again.
+
+Usage (from the service directory):
+
+    python search_reindex.py [batch size]
+"""
+import asyncio
+import sys
+
+import main
+import search
+
+COLUMNS = "document_id,paragraph_order,paragraph_id,paragraph_style,content"
+
+
+async def run(batch_size=500):
+    db = await main._connect_supabase()
+    total = 0
+    while True:
+        result = await db.table("document_paragraphs").select(COLUMNS) \
+            .is_("search_terms", "null").limit(batch_size).execute()
+        if not result.data:
+            break
+        rows = [{**row, "search_terms": search.index_terms(row["content"] or "")} for row in result.data]
+        await db.table("document_paragraphs").upsert(rows, on_conflict="document_id,paragraph_order").execute()
+        total += len(rows)
+        print(f"{total} paragraphs indexed", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(*map(int, sys.argv[1:2])))
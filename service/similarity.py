@@ -0,0 +1,153 @@
+"""Near-duplicate detection with MinHash and locality-sensitive hashing.
+
+A text is a set of shingles: runs of `SHINGLE_WORDS` consecutive words,
+lowercased and without diacritics. Its MinHash signature keeps, for each
+of `NUM_PERM` hash functions, the smallest hash of any shingle. Two
+signatures agree in a position with probability equal to the Jaccard
+similarity of the shingle sets, so comparing signatures estimates it.
+
+For lookups, a signature is cut into bands of rows and each band is
+hashed to a key. Texts sharing any band key are candidates: with `b`
+bands of `r` rows, a pair of similarity `s` becomes one with probability
+`1 - (1 - s^r)^b`: with 32 bands of 4 rows, about 0.4 similar pairs
+are candidates half of the time, 0.6 similar ones nearly always. Only
+band keys need an index, so a lookup touches the few stored texts that
+share one instead of every stored text.
+
+Hashes come from CRC32 and fixed multipliers, not Python's `hash()`, so
+every process computes the same signatures.
+"""
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+import search
+
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+# (bands, rows) of the document and paragraph indexes; bands * rows == NUM_PERM
+DOCUMENT_BANDS = (32, 4)
+PARAGRAPH_BANDS = (32, 4)
+# Shorter paragraphs (headings, captions, boilerplate) are not indexed
+MIN_PARAGRAPH_WORDS = 12
+# Shingles hashed in one step; bounds the (NUM_PERM, n) work array
+CHUNK_SHINGLES = 4096
+
+_rng = np.random.default_rng(20240917)
+# Multiply-shift hash functions (a * x + b) >> 32 with odd a
+_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+_SHINGLE_MULTIPLIERS = _rng.integers(1, 2 ** 63, SHINGLE_WORDS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_BAND_MULTIPLIERS = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_MAX = np.uint32(2 ** 32 - 1)
+
+
+@lru_cache(maxsize=65536)
+def _word_hash(word):
+    return zlib.crc32(search.fold(word).encode())
+
+
+def words(text):
+    return search.WORD_RE.findall(text)
+
+
+def shingle_hashes(text):
+    """32-bit hashes of the distinct shingles of `text`."""
+    return _shingles(words(text))
+
+
+def _shingles(text_words):
+    hashes = np.fromiter((_word_hash(w) for w in text_words), dtype=np.uint64, count=len(text_words))
+    n = len(hashes) - SHINGLE_WORDS + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    combined = np.zeros(n, dtype=np.uint64)
+    for i in range(SHINGLE_WORDS):
+        combined += hashes[i:i + n] * _SHINGLE_MULTIPLIERS[i]
+    return np.unique(combined >> np.uint64(32))
+
+
+def signatures(texts):
+    """MinHash signatures of `texts`, a `(len(texts), NUM_PERM)` uint32 array.
+
+    A text without a single shingle gets all ones, which matches nothing
+    in practice.
+    """
+    return _signatures([words(text) for text in texts])
+
+
+def _signatures(word_lists):
+    result = np.full((len(word_lists), NUM_PERM), _MAX, dtype=np.uint32)
+    batch, rows, size = [], [], 0
+
+    def flush():
+        hashes = np.concatenate(batch)
+        starts = np.cumsum([0] + [len(h) for h in batch[:-1]])
+        values = ((_A[:, None] * hashes[None, :] + _B[:, None]) >> np.uint64(32)).astype(np.uint32)
+        result[rows] = np.minimum.reduceat(values, starts, axis=1).T
+
+    for i, text_words in enumerate(word_lists):
+        hashes = _shingles(text_words)
+        if not len(hashes):
+            continue
+        batch.append(hashes)
+        rows.append(i)
+        size += len(hashes)
+        if size >= CHUNK_SHINGLES:
+            flush()
+            batch, rows, size = [], [], 0
+    if batch:
+        flush()
+    return result
+
+
+def band_keys(signatures, bands):
+    """Signed 64-bit keys of every band of each signature, `(n, bands[0])`.
+
+    The band's position is part of its key, so keys of different bands
+    never collide by construction.
+    """
+    count, rows = bands
+    mixed = signatures.astype(np.uint64) * _BAND_MULTIPLIERS
+    keys = mixed.reshape(len(signatures), count, rows).sum(axis=2, dtype=np.uint64)
+    keys += np.arange(count, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return keys.view(np.int64)
+
+
+def estimate(a, b):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return float(np.mean(np.asarray(a) == np.asarray(b)))
+
+
+def jaccard(text_a, text_b):
+    """Exact Jaccard similarity of the shingle sets of two texts."""
+    a, b = shingle_hashes(text_a), shingle_hashes(text_b)
+    if not len(a) or not len(b):
+        return 0.0
+    return len(np.intersect1d(a, b, assume_unique=True)) / len(np.union1d(a, b))
+
+
+def fingerprint(texts, stored=None):
+    """Document signature and band rows for the paragraph `texts` of a document.
+
+    Returns `(signature, bands)`: the signature of all paragraphs together
+    as a list of ints (None for a document without a shingle), and
+    `(paragraph_order, band, band_key)` rows, paragraph_order -1 being
+    the whole document. Paragraphs at positions not in `stored` (when
+    given) are left out of the paragraph index: their rows, and band rows,
+    belong to another document.
+    """
+    word_lists = [words(text) for text in texts]
+    paragraph_signatures = _signatures(word_lists)
+    if (paragraph_signatures == _MAX).all():
+        return None, []
+    document = paragraph_signatures.min(axis=0)
+
+    rows = [(-1, band, int(key)) for band, key in enumerate(band_keys(document[None, :], DOCUMENT_BANDS)[0])]
+    positions = range(len(texts)) if stored is None else stored
+    indexed = [i for i in positions if len(word_lists[i]) >= MIN_PARAGRAPH_WORDS]
+    if indexed:
+        keys = band_keys(paragraph_signatures[indexed], PARAGRAPH_BANDS)
+        rows += [(order, band, int(key)) for order, row in zip(indexed, keys) for band, key in enumerate(row)]
+    return document.tolist(), rows
@@ -0,0 +1,25 @@
+-- Bulk paragraph persistence for the service's write-behind queue.
+
+-- Retried paragraph batches are upserted on this key instead of duplicating rows
+alter table document_paragraphs
+    add constraint document_paragraphs_document_order_key unique (document_id, paragraph_order);
+
+-- Optional: store a document's paragraphs in one call.
+-- Enable with PERSIST_PARAGRAPH_RPC=insert_document_paragraphs
+create or replace function insert_document_paragraphs(p_document_id uuid, p_paragraphs jsonb)
+returns integer
+language sql
+as $$
+    with written as (
+        insert into document_paragraphs (document_id, paragraph_order, paragraph_id, paragraph_style, content)
+        select p_document_id, r.paragraph_order, r.paragraph_id, r.paragraph_style, r.content
+        from jsonb_to_recordset(p_paragraphs)
+            as r(paragraph_order integer, paragraph_id text, paragraph_style text, content text)
+        on conflict (document_id, paragraph_order) do update
+            set paragraph_id = excluded.paragraph_id,
+                paragraph_style = excluded.paragraph_style,
+                content = excluded.content
+        returning 1
+    )
+    select count(*)::integer from written;
+$$;
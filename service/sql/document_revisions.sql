@@ -0,0 +1,19 @@
+-- Revised uploads (base_document_id on /upload-docx and /upload-pdf).
+-- Apply before deploying: every saved document row carries these columns.
+
+-- The document a revision was diffed against. A base cannot be deleted
+-- while revisions still refer to its paragraph rows.
+alter table documents
+    add column base_document_id uuid references documents(id) on delete restrict;
+
+-- Hash of every paragraph's style and content, in order, to diff later revisions against
+alter table documents
+    add column paragraph_hashes jsonb;
+
+-- Runs [order, length, source, source_order] mapping paragraphs to the rows
+-- that hold them (a null source is the document itself); null when the
+-- document stores all of its paragraphs
+alter table documents
+    add column paragraph_sources jsonb;
+
+create index documents_base_document_id_idx on documents (base_document_id);
@@ -0,0 +1,49 @@
+-- Near-duplicate detection (GET /documents/{id}/similar).
+-- Apply before deploying: saves write the minhash column and band rows.
+
+-- MinHash signature of the whole document (similarity.py)
+alter table documents
+    add column minhash jsonb;
+
+-- LSH band keys of each document (paragraph_order -1) and of the
+-- paragraphs it stores rows for
+create table document_minhash_bands (
+    document_id uuid not null references documents(id) on delete cascade,
+    paragraph_order integer not null,
+    band smallint not null,
+    band_key bigint not null,
+    primary key (document_id, paragraph_order, band)
+);
+
+create index document_minhash_bands_key_idx on document_minhash_bands (band_key);
+
+-- Other documents' band rows sharing a key with this document's, per pair
+-- of texts, most shared bands first: whole documents with p_paragraphs
+-- false, paragraphs with true. Keys held by more than p_max_key_rows rows
+-- (boilerplate that many documents share) are skipped, counting no
+-- further than that, so one common key cannot blow up the join.
+create or replace function similar_candidates(p_document_id uuid, p_paragraphs boolean,
+                                              p_limit integer default 200,
+                                              p_max_key_rows integer default 100)
+returns table (paragraph_order integer, document_id uuid, match_order integer, bands integer)
+language sql
+stable
+as $$
+    with keys as (
+        select q.paragraph_order, q.band_key
+        from document_minhash_bands q
+        where q.document_id = p_document_id
+          and (q.paragraph_order >= 0) = p_paragraphs
+          and (select count(*) from (select 1 from document_minhash_bands k
+                                     where k.band_key = q.band_key
+                                     limit p_max_key_rows + 1) held) <= p_max_key_rows
+    )
+    select keys.paragraph_order, c.document_id, c.paragraph_order as match_order, count(*)::integer as bands
+    from keys
+    join document_minhash_bands c on c.band_key = keys.band_key
+    where (c.paragraph_order >= 0) = p_paragraphs
+      and c.document_id <> p_document_id
+    group by keys.paragraph_order, c.document_id, c.paragraph_order
+    order by bands desc, c.document_id, keys.paragraph_order, c.paragraph_order
+    limit p_limit;
+$$;
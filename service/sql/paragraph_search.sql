@@ -0,0 +1,51 @@
+-- Full-text paragraph search (GET /search).
+-- Apply before deploying: saved paragraph rows carry search_terms. Rows
+-- saved before then are indexed by `python search_reindex.py`.
+
+-- Normalized terms of the content, written by the service (search.py):
+-- Postgres has no Slovenian stemmer, so the "simple" configuration only
+-- splits them
+alter table document_paragraphs
+    add column search_terms text;
+
+alter table document_paragraphs
+    add column search_vector tsvector
+    generated always as (to_tsvector('simple', coalesce(search_terms, ''))) stored;
+
+create index document_paragraphs_search_idx on document_paragraphs using gin (search_vector);
+
+-- Ranked matches for a to_tsquery('simple', ...) query built by search.tsquery
+create or replace function search_paragraphs(p_query text, p_limit integer default 20, p_offset integer default 0)
+returns table (document_id uuid, paragraph_order integer, paragraph_style text, content text, rank real)
+language sql
+stable
+as $$
+    select p.document_id, p.paragraph_order, p.paragraph_style, p.content,
+           ts_rank_cd(p.search_vector, q.query) as rank
+    from document_paragraphs p, to_tsquery('simple', p_query) as q(query)
+    where p.search_vector @@ q.query
+    order by rank desc, p.document_id, p.paragraph_order
+    limit p_limit offset p_offset;
+$$;
+
+-- The bulk insert (sql/document_paragraphs_bulk.sql) with search terms
+create or replace function insert_document_paragraphs(p_document_id uuid, p_paragraphs jsonb)
+returns integer
+language sql
+as $$
+    with written as (
+        insert into document_paragraphs (document_id, paragraph_order, paragraph_id, paragraph_style, content,
+                                         search_terms)
+        select p_document_id, r.paragraph_order, r.paragraph_id, r.paragraph_style, r.content, r.search_terms
+        from jsonb_to_recordset(p_paragraphs)
+            as r(paragraph_order integer, paragraph_id text, paragraph_style text, content text,
+                 search_terms text)
+        on conflict (document_id, paragraph_order) do update
+            set paragraph_id = excluded.paragraph_id,
+                paragraph_style = excluded.paragraph_style,
+                content = excluded.content,
+                search_terms = excluded.search_terms
+        returning 1
+    )
+    select count(*)::integer from written;
+$$;
@@ -0,0 +1,407 @@
+import io
+import random
+import re
+
+import pytest
+from docx import Document
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+from cache import AnalysisCache
+from jobs import JobQueue
+
+
+@pytest.fixture(autouse=True)
+def analysis_cache(monkeypatch):
+    """An empty in-memory result cache for every test."""
+    cache = AnalysisCache(main.ANALYSIS_CACHE_BYTES, main.RULES_FINGERPRINT)
+    monkeypatch.setattr(main, "analysis_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def job_queue(monkeypatch, tmp_path):
+    """A job queue and upload directory private to every test."""
+    queue = JobQueue(str(tmp_path / "jobs" / "jobs.sqlite3"), main.JOB_VISIBILITY_TIMEOUT,
+                     main.JOB_MAX_ATTEMPTS, main.JOB_RETRY_DELAY)
+    monkeypatch.setattr(main, "job_queue", queue)
+    monkeypatch.setattr(main, "JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(main, "JOB_POLL_INTERVAL", 0.02)
+    return queue
+
+
+def _thesis():
+    """Complete thesis with both title pages, front matter, TOC and body."""
+    lines = [
+        ("Title", "Janez Novak"),
+        ("Title", "Uporaba strojnega učenja pri analizi besedil"),
+        ("Normal", "Magistrsko delo"),
+        ("Normal", "Maribor, september 2024"),
+        ("Normal", "Univerza v Mariboru"),
+        ("Normal", "Fakulteta za elektrotehniko, računalništvo in informatiko"),
+        ("Normal", "Uporaba strojnega učenja pri analizi besedil"),
+        ("Normal", "Magistrsko delo"),
+        ("Normal", "Študent(ka): Janez Novak"),
+        ("Normal", "Študijski program: Računalništvo in informacijske tehnologije"),
+        ("Normal", "Magistrski študijski program"),
+        ("Normal", "Smer: Programska oprema"),
+        ("Normal", "Mentor(ica): red. prof. dr. Ana Kos"),
+        ("Normal", "Somentor(ica): doc. dr. Petra Žagar"),
+        ("Normal", "Lektor(ica): mag. Marko Kranjc"),
+        ("Normal", "Zahvala"),
+        ("Normal", "Zahvaljujem se mentorici za pomoč pri nastajanju dela."),
+        ("Normal", "Povzetek"),
+        ("Normal", "V delu obravnavamo analizo besedil."),
+        ("Normal", "Ključne besede: strojno učenje, besedila"),
+        ("Normal", "UDK: 004.8(043.2)"),
+        ("Normal", "Abstract"),
+        ("Normal", "We analyse texts."),
+        ("Normal", "Keywords: machine learning, texts"),
+        ("Normal", "UDC: 004.8(043.2)"),
+        ("Normal", "Izjava o avtorstvu"),
+        ("Normal", "II"),
+        ("Heading 1", "KAZALO VSEBINE"),
+        ("TOC 1", "1. UVOD ....................................... 1"),
+        ("TOC 2", "1.1 Cilji ...................................... 2"),
+        ("TOC 1", "2. Pregled literature ......................... 3"),
+        ("Normal", "Kazalo slik"),
+        ("Normal", "Slika 1: Arhitektura sistema ................. 4"),
+        ("Normal", "Seznam uporabljenih simbolov in kratic"),
+        ("Heading 1", "1. UVOD"),
+        ("Normal", "Cilj dela je razviti sistem."),
+        ("Normal", "Predpostavke in omejitve raziskovalnega dela."),
+        ("Heading 2", "1.1 Cilji"),
+        ("Normal", "1"),
+        ("Heading 1", "2. Pregled literature"),
+        ("Normal", "Slika 1: Arhitektura sistema"),
+        ("Normal", "2.1.1 Nevronske mreže"),
+        ("Heading 1", "3. Metodologija"),
+        ("Heading 1", "4. Rezultati"),
+        ("Normal", "Tabela 2: Rezultati meritev"),
+        ("Heading 1", "5. Zaključek"),
+        ("Normal", "Viri in literatura"),
+        ("Normal", "Priloge"),
+    ]
+    return lines
+
+
+def _toc_mention():
+    """TOC referenced mid-sentence, so `_extract_toc` sees its entries."""
+    return [
+        ("Normal", "Magistrsko delo"),
+        ("Normal", "Zahvala"),
+        ("Normal", "1.Uvod"),
+        ("Normal", "Glej kazalo vsebine spodaj"),
+        ("Normal", "1. Uvod ............ 3"),
+        ("Normal", "2. Metode .......... 5"),
+        ("Normal", "2.1 Zbiranje ....... 6"),
+        ("Normal", "3.Zaključek"),
+        ("Normal", "3. Zaključek ....... 9"),
+        ("Normal", "Seznam virov"),
+        ("Normal", "2.Metode"),
+        ("Normal", "4.Priloga"),
+        ("Normal", "XIV"),
+        ("Normal", "12"),
+    ]
+
+
+def _no_zahvala():
+    """Every output paragraph is trimmed, title page spans city/date lines."""
+    return [
+        ("Normal", "Primerjava algoritmov"),
+        ("Normal", "Ljubljana, maj 2023"),
+        ("Normal", "za razvrščanje"),
+        ("Normal", "Diplomsko delo"),
+        ("Normal", "Študijski program: Informatika"),
+        ("Normal", "Smer: Splošna"),
+        ("Normal", "UVOD"),
+        ("Normal", "Cilj je primerjati algoritme."),
+        ("Normal", "2. Rezultati"),
+    ]
+
+
+_FUZZ_LINES = [
+    "Zahvala", "ZAHVALA", "zahvala in posvetilo", "Povzetek", "Abstract",
+    "Ključne besede: a, b", "Keywords: a", "UDK: 004", "UDC 004 ", "Magistrsko delo",
+    "Diplomsko delo v nastajanju", "Ljubljana, januar 2024", "Študent: Ana Kos",
+    "Študijski program: Informatika", "Visokošolski program", "Mentor: dr. B",
+    "Smer: Splošna", "Kazalo vsebine", "kazalo slik", "Kazalo tabel in grafov",
+    "1. UVOD ........ 1", "1.1 Cilji ..... 2", "2. Metode ... 4", "1. UVOD", "UVOD",
+    "1.Uvod", "2.Metode", "2.1 Zbiranje podatkov", "3.2.1 podrobnosti", "Slika 3: Graf",
+    "Tabela 1: Podatki", "IV", "17", "Cilj raziskave", "Raziskovalna vprašanja",
+    "Predpostavke", "Omejitve", "Seznam virov", "Priloge", "Glej kazalo vsebine",
+    "Navadno besedilo odstavka.", "Izjava o avtorstvu", "Univerza v Ljubljani",
+    "Seznam simbolov", "2. Pregled literature", "4. Rezultati", "5. Sklep", "Lektor: X",
+]
+
+
+def _fuzz(seed, n=80):
+    rnd = random.Random(seed)
+    return [("Normal", rnd.choice(_FUZZ_LINES)) for _ in range(n)]
+
+
+@pytest.fixture
+def thesis_corpus():
+    """Named paragraph lists covering the branches of the analysis pipeline.
+
+    Each call returns fresh paragraph dicts, since analysis restyles them
+    in place.
+    """
+    docs = {"thesis": _thesis(), "toc_mention": _toc_mention(), "no_zahvala": _no_zahvala()}
+    docs.update({f"fuzz_{seed}": _fuzz(seed) for seed in range(40)})
+
+    def build():
+        return {
+            name: [{"id": str(i), "style": style, "content": text}
+                   for i, (style, text) in enumerate(lines)]
+            for name, lines in docs.items()
+        }
+    return build
+
+
+@pytest.fixture
+def thesis_docx():
+    """The complete fixture thesis saved as DOCX bytes."""
+    doc = Document()
+    for style, text in _thesis():
+        para = doc.add_paragraph(text)
+        if style.startswith("Heading"):
+            para.style = doc.styles[style]
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+_PDF_FONTS = {"Title": (20, "hebo"), "Heading 1": (16, "hebo"), "Heading 2": (13, "hebo")}
+# Base-14 PDF fonts cannot encode every Slovenian letter
+_ASCII = str.maketrans("čšžćđČŠŽĆĐ", "cszcdCSZCD")
+
+
+@pytest.fixture
+def thesis_pdf(tmp_path):
+    """The complete fixture thesis typeset as a PDF with heading fonts."""
+    import fitz
+
+    doc = fitz.open()
+    page, y = None, 0
+    for style, text in _thesis():
+        size, font = _PDF_FONTS.get(style, (11, "helv"))
+        if page is None or y > 760 or style == "Heading 1":
+            page, y = doc.new_page(), 72
+        page.insert_text((72, y), text.translate(_ASCII), fontsize=size, fontname=font)
+        y += size * 2.2
+    path = tmp_path / "thesis.pdf"
+    doc.save(path)
+    return str(path)
+
+
+class _FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+_OPS = {"eq": lambda a, b: a == b, "lt": lambda a, b: a < b, "gt": lambda a, b: a > b,
+        "lte": lambda a, b: a <= b, "gte": lambda a, b: a >= b}
+
+
+def _split_terms(text):
+    terms, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            terms.append(text[start:i])
+            start = i + 1
+    return terms + [text[start:]]
+
+
+def _parse_term(term):
+    if term.startswith("and("):
+        parts = [_parse_term(t) for t in _split_terms(term[4:-1])]
+        return lambda row: all(p(row) for p in parts)
+    column, op, value = term.split(".", 2)
+    value = value.strip('"')
+    return lambda row: row.get(column) is not None and _OPS[op](str(row[column]), value)
+
+
+def _parse_or(filters):
+    parts = [_parse_term(t) for t in _split_terms(filters)]
+    return lambda row: any(p(row) for p in parts)
+
+
+class _FakeQuery:
+    """Subset of the PostgREST query builder, evaluated over in-memory rows."""
+
+    def __init__(self, db, table, columns="*"):
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+        self.deleting = False
+        self.upserting = None
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] <= value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering.append((column, desc))
+        return self
+
+    def or_(self, filters):
+        """PostgREST `or=(...)` filters of `col.op.value` terms and nested `and(...)`."""
+        self.filters.append(_parse_or(filters))
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def delete(self):
+        self.deleting = True
+        return self
+
+    def upsert(self, payload, on_conflict="id", **options):
+        self.upserting = (payload if isinstance(payload, list) else [payload], on_conflict.split(","))
+        return self
+
+    async def execute(self):
+        self.db.queries.append((self.table, self.columns))
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.upserting:
+            payload, key = self.upserting
+            written = {tuple(row[k] for k in key) for row in payload}
+            rows[:] = [row for row in rows if tuple(row.get(k) for k in key) not in written] + payload
+            return _FakeResult(payload)
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.deleting:
+            self.db.tables[self.table] = [row for row in rows if row not in matched]
+            return _FakeResult(matched)
+        for column, desc in reversed(self.ordering):
+            matched.sort(key=lambda row: row[column], reverse=desc)
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        if self.columns != "*":
+            keep = self.columns.split(",")
+            matched = [{k: row[k] for k in keep if k in row} for row in matched]
+        return _FakeResult(matched)
+
+
+def _search_paragraphs(db, p_query, p_limit=20, p_offset=0):
+    """`search_paragraphs` (sql/paragraph_search.sql): prefix terms, all required."""
+    terms = re.findall(r"'([^']*)':\*", p_query)
+    matches = []
+    for row in db.tables.get("document_paragraphs", []):
+        words = (row.get("search_terms") or "").split()
+        hits = [sum(word.startswith(term) for word in words) for term in terms]
+        if all(hits):
+            matches.append({**{k: row[k] for k in ("document_id", "paragraph_order", "paragraph_style",
+                                                    "content")}, "rank": float(sum(hits))})
+    matches.sort(key=lambda row: (-row["rank"], row["document_id"], row["paragraph_order"]))
+    return matches[p_offset:p_offset + p_limit]
+
+
+def _similar_candidates(db, p_document_id, p_paragraphs, p_limit=200, p_max_key_rows=100):
+    """`similar_candidates` (sql/document_similarity.sql): band rows sharing a key, per pair."""
+    held = {}
+    for row in db.tables.get("document_minhash_bands", []):
+        held[row["band_key"]] = held.get(row["band_key"], 0) + 1
+    rows = [row for row in db.tables.get("document_minhash_bands", [])
+            if (row["paragraph_order"] >= 0) == p_paragraphs]
+    keys = {}
+    for row in rows:
+        if row["document_id"] == p_document_id and held[row["band_key"]] <= p_max_key_rows:
+            keys.setdefault(row["band_key"], []).append(row["paragraph_order"])
+    counts = {}
+    for row in rows:
+        if row["document_id"] != p_document_id:
+            for order in keys.get(row["band_key"], ()):
+                pair = (order, row["document_id"], row["paragraph_order"])
+                counts[pair] = counts.get(pair, 0) + 1
+    matches = [{"paragraph_order": order, "document_id": document_id, "match_order": match, "bands": bands}
+               for (order, document_id, match), bands in counts.items()]
+    matches.sort(key=lambda row: (-row["bands"], row["document_id"], row["paragraph_order"], row["match_order"]))
+    return matches[:p_limit]
+
+
+class _FakeCall:
+    def __init__(self, db, fn, params):
+        self.db = db
+        self.fn = fn
+        self.params = params
+
+    async def execute(self):
+        self.db.queries.append((self.fn, "rpc"))
+        return _FakeResult(self.db.functions[self.fn](self.db, **self.params))
+
+
+class FakeSupabase:
+    """In-memory stand-in for the Supabase async client's table and rpc API."""
+
+    def __init__(self):
+        self.tables = {}
+        self.queries = []
+        self.functions = {"search_paragraphs": _search_paragraphs, "similar_candidates": _similar_candidates}
+
+    def table(self, name):
+        return _FakeTable(self, name)
+
+    def rpc(self, fn, params):
+        return _FakeCall(self, fn, params)
+
+
+class _FakeTable:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def select(self, columns="*"):
+        return _FakeQuery(self.db, self.name, columns)
+
+    def delete(self):
+        return _FakeQuery(self.db, self.name).delete()
+
+    def upsert(self, payload, **options):
+        return _FakeQuery(self.db, self.name).upsert(payload, **options)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Route the service's database calls to an in-memory FakeSupabase."""
+    db = FakeSupabase()
+
+    async def connect():
+        return db
+    monkeypatch.setattr(main, "supabase", db)
+    monkeypatch.setattr(main, "_connect_supabase", connect)
+    monkeypatch.setattr(main, "documents_cache", main.ResponseCache(main.DOCUMENTS_CACHE_TTL))
+    return db
@@ -0,0 +1,131 @@
+import pytest
+import random
+import re
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+import budget
+from main import (
+    MANDATORY_FRONT_MATTER,
+    RULE_MATCHER,
+    SIMPLE_NUM_RE,
+    SUBSEC_RE,
+    _is_toc_line,
+    _numbered_heading,
+    _process_styled_text,
+    _toc_entry,
+    _toc_heading_style,
+)
+
+# Matching these takes time quadratic (or worse) in the length of the
+# line with backtracking patterns; each must stay well inside the budget
+N = 50_000
+ADVERSARIAL = {
+    "dot_leader": "1 " + "." * N + "x",
+    "spaced_dots": "1 " + ". " * N + "x",
+    "spaces": "1" + " " * N + "x",
+    "spaces_around_dots": "1" + " " * N + ".." + " " * N + "x",
+    "leader_then_break": "1 a\n" + "." * N + " 1\n",
+    "repeated_leaders": "1 a" + ".. 1 " * (N // 5) + "x",
+    "digits_then_break": "1" * N + "x\ny",
+    "number_then_break": "1." * (N // 2) + "x\ny",
+    "repeated_seznam": "seznam " * (N // 7),
+    "repeated_uporabljene": "uporabljene " * (N // 12),
+    "repeated_kazalo": "kazalo " * (N // 7),
+    "pdf_garbage": "".join(random.Random(0).choice(". 1\t.a") for _ in range(N)),
+}
+# A generous multiple of the linear time; a quadratic match takes minutes
+BUDGET = 2
+
+# The patterns the linear matchers replaced, kept as oracles
+OLD_TOC_ENTRY = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)*)\.?\s+(?P<title>.*?)\s*\.{2,}\s*(?P<page>\d+)\s*$")
+OLD_TOC_LINE = re.compile(r"^\s*\d+(\.\d+)*\.?\s+.+?\.{2,}\s*\d+\s*$")
+OLD_SIMPLE_NUM = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)*)\.?(?=[^.\s])(?P<title>.+)$")
+OLD_SUBSEC = re.compile(r"^\s*(?P<num>\d+(?:\.\d+)+)\.?\s*(?P<title>.+)$")
+OLD_SYMBOLS = [r"seznam.*simbol", r"seznam.*kratic", r"uporabljene.*kratice"]
+
+
+def random_strings(alphabet, count, max_length, seed=1):
+    rnd = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, max_length)))
+
+
+class TestLinearTime:
+    """Test that the matchers stay linear on inputs built to make regexes backtrack"""
+
+    @pytest.mark.parametrize("name", sorted(ADVERSARIAL))
+    def test_matchers(self, name):
+        text = ADVERSARIAL[name]
+        with budget.cpu_budget(BUDGET):
+            _toc_entry(text)
+            _is_toc_line(text)
+            _numbered_heading(SIMPLE_NUM_RE, text)
+            _numbered_heading(SUBSEC_RE, text)
+            RULE_MATCHER.match(text)
+
+    def test_analysis(self):
+        pairs = [("Heading 1", "Kazalo vsebine")]
+        for text in ADVERSARIAL.values():
+            pairs += [("toc 1", text), ("Normal", text), ("Heading 1", text)]
+        results = []
+        for mode in main.ANALYZER_MODES:
+            with budget.cpu_budget(BUDGET * 5):
+                results.append(_process_styled_text(pairs, mode))
+
+        pipeline, fused = results
+        assert pipeline["front_matter_found"] == fused["front_matter_found"]
+        assert pipeline["table_of_contents"] == fused["table_of_contents"]
+
+
+class TestEquivalence:
+    """Test that the linear matchers accept what the patterns they replaced did"""
+
+    ALPHABET = "123..  \n\ta."
+
+    def test_toc_entry(self):
+        for text in random_strings(self.ALPHABET + "Bč", 100_000, 14):
+            m = OLD_TOC_ENTRY.match(text)
+            expected = (m.group("num"), m.group("title").strip()) if m else None
+            assert _toc_entry(text) == expected, repr(text)
+
+    def test_toc_line(self):
+        for text in random_strings(self.ALPHABET + "Bč", 100_000, 14, seed=2):
+            assert _is_toc_line(text) == bool(OLD_TOC_LINE.match(text)), repr(text)
+
+    def test_toc_examples(self):
+        assert _toc_entry("1.2 Namen naloge ........ 14") == ("1.2", "Namen naloge")
+        assert _toc_entry("  3. Zaključek . . .. 40 ") == ("3", "Zaključek . .")
+        assert _toc_entry("1.2Namen ..... 14") is None
+        assert _toc_entry("1.2 Namen\nnaloge ..... 14") is None
+        assert _is_toc_line("2 Uvod ..... 3")
+        assert not _is_toc_line("2 Uvod ..... ")
+
+    def test_numbered_headings(self):
+        for text in random_strings("12..  \n\naB", 200_000, 12, seed=3):
+            for old, new in ((OLD_SIMPLE_NUM, SIMPLE_NUM_RE), (OLD_SUBSEC, SUBSEC_RE)):
+                m = old.match(text)
+                assert _numbered_heading(new, text) == (m and (m.group("num"), m.group("title"))), repr(text)
+
+    def test_multiline_paragraphs_keep_their_style(self):
+        """Test that a line break keeps numbered text from becoming a heading"""
+        assert _toc_heading_style("12\nUVOD") == (None, None, False)
+        assert _toc_heading_style("1.1 x\nbody") == (None, None, False)
+        assert _toc_heading_style("1 UVOD\nbesedilo") == (None, None, False)
+        assert _toc_heading_style("1.1\nCilji") == ("Heading 2", None, False)
+        assert _toc_heading_style("  \n2.UVOD\n") == ("Heading 1", ("2", "UVOD"), False)
+
+    def test_symbols_front_matter(self):
+        words = ["seznam", "simbol", "kratic", "uporabljene", "kratice", "SEZNAM", " ", "\n", "x", "sez"]
+        new = [re.compile(p, re.IGNORECASE) for p in MANDATORY_FRONT_MATTER["Seznam simbolov in kratic"]]
+        old = [re.compile(p, re.IGNORECASE) for p in OLD_SYMBOLS]
+        rnd = random.Random(4)
+        for _ in range(50_000):
+            text = "".join(rnd.choice(words) for _ in range(rnd.randint(0, 8)))
+            assert [bool(p.search(text)) for p in new] == [bool(p.search(text)) for p in old], repr(text)
@@ -0,0 +1,72 @@
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+)
+
+from main import _process_styled_text
+from bench_suite import compare, stages
+from thesis_generator import generate_thesis
+
+
+class TestThesisGenerator:
+    """Test the synthetic theses the benchmark suite runs on"""
+
+    def test_exact_sizes(self):
+        for n in (100, 1000, 10000):
+            assert len(generate_thesis(n)) == n
+
+    def test_deterministic(self):
+        assert generate_thesis(300, seed=1) == generate_thesis(300, seed=1)
+        assert generate_thesis(300, seed=1) != generate_thesis(300, seed=2)
+
+    def test_analysis_finds_every_section(self):
+        result = _process_styled_text(generate_thesis(1000))
+        assert result["missing_sections"] == []
+        assert result["missing_body_sections"] == []
+        assert result["notranja_naslovna"]["mentor"]
+        assert not any("...." in p["content"] for p in result["paragraphs"])
+
+
+class TestStages:
+    """Test that every stage of the suite runs"""
+
+    def test_every_stage_runs(self):
+        for name, setup, run in stages(100):
+            run(setup())
+
+
+class TestCompare:
+    """Test the regression gate against a stored baseline"""
+
+    BASELINE = {"1000": {"analyze.fused": {"seconds": 0.100, "peak_bytes": 4 * 2**20}}}
+
+    def _run(self, seconds, peak_bytes):
+        results = {"1000": {"analyze.fused": {"seconds": seconds, "peak_bytes": peak_bytes}}}
+        return compare(results, self.BASELINE, time_tolerance=0.25, memory_tolerance=0.10)
+
+    def test_within_tolerance(self):
+        assert self._run(0.120, 4.2 * 2**20) == []
+
+    def test_slower(self):
+        regressions = self._run(0.150, 4 * 2**20)
+        assert len(regressions) == 1 and "150.0 ms" in regressions[0]
+
+    def test_more_memory(self):
+        regressions = self._run(0.100, 5 * 2**20)
+        assert len(regressions) == 1 and "peak" in regressions[0]
+
+    def test_noise_floor(self):
+        # 50% slower, but by a single millisecond
+        tiny = {"100": {"pipeline.extract_toc": {"seconds": 0.002, "peak_bytes": 1024}}}
+        results = {"100": {"pipeline.extract_toc": {"seconds": 0.003, "peak_bytes": 4096}}}
+        assert compare(results, tiny, 0.25, 0.10) == []
+
+    def test_new_stages_pass(self):
+        results = {"10000": {"analyze.fused": {"seconds": 9.0, "peak_bytes": 2**30}}}
+        assert compare(results, self.BASELINE, 0.25, 0.10) == []
@@ -0,0 +1,96 @@
+import pytest
+import re
+import threading
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from budget import BudgetExceeded, cpu_budget, enforced
+import main
+from main import DocumentError, _within_budget
+
+pytestmark = pytest.mark.skipif(not enforced(), reason="needs setitimer on the main thread")
+
+
+def spin():
+    while True:
+        pass
+
+
+class TestCpuBudget:
+    """Test the CPU time budget"""
+
+    def test_interrupts_busy_loop(self):
+        with pytest.raises(BudgetExceeded) as e:
+            with cpu_budget(0.1):
+                spin()
+        assert e.value.seconds == 0.1
+
+    def test_interrupts_backtracking_regex(self):
+        with pytest.raises(BudgetExceeded):
+            with cpu_budget(0.1):
+                re.match(r"(a+)+$", "a" * 64 + "b")
+
+    def test_not_caught_as_exception(self):
+        with pytest.raises(BudgetExceeded):
+            with cpu_budget(0.1):
+                try:
+                    spin()
+                except Exception:
+                    pass
+
+    def test_fast_block_and_disabled(self):
+        with cpu_budget(5):
+            sum(range(1000))
+        with cpu_budget(0):
+            sum(range(1000))
+
+    def test_nested_outer_still_fires(self):
+        with pytest.raises(BudgetExceeded) as e:
+            with cpu_budget(0.2):
+                with cpu_budget(5):
+                    sum(range(1000))
+                spin()
+        assert e.value.seconds == 0.2
+
+    def test_not_enforced_off_main_thread(self):
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(enforced()))
+        thread.start()
+        thread.join()
+        assert seen == [False]
+
+
+class TestWithinBudget:
+    """Test the pool call wrapper"""
+
+    def test_result(self):
+        assert _within_budget(5, sum, [1, 2]) == 3
+
+    def test_exceeded_is_document_error(self):
+        with pytest.raises(DocumentError) as e:
+            _within_budget(0.1, spin)
+        assert e.value.status_code == 422
+        assert "time budget of 0.1s" in e.value.detail
+
+    def test_partial_conversion_removed(self, tmp_path, monkeypatch):
+        """Test that a conversion cut short leaves no half-written DOCX behind"""
+        class SlowConverter:
+            def __init__(self, path):
+                pass
+
+            def convert(self, docx_path, start, end):
+                open(docx_path, "wb").close()
+                spin()
+
+        monkeypatch.setattr(main, "Converter", SlowConverter)
+        pdf_path = tmp_path / "thesis.pdf"
+        pdf_path.write_bytes(b"%PDF")
+
+        with pytest.raises(DocumentError):
+            _within_budget(0.1, main._convert_pdf_range, str(pdf_path))
+        assert os.listdir(tmp_path) == ["thesis.pdf"]
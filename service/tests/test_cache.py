@@ -0,0 +1,221 @@
+import asyncio
+import pytest
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+from cache import AnalysisCache, ResponseCache, content_key, etag_for, etag_matches
+
+
+class TestContentKey:
+    """Test cache key derivation"""
+
+    def test_same_bytes_same_key(self):
+        assert content_key(b"abc", "pdf", "pymupdf") == content_key(b"abc", "pdf", "pymupdf")
+
+    def test_options_change_key(self):
+        assert content_key(b"abc", "pdf", "pymupdf") != content_key(b"abc", "pdf", "pdf2docx")
+        assert content_key(b"abc", "docx") != content_key(b"abcdocx")
+
+
+class TestAnalysisCache:
+    """Test LRU bounds, persistence and single-flight computation"""
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is dropped first"""
+        cache = AnalysisCache(2 * len('{"n": 1}'), "rules")
+        cache.put("a", {"n": 1})
+        cache.put("b", {"n": 2})
+        cache.get("a")
+        cache.put("c", {"n": 3})
+
+        assert cache.get("a") == {"n": 1}
+        assert cache.get("b") is None
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["bytes"] == 2 * len('{"n": 1}')
+
+    def test_large_entries_evict_by_size(self):
+        """Test that one large result pushes out several small ones"""
+        cache = AnalysisCache(100, "rules")
+        for key in "abcd":
+            cache.put(key, {"n": 1})
+        cache.put("big", {"text": "x" * 70})
+
+        assert cache.get("big") is not None
+        assert cache.stats()["bytes"] <= 100
+        assert [key for key in "abcd" if cache.get(key)] == ["c", "d"]
+
+    def test_oversized_entry_not_kept(self):
+        """Test that a result larger than the whole budget is not held in memory"""
+        cache = AnalysisCache(10, "rules")
+        cache.put("k", {"text": "x" * 20})
+
+        assert cache.get("k") is None
+        assert cache.stats()["bytes"] == 0
+
+    def test_disk_io_leaves_event_loop(self, tmp_path, monkeypatch):
+        """Test that loading and saving entries run on a worker thread"""
+        import threading
+
+        cache = AnalysisCache(1000, "rules", str(tmp_path))
+        threads = []
+        for name in ("_load", "_save"):
+            original = getattr(cache, name)
+
+            def record(*args, original=original):
+                threads.append(threading.current_thread())
+                return original(*args)
+
+            monkeypatch.setattr(cache, name, record)
+
+        async def compute():
+            return {"n": 1}
+
+        async def run():
+            await cache.get_or_compute("k", compute)
+            cache._forget("k")
+            return await cache.get_or_compute("k", None), threading.current_thread()
+
+        result, loop_thread = asyncio.run(run())
+
+        assert result == {"n": 1}
+        assert len(threads) == 3  # miss, save, then the disk hit
+        assert loop_thread not in threads
+
+    def test_concurrent_requests_coalesce(self):
+        """Test that identical concurrent requests share one computation"""
+        cache = AnalysisCache(1000, "rules")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"n": len(calls)}
+
+        async def run():
+            return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+        results = asyncio.run(run())
+
+        assert calls == [1]
+        assert results == [{"n": 1}] * 5
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["coalesced"] == 4
+
+    def test_failures_are_not_cached(self):
+        """Test that an error reaches every waiter and the next call retries"""
+        cache = AnalysisCache(1000, "rules")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad document")
+
+        async def run():
+            return await asyncio.gather(*(cache.get_or_compute("k", fail) for _ in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+
+        assert all(isinstance(r, ValueError) for r in results)
+        assert cache.get("k") is None
+        assert cache.stats()["in_flight"] == 0
+
+    def test_disk_persistence(self, tmp_path):
+        """Test that results survive a new cache instance with the same rules"""
+        AnalysisCache(1000, "rules", str(tmp_path)).put("k", {"ž": [1, 2]})
+
+        cache = AnalysisCache(1000, "rules", str(tmp_path))
+        result = asyncio.run(cache.get_or_compute("k", None))
+
+        assert result == {"ž": [1, 2]}
+        assert cache.stats()["hits"] == 1
+
+    def test_rule_change_invalidates_disk(self, tmp_path):
+        """Test that entries written under other rules are removed"""
+        AnalysisCache(1000, "old", str(tmp_path)).put("k", {"n": 1})
+
+        cache = AnalysisCache(1000, "new", str(tmp_path))
+
+        assert cache.get("k") is None
+        assert os.listdir(tmp_path) == ["new"]
+
+    def test_disabled_memory_cache(self):
+        """Test that a zero byte budget keeps nothing in memory"""
+        cache = AnalysisCache(0, "rules")
+        cache.put("k", {"n": 1})
+
+        assert cache.get("k") is None
+
+
+class TestResponseCache:
+    """Test TTL response caching and ETag matching"""
+
+    def test_expiry(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+        cache = ResponseCache(5)
+        etag, _ = cache.put("page", {"documents": []})
+
+        assert cache.get("page") == (etag, {"documents": []})
+        now[0] += 5
+        assert cache.get("page") is None
+
+    def test_etag_is_content_based(self):
+        assert etag_for({"a": 1, "b": 2}) == etag_for({"b": 2, "a": 1})
+        assert etag_for({"a": 1}) != etag_for({"a": 2})
+
+    def test_if_none_match_forms(self):
+        etag = etag_for({"a": 1})
+
+        assert etag_matches(f'"other", {etag}', etag)
+        assert etag_matches(f"W/{etag}", etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches(None, etag)
+        assert not etag_matches('"other"', etag)
+
+
+class TestUploadCache:
+    """Test cached uploads through the API"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi.testclient import TestClient
+
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(main.app) as client:
+            yield client
+
+    def test_repeated_upload_hits_cache(self, client, monkeypatch, thesis_docx):
+        """Test that a resubmitted file is not analyzed again"""
+        first = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+        monkeypatch.setattr(main, "_analyze_docx", None)
+        second = client.post("/upload-docx", files={"file": ("copy.docx", thesis_docx)})
+
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        stats = client.get("/cache/stats").json()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["fingerprint"] == main.RULES_FINGERPRINT
+
+    def test_pdf_engines_cached_separately(self, client, thesis_pdf):
+        """Test that the PDF engine is part of the cache key"""
+        with open(thesis_pdf, "rb") as f:
+            data = f.read()
+
+        for engine in ("pymupdf", "pymupdf", "pdf2docx"):
+            client.post(f"/upload-pdf?engine={engine}", files={"file": ("thesis.pdf", data)})
+
+        stats = client.get("/cache/stats").json()
+        assert (stats["hits"], stats["misses"]) == (1, 2)
+
+    def test_fingerprint_tracks_rules(self, monkeypatch):
+        """Test that editing a rule table changes the fingerprint"""
+        before = main._rules_fingerprint()
+        monkeypatch.setitem(main.SECTION_PATTERNS, "Sklep", r"^Sklep")
+
+        assert main._rules_fingerprint() != before
@@ -0,0 +1,135 @@
+import io
+import pytest
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from lxml import etree
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+from main import _iter_styled_text, _analyze_docx
+from docx_reader import iter_styled_text, DocxError
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _xml(fragment):
+    return etree.fromstring(f'<root xmlns:w="{W_NS}" xmlns:r="{R_NS}">{fragment}</root>')[0]
+
+
+@pytest.fixture
+def tricky_docx():
+    """DOCX exercising run content, hyperlinks, tables, content controls and styles."""
+    doc = Document()
+    doc.styles.add_style("Moj slog", WD_STYLE_TYPE.PARAGRAPH)
+    doc.add_paragraph("Naslov dela", style="Title")
+    doc.add_paragraph("1. UVOD", style="Heading 1")
+    doc.add_paragraph("Odstavek v lastnem slogu", style="Moj slog")
+    doc.add_paragraph("   ")
+
+    body = doc.element.body
+    sect = body[-1]
+    for fragment in [
+        # tab, line break, page break, carriage return, non-breaking hyphen
+        '<w:p><w:r><w:t>Tab</w:t><w:tab/><w:t>za</w:t><w:br/><w:t>vrstico</w:t>'
+        '<w:br w:type="page"/><w:t>stran</w:t><w:cr/><w:t>e</w:t><w:noBreakHyphen/>'
+        '<w:t>pošta</w:t></w:r></w:p>',
+        # hyperlink runs count, inserted revisions do not
+        '<w:p><w:r><w:t xml:space="preserve">Glej </w:t></w:r><w:hyperlink r:id="rId99">'
+        '<w:r><w:t>povezavo</w:t></w:r></w:hyperlink><w:ins><w:r><w:t>skrito</w:t></w:r></w:ins></w:p>',
+        # unknown style id and a character style id fall back to the default
+        '<w:p><w:pPr><w:pStyle w:val="Neobstojec"/></w:pPr><w:r><w:t>Brez sloga</w:t></w:r></w:p>',
+        '<w:p><w:pPr><w:pStyle w:val="DefaultParagraphFont"/></w:pPr><w:r><w:t>Znakovni</w:t></w:r></w:p>',
+        # table and content control paragraphs are not body paragraphs
+        '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>V tabeli</w:t></w:r></w:p></w:tc></w:tr></w:tbl>',
+        '<w:sdt><w:sdtContent><w:p><w:r><w:t>V kontroli</w:t></w:r></w:p></w:sdtContent></w:sdt>',
+        '<w:p><w:pPr><w:pStyle w:val="Heading2"/></w:pPr><w:r><w:t>1.1 Cilji</w:t></w:r></w:p>',
+    ]:
+        sect.addprevious(_xml(fragment))
+
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def records(paragraphs):
+    return [(p["style"], p["content"]) for p in paragraphs]
+
+
+class TestDocxReader:
+    """Test parity of the streaming reader with python-docx"""
+
+    def test_parity_on_tricky_document(self, tricky_docx):
+        expected = list(_iter_styled_text(Document(io.BytesIO(tricky_docx))))
+
+        assert list(iter_styled_text(tricky_docx)) == expected
+        assert ("Normal", "Brez sloga") in expected
+        assert ("Heading 2", "1.1 Cilji") in expected
+        assert not any("V tabeli" in text or "skrito" in text for _, text in expected)
+
+    def test_parity_on_thesis(self, thesis_docx):
+        expected = list(_iter_styled_text(Document(io.BytesIO(thesis_docx))))
+
+        assert list(iter_styled_text(thesis_docx)) == expected
+
+    def test_reads_paths(self, tmp_path, thesis_docx):
+        path = tmp_path / "thesis.docx"
+        path.write_bytes(thesis_docx)
+
+        assert list(iter_styled_text(str(path))) == list(iter_styled_text(thesis_docx))
+
+    def test_not_a_docx(self):
+        with pytest.raises(DocxError):
+            iter_styled_text(b"not a docx")
+
+    def test_truncated_document_xml(self, thesis_docx):
+        """Test that XML errors surface as DocxError while iterating"""
+        import zipfile
+
+        src = zipfile.ZipFile(io.BytesIO(thesis_docx))
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as dst:
+            for item in src.infolist():
+                data = src.read(item)
+                dst.writestr(item, data[:len(data) // 2] if item.filename == "word/document.xml" else data)
+
+        with pytest.raises(DocxError):
+            list(iter_styled_text(buf.getvalue()))
+
+
+class TestDocxReaderSelection:
+    """Test choosing the reader for DOCX analysis"""
+
+    def test_same_analysis_with_both_readers(self, monkeypatch, thesis_docx):
+        monkeypatch.setattr(main, "DOCX_READER", "python-docx")
+        expected = _analyze_docx(thesis_docx)
+        monkeypatch.setattr(main, "DOCX_READER", "lxml")
+        result = _analyze_docx(thesis_docx)
+
+        assert records(result.pop("paragraphs")) == records(expected.pop("paragraphs"))
+        assert result == expected
+
+    def test_invalid_file_with_lxml_reader(self, monkeypatch):
+        monkeypatch.setattr(main, "DOCX_READER", "lxml")
+
+        with pytest.raises(main.DocumentError) as exc:
+            _analyze_docx(b"not a docx")
+
+        assert exc.value.status_code == 400
+
+    def test_unknown_reader_fails_at_startup(self):
+        """Test that a misconfigured DOCX_READER stops the import, not a request"""
+        import subprocess
+
+        env = {**os.environ, "DOCX_READER": "beautifulsoup"}
+        result = subprocess.run([sys.executable, "-c", "import main"], cwd=os.path.dirname(main.__file__),
+                                env=env, capture_output=True, text=True)
+
+        assert result.returncode != 0
+        assert "DOCX_READER must be one of python-docx, lxml" in result.stderr
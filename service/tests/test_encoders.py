@@ -0,0 +1,85 @@
+import json
+
+import msgpack
+import pytest
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from encoders import JSONEncoder, MsgpackEncoder, negotiate
+
+RESULT = {
+    "notranja_naslovna": {"student": "Janez Žagar", "mentor": None},
+    "paragraphs": [{"id": "a", "style": "Heading 1", "content": "1. UVOD"}],
+    "structure_analysis": {"score": 87.5, "grade": "B"},
+}
+
+
+class TestEncoders:
+    """Test encoding analysis results with appended fields"""
+
+    @pytest.mark.parametrize("backend", ["orjson", "json"])
+    def test_json_matches_copy(self, backend):
+        """Test that appending fields equals encoding an updated copy"""
+        data = JSONEncoder(backend).encode(RESULT, {"document_id": "d", "save_status": None})
+
+        assert json.loads(data) == {**RESULT, "document_id": "d", "save_status": None}
+        assert list(json.loads(data))[-2:] == ["document_id", "save_status"]
+
+    def test_json_backends_agree(self):
+        """Test that both JSON backends produce the same bytes"""
+        assert JSONEncoder("orjson").encode(RESULT) == JSONEncoder("json").encode(RESULT)
+
+    def test_json_empty_body(self):
+        """Test appending to an empty result"""
+        assert json.loads(JSONEncoder().encode({}, {"document_id": "d"})) == {"document_id": "d"}
+
+    def test_unknown_json_backend(self):
+        """Test that an unknown backend is rejected"""
+        with pytest.raises(ValueError):
+            JSONEncoder("simplejson")
+
+    def test_msgpack_matches_copy(self):
+        """Test MessagePack output with appended fields"""
+        data = MsgpackEncoder().encode(RESULT, {"document_id": "d"})
+
+        assert msgpack.unpackb(data) == {**RESULT, "document_id": "d"}
+
+    def test_encode_does_not_modify_result(self):
+        """Test that the encoded result dict is left as it was"""
+        before = json.dumps(RESULT)
+        JSONEncoder().encode(RESULT, {"document_id": "d"})
+        MsgpackEncoder().encode(RESULT, {"document_id": "d"})
+
+        assert json.dumps(RESULT) == before
+
+
+class TestNegotiate:
+    """Test Accept header negotiation"""
+
+    ENCODERS = (JSONEncoder(), MsgpackEncoder())
+
+    @pytest.mark.parametrize("accept, media_type", [
+        (None, "application/json"),
+        ("", "application/json"),
+        ("*/*", "application/json"),
+        ("application/*", "application/json"),
+        ("application/json", "application/json"),
+        ("application/msgpack", "application/msgpack"),
+        ("application/x-msgpack", "application/msgpack"),
+        ("application/json;q=0.5, application/msgpack", "application/msgpack"),
+        ("text/html, application/msgpack;q=0.9, */*;q=0.1", "application/msgpack"),
+        ("text/html, */*;q=0.1", "application/json"),
+    ])
+    def test_negotiate(self, accept, media_type):
+        """Test picking the preferred acceptable encoder"""
+        assert negotiate(accept, self.ENCODERS).media_type == media_type
+
+    @pytest.mark.parametrize("accept", ["text/html", "application/json;q=0", "image/*"])
+    def test_not_acceptable(self, accept):
+        """Test that no encoder is picked for unsupported types"""
+        assert negotiate(accept, self.ENCODERS) is None
@@ -0,0 +1,179 @@
+import threading
+
+import pytest
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from jobs import JobQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / "q" / "jobs.sqlite3"), visibility_timeout=60,
+                    max_attempts=3, retry_delay=10, clock=clock)
+
+
+class TestJobQueue:
+    """Test the SQLite job queue: claims, leases, retries and results"""
+
+    def test_claim_in_submission_order(self, queue, clock):
+        """Test that jobs are leased oldest first, one worker each"""
+        first = queue.submit("docx", "a.docx", "/tmp/a.docx")
+        clock.now += 1
+        second = queue.submit("pdf", "b.pdf", "/tmp/b.pdf", engine="pymupdf")
+
+        a, b = queue.claim("w1"), queue.claim("w2")
+
+        assert (a.id, b.id) == (first, second)
+        assert (b.kind, b.engine, b.filename, b.attempts) == ("pdf", "pymupdf", "b.pdf", 1)
+        assert queue.claim("w3") is None
+        assert queue.get(first)["status"] == "running"
+
+    def test_complete_stores_result(self, queue):
+        """Test that a completed job carries its result and document"""
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+        job = queue.claim("w1")
+
+        assert queue.complete(job, {"uvod": ["Cilj"]}, "doc-1", "saved")
+
+        status = queue.get(job_id)
+        assert status["status"] == "done"
+        assert status["result"] == {"uvod": ["Cilj"]}
+        assert (status["document_id"], status["save_status"]) == ("doc-1", "saved")
+        assert queue.get("missing") is None
+
+    def test_expired_lease_is_claimed_again(self, queue, clock):
+        """Test at-least-once delivery after a worker stops heartbeating"""
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+        stale = queue.claim("w1")
+        clock.now += 30
+        assert queue.heartbeat(stale)
+        clock.now += 59
+        assert queue.claim("w2") is None
+
+        clock.now += 2
+        fresh = queue.claim("w2")
+
+        assert fresh.id == job_id and fresh.attempts == 2
+        # The first worker lost its lease and can no longer touch the job
+        assert not queue.heartbeat(stale)
+        assert not queue.complete(stale, {"stale": True})
+        assert queue.fail(stale, "late") is None
+        assert queue.complete(fresh, {"fresh": True})
+        assert queue.get(job_id)["result"] == {"fresh": True}
+
+    def test_expired_lease_uses_up_attempts(self, queue, clock):
+        """Test that a job whose workers keep dying eventually fails"""
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+        for _ in range(3):
+            assert queue.claim("w") is not None
+            clock.now += 61
+
+        assert queue.claim("w") is None
+        status = queue.get(job_id)
+        assert status["status"] == "failed" and "lease expired" in status["error"]
+
+    def test_failures_retried_with_backoff(self, queue, clock):
+        """Test retry delays and the final failure"""
+        job_id = queue.submit("pdf", "a.pdf", "/tmp/a.pdf")
+
+        assert queue.fail(queue.claim("w"), "timeout") == "queued"
+        clock.now += 9
+        assert queue.claim("w") is None
+        clock.now += 1
+        assert queue.fail(queue.claim("w"), "timeout") == "queued"
+        clock.now += 20
+        assert queue.fail(queue.claim("w"), "timeout") == "failed"
+
+        status = queue.get(job_id)
+        assert (status["status"], status["attempts"], status["error"]) == ("failed", 3, "timeout")
+
+    def test_permanent_failure(self, queue):
+        """Test that non-retryable failures end the job at once"""
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+
+        assert queue.fail(queue.claim("w"), "Error reading DOCX", retry=False) == "failed"
+        assert queue.get(job_id)["attempts"] == 1
+
+    def test_release_does_not_count_attempt(self, queue):
+        """Test that a job handed back on shutdown is available at once"""
+        queue.submit("docx", "a.docx", "/tmp/a.docx")
+        queue.release(queue.claim("w1"))
+
+        assert queue.claim("w2").attempts == 1
+
+    def test_purge_finished_jobs(self, queue, clock):
+        """Test that old finished jobs are deleted and failed inputs returned"""
+        done = queue.submit("docx", "a.docx", "/tmp/a.docx")
+        failed = queue.submit("docx", "b.docx", "/tmp/b.docx")
+        queue.complete(queue.claim("w"), {})
+        queue.fail(queue.claim("w"), "bad", retry=False)
+        pending = queue.submit("docx", "c.docx", "/tmp/c.docx")
+        clock.now += 100
+
+        assert queue.purge(50) == ["/tmp/b.docx"]
+        assert queue.get(done) is None and queue.get(failed) is None
+        assert queue.get(pending)["status"] == "queued"
+
+    def test_shared_between_queue_objects(self, queue, tmp_path, clock):
+        """Test that separate queue objects on one file (other processes) share jobs"""
+        other = JobQueue(queue.path, clock=clock)
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+
+        assert other.claim("w").id == job_id
+        assert queue.get(job_id)["status"] == "running"
+
+    def test_status_read_while_a_worker_writes(self, queue):
+        """Test that polling a job's status does not wait for the write lock"""
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+
+        with queue._transaction() as db:
+            db.execute("UPDATE jobs SET worker = 'w' WHERE id = ?", (job_id,))
+            assert queue.get(job_id)["status"] == "queued"
+
+    def test_rollback_journal(self, tmp_path, clock):
+        """Test the journal mode for a queue shared between hosts"""
+        queue = JobQueue(str(tmp_path / "jobs.sqlite3"), clock=clock, journal_mode="delete")
+        job_id = queue.submit("docx", "a.docx", "/tmp/a.docx")
+
+        with queue._connection() as db:
+            assert db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert queue.claim("w").id == job_id
+        with pytest.raises(ValueError):
+            JobQueue(queue.path, journal_mode="MEMORY")
+
+    def test_concurrent_claims_are_exclusive(self, queue):
+        """Test that racing workers never lease the same job twice"""
+        ids = {queue.submit("docx", f"{i}.docx", f"/tmp/{i}.docx") for i in range(40)}
+        claimed = []
+
+        def work(name):
+            q = JobQueue(queue.path, clock=queue.clock)
+            while (job := q.claim(name)) is not None:
+                claimed.append(job.id)
+
+        threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(claimed) == sorted(ids)
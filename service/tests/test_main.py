@@ -1,8 +1,17 @@
 import pytest
 import re
+import asyncio
 from unittest.mock import Mock, patch, MagicMock
 from docx import Document
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
 import uuid
+import io
+import base64
+import json
+import tempfile
+import time
+import zipfile
 
 import sys, os
  
@@ -11,6 +20,7 @@ sys.path.insert(
     os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 )
 
+import main
 from main import (
     app,
     NAME_PATTERN,
@@ -23,6 +33,9 @@ from main import (
     _style_special_sections,
     _check_front_matter,
     _check_body_sections,
+    _check_sections,
+    _fold,
+    _FOLD_SAFE,
     _extract_uvod,
     _extract_toc,
     _filter_out_toc_entries,
@@ -30,6 +43,13 @@ from main import (
     _generate_recommendations,
     _validate_naslovna_stran,
     _validate_notranja_stran,
+    _process_document,
+    _process_styled_text,
+    Paragraph,
+    _analyze_paragraphs,
+    _analyze_stream,
+    _analyze_docx,
+    _run_in_pool,
 )
 
 class TestRegexPatterns:
@@ -251,6 +271,70 @@ class TestSectionChecking:
         assert "Literatura kaže..." not in result
 
 
+class TestRuleEngine:
+    """Test the compiled single-pass rule engine"""
+
+    def test_check_sections_matches_helpers(self):
+        """Test parity with _check_front_matter and _check_body_sections"""
+        paragraphs = [
+            {"content": "Janez Novak"},
+            {"content": "Magistrsko delo"},
+            {"content": "Univerza v Mariboru, Fakulteta za elektrotehniko"},
+            {"content": "Zahvala"},
+            {"content": "Povzetek"},
+            {"content": "Keywords: test"},
+            {"content": "Seznam uporabljenih simbolov"},
+            {"content": "1. UVOD"},
+            {"content": "Cilj tega dela je..."},
+            {"content": "Predpostavke in omejitve raziskovalnega dela"},
+            {"content": "2. Metodologija"},
+            {"content": "Sklep"},
+            {"content": "Viri in literatura"}
+        ]
+
+        front, body = _check_sections(paragraphs)
+
+        assert front == _check_front_matter(paragraphs)
+        assert body == _check_body_sections(paragraphs)
+        assert list(front) == list(MANDATORY_FRONT_MATTER)
+
+    def test_check_sections_overlapping_rules(self):
+        """Test that one paragraph can satisfy several rules"""
+        front, body = _check_sections([{"content": "1. UVOD"}])
+
+        assert front["Vsebina zaključnega dela"] == True
+        assert body["Uvod"] == True
+        assert body["Zaključek"] == False
+
+    def test_check_sections_multiline_paragraph(self):
+        """Test that patterns are matched across soft line breaks like re.search"""
+        paragraphs = [{"content": "Naslov\nKazalo vsebine"}, {"content": "seznam\nsimbolov"}]
+
+        front, _ = _check_sections(paragraphs)
+
+        assert front == _check_front_matter(paragraphs)
+        assert front["Kazalo vsebine"] == True
+        assert front["Seznam simbolov in kratic"] == False
+
+    def test_check_sections_unusual_case_folding(self):
+        """Test characters that IGNORECASE folds differently from str.lower()"""
+        paragraphs = [{"content": "İZJAVA O AVTORSTVU"}, {"content": "ſeznam virov"}]
+
+        front, _ = _check_sections(paragraphs)
+
+        assert front == _check_front_matter(paragraphs)
+        assert front["Izjava o avtorstvu"] == True
+        assert front["Seznam virov in literature"] == True
+
+    def test_fold_covers_ignorecase_equivalents(self):
+        """Test that folding never hides an IGNORECASE match from the prefilter"""
+        safe = re.compile("[" + re.escape("".join(sorted(_FOLD_SAFE))) + "]", re.IGNORECASE)
+        for cp in range(sys.maxunicode + 1):
+            c = chr(cp)
+            if safe.fullmatch(c):
+                assert _fold(c) in _FOLD_SAFE, f"{c!r} folds to {_fold(c)!r}"
+
+
 class TestTOCProcessing:
     """Test table of contents processing"""
     
@@ -295,6 +379,1241 @@ class TestTOCProcessing:
         assert result[1]["content"] == "More regular content"
 
 
+class TestStreamingAnalyzer:
+    """Test the fused single-pass analyzer against the multi-pass pipeline"""
+
+    def test_parity_with_pipeline(self, thesis_corpus):
+        """Test identical results on every document of the fixture corpus"""
+        expected = thesis_corpus()
+        actual = thesis_corpus()
+
+        for name in expected:
+            assert _analyze_stream(iter(actual[name])) == _analyze_paragraphs(expected[name]), name
+
+    def test_toc_listed_heading_before_toc(self, thesis_corpus):
+        """Test that a heading styled by a later TOC entry is resolved"""
+        result = _analyze_stream(iter(thesis_corpus()["toc_mention"]))
+
+        styles = {p["content"]: p["style"] for p in result["paragraphs"]}
+        assert styles["1.Uvod"] == "Heading 1"
+        assert styles["2.Metode"] == "Heading 1"
+        assert styles["4.Priloga"] == "Normal"
+        assert [e["number"] for e in result["table_of_contents"]] == ["1", "2", "2.1", "3"]
+
+    def test_process_document_modes(self):
+        """Test both analyzer modes on a real python-docx Document"""
+        doc = Document()
+        for text in ["Magistrsko delo", "Študent(ka): Janez Novak", "Zahvala", "Hvala.",
+                     "1. UVOD", "Cilj dela", "2. Metodologija", "V"]:
+            doc.add_paragraph(text)
+
+        results = [_process_document(doc, mode=mode) for mode in ("pipeline", "fused")]
+
+        # The fused analyzer only generates ids for the paragraphs it returns
+        ids = [p.pop("id") for p in results[1]["paragraphs"]]
+        for p in results[0]["paragraphs"]:
+            del p["id"]
+        assert results[0] == results[1]
+        assert len(set(ids)) == len(ids)
+        assert [p["content"] for p in results[1]["paragraphs"]][0] == "Zahvala"
+
+    def test_styled_text_modes(self, thesis_corpus):
+        """Test that `(style, text)` pairs give the same result in both modes"""
+        for name, paragraphs in thesis_corpus().items():
+            pairs = [(p["style"], p["content"]) for p in paragraphs]
+            results = [_process_styled_text(iter(pairs), mode=mode) for mode in ("pipeline", "fused")]
+            for result in results:
+                for p in result["paragraphs"]:
+                    del p["id"]
+            assert results[0] == results[1], name
+
+    def test_paragraph_record(self):
+        """Test the compact record interns its style and generates its id lazily"""
+        p = Paragraph("".join(["Heading ", "1"]), "  1. UVOD ")
+        assert p.style is sys.intern("Heading 1")
+        assert p._id is None
+        assert p.as_dict() == {"id": p.id, "style": "Heading 1", "content": "  1. UVOD "}
+        assert Paragraph("Normal", "x", "given").id == "given"
+
+    def test_ids_only_for_output(self):
+        """Test that dropped front-matter paragraphs never get an id"""
+        pairs = [("Normal", "Magistrsko delo"), ("Normal", "Zahvala"), ("Normal", "Hvala.")]
+        with patch('main.uuid.uuid4', side_effect=["id-0", "id-1", "id-2"]) as uuid4:
+            result = _process_styled_text(iter(pairs), mode="fused")
+
+        assert [p["id"] for p in result["paragraphs"]] == ["id-0", "id-1"]
+        assert uuid4.call_count == 2
+
+    def test_process_document_unknown_mode(self):
+        """Test that an unknown analyzer mode is rejected"""
+        with pytest.raises(ValueError):
+            _process_document(Document(), mode="turbo")
+
+
+class TestUploadEndpoints:
+    """Test upload endpoints and worker pool dispatch"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    def test_upload_docx(self, client, thesis_docx):
+        """Test DOCX upload analyzed off the event loop"""
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["document_id"] is None
+        assert data["notranja_naslovna"]["student"] == "Janez Novak"
+        assert data["paragraphs"][0]["content"] == "Zahvala"
+
+    def test_upload_docx_msgpack(self, client, thesis_docx):
+        """Test that the same result is sent as MessagePack when asked for"""
+        import msgpack
+
+        as_json = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+        as_msgpack = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)},
+                                 headers={"Accept": "application/msgpack"})
+
+        assert as_msgpack.status_code == 200
+        assert as_msgpack.headers["content-type"] == "application/msgpack"
+        assert as_msgpack.headers["vary"] == "Accept"
+        assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+
+    def test_upload_unacceptable_format(self, client, monkeypatch, thesis_docx):
+        """Test that an unsupported Accept header is refused before analysis"""
+        monkeypatch.setattr(main, "_spool_upload", None)
+
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)},
+                               headers={"Accept": "text/html"})
+
+        assert response.status_code == 406
+
+    def test_upload_leaves_cached_result_untouched(self, client, analysis_cache, thesis_docx):
+        """Test that per-response fields are not written into the cached result"""
+        client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        (cached,) = analysis_cache._entries.values()
+        assert "document_id" not in cached and "save_status" not in cached
+
+    def test_upload_docx_invalid_file(self, client):
+        """Test that unreadable DOCX files are rejected with 400"""
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", b"not a docx")})
+
+        assert response.status_code == 400
+        assert "Error reading DOCX" in response.json()["detail"]
+
+    def test_upload_rejected_when_queue_full(self, client, monkeypatch, thesis_docx):
+        """Test that uploads beyond the queue depth get 503 with Retry-After"""
+        monkeypatch.setattr(main, "ANALYSIS_QUEUE_DEPTH", 0)
+        monkeypatch.setattr(main, "_active_uploads", 1)
+
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(main.ANALYSIS_RETRY_AFTER)
+
+    def test_process_pool_errors(self, monkeypatch):
+        """Test that worker errors cross the process boundary as HTTP errors"""
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 1)
+        try:
+            with pytest.raises(HTTPException) as exc:
+                asyncio.run(_run_in_pool(_analyze_docx, b"not a docx"))
+        finally:
+            main._shutdown_executor()
+
+        assert exc.value.status_code == 400
+
+
+class TestQuickCheck:
+    """Test title-page checks on the start of a document"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    def test_docx(self, client, thesis_docx):
+        response = client.post("/quick-check", files={"file": ("thesis.docx", thesis_docx)})
+
+        data = response.json()
+        assert response.status_code == 200
+        assert data["notranja_naslovna"]["student"] == "Janez Novak"
+        assert data["notranja_naslovna"]["mentor"] == "red. prof. dr. Ana Kos"
+        assert data["front_matter_found"] == {"Naslovna stran na platnici": True,
+                                              "Notranja naslovna stran v zaključnem delu": True}
+        assert data["paragraphs_read"] == main.QUICK_CHECK_PARAGRAPHS
+
+    def test_reads_only_the_prefix(self, client, monkeypatch, thesis_docx):
+        """Test that fields past the configured prefix are not seen"""
+        monkeypatch.setattr(main, "QUICK_CHECK_PARAGRAPHS", 10)
+
+        data = client.post("/quick-check", files={"file": ("thesis.docx", thesis_docx)}).json()
+
+        assert data["paragraphs_read"] == 10
+        assert data["notranja_naslovna"]["student"] == "Janez Novak"
+        assert data["notranja_naslovna"]["mentor"] is None
+
+    def test_pdf_first_pages(self, client, monkeypatch, thesis_pdf):
+        monkeypatch.setattr(main, "QUICK_CHECK_PAGES", 1)
+        with open(thesis_pdf, "rb") as f:
+            response = client.post("/quick-check", files={"file": ("thesis.pdf", f.read())})
+
+        data = response.json()
+        assert response.status_code == 200
+        assert data["notranja_naslovna"]["type"] == "Magistrsko delo"
+        # Headings start new pages in the fixture; the first page ends before chapter 1
+        assert 0 < data["paragraphs_read"] < len(main._extract_pdf(thesis_pdf))
+
+    def test_rejected_files(self, client):
+        assert client.post("/quick-check", files={"file": ("a.txt", b"x")}).status_code == 400
+        assert client.post("/quick-check", files={"file": ("a.docx", b"not a zip")}).status_code == 400
+
+
+class TestBatchUpload:
+    """Test the batch upload endpoint and its NDJSON stream"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    @staticmethod
+    def lines(response):
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    @staticmethod
+    def archive(members):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        return buf.getvalue()
+
+    def test_files_and_errors(self, client, thesis_docx, thesis_pdf):
+        """Test one line per document, with failures reported per document"""
+        with open(thesis_pdf, "rb") as f:
+            pdf = f.read()
+        files = [("files", ("a.docx", thesis_docx)), ("files", ("b.pdf", pdf)),
+                 ("files", ("c.docx", b"not a docx")), ("files", ("d.txt", b"text"))]
+
+        response = client.post("/upload-batch?engine=pymupdf", files=files)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = {line["index"]: line for line in self.lines(response)}
+        assert sorted(lines) == [0, 1, 2, 3]
+        assert lines[0]["filename"] == "a.docx" and lines[0]["status"] == 200
+        assert lines[0]["notranja_naslovna"]["student"] == "Janez Novak"
+        assert lines[1]["status"] == 200 and "paragraphs" in lines[1]
+        assert lines[2]["status"] == 400 and "Error reading DOCX" in lines[2]["detail"]
+        assert lines[3]["status"] == 400
+
+    def test_zip_archive(self, client, thesis_docx):
+        """Test that DOCX members of an archive are analyzed and others reported"""
+        data = self.archive({"cohort/a.docx": thesis_docx, "cohort/notes.txt": b"x",
+                             "__MACOSX/cohort/._a.docx": b"x", "cohort/": b""})
+
+        response = client.post("/upload-batch", files=[("files", ("cohort.zip", data))])
+
+        lines = sorted(self.lines(response), key=lambda line: line["filename"])
+        assert [(l["filename"], l["status"]) for l in lines] == [
+            ("cohort.zip/cohort/a.docx", 200), ("cohort.zip/cohort/notes.txt", 400)]
+
+    def test_zip_member_too_large(self, client, monkeypatch):
+        """Test that a member inflating past the upload limit is refused"""
+        monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1000)
+        data = self.archive({"big.docx": b"0" * 100_000})
+
+        response = client.post("/upload-batch", files=[("files", ("bomb.zip", data))])
+
+        assert [l["status"] for l in self.lines(response)] == [413]
+
+    def test_too_many_files(self, client, monkeypatch, thesis_docx):
+        """Test that oversize batches are refused and their temp files removed"""
+        monkeypatch.setattr(main, "MAX_BATCH_FILES", 2)
+        spooled = []
+        original = main._spool_zip_member
+        monkeypatch.setattr(main, "_spool_zip_member",
+                            lambda zf, info: spooled.append(original(zf, info)) or spooled[-1])
+        data = self.archive({f"{i}.docx": thesis_docx for i in range(3)})
+
+        response = client.post("/upload-batch", files=[("files", ("a.zip", data))])
+
+        assert response.status_code == 400
+        assert len(spooled) == 2
+        assert not any(os.path.exists(path) for path, _ in spooled)
+
+    def test_streams_in_completion_order(self, monkeypatch):
+        """Test that a finished document is sent while an earlier one still runs"""
+        monkeypatch.setattr(main, "BATCH_CONCURRENCY", 2)
+        release = asyncio.Event()
+        running = []
+
+        async def analyze(path, digest, kind, engine=None):
+            running.append(path)
+            if path.endswith("slow.docx"):
+                await release.wait()
+            return {"paragraphs": []}
+        monkeypatch.setattr(main, "_analyze_upload", analyze)
+
+        async def run(tmp):
+            items = []
+            for name in ("slow.docx", "fast.docx", "last.docx"):
+                path = os.path.join(tmp, name)
+                open(path, "wb").close()
+                items.append(main._BatchItem(name, "docx", path, None))
+            stream = main._stream_batch(items, "pdf2docx")
+            first = json.loads(await stream.__anext__())
+            second = json.loads(await stream.__anext__())
+            # The slow document still holds one of the two slots
+            assert len(running) == 3
+            release.set()
+            third = json.loads(await stream.__anext__())
+            return [first["filename"], second["filename"], third["filename"]], items
+
+        with tempfile.TemporaryDirectory() as tmp:
+            order, items = asyncio.run(run(tmp))
+            assert order == ["fast.docx", "last.docx", "slow.docx"]
+            assert os.listdir(tmp) == []
+
+    def test_disconnect_removes_pending_files(self, monkeypatch):
+        """Test that closing the stream early cancels the rest and cleans up"""
+        monkeypatch.setattr(main, "BATCH_CONCURRENCY", 1)
+
+        async def analyze(path, digest, kind, engine=None):
+            return {"paragraphs": []}
+        monkeypatch.setattr(main, "_analyze_upload", analyze)
+
+        async def run(tmp):
+            items = []
+            for name in ("a.docx", "b.docx", "c.docx"):
+                path = os.path.join(tmp, name)
+                open(path, "wb").close()
+                items.append(main._BatchItem(name, "docx", path, None))
+            stream = main._stream_batch(items, "pdf2docx")
+            await stream.__anext__()
+            await stream.aclose()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(run(tmp))
+            assert os.listdir(tmp) == []
+
+
+    def test_disconnect_before_body_removes_files(self, monkeypatch, thesis_docx):
+        """Test that spooled files go even if the client leaves before the first line"""
+        from starlette.datastructures import UploadFile
+        from starlette.requests import ClientDisconnect
+
+        paths = []
+        spool = main._spool_upload
+
+        async def recording_spool(file, suffix, directory=None):
+            path, digest = await spool(file, suffix, directory)
+            paths.append(path)
+            return path, digest
+        monkeypatch.setattr(main, "_spool_upload", recording_spool)
+
+        async def gone(message):
+            raise OSError("client went away")
+
+        async def run():
+            files = [UploadFile(io.BytesIO(thesis_docx), filename=f"{i}.docx") for i in range(2)]
+            response = await main.upload_batch(files, engine=None)
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, gone)
+
+        with pytest.raises(ClientDisconnect):
+            asyncio.run(run())
+        assert len(paths) == 2
+        assert not any(os.path.exists(path) for path in paths)
+
+class TestProgressEvents:
+    """Test the server-sent progress events of the streaming upload endpoints"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    @staticmethod
+    def events(response):
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_docx_stages(self, client, thesis_docx):
+        """Test the stage sequence and the final result of a DOCX upload"""
+        response = client.post("/upload-docx/stream", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = self.events(response)
+        stages = [data["stage"] for event, data in events if event == "progress"]
+        assert stages == ["received", "extracted", "checked", "persisted"]
+        assert events[0][1] == {"stage": "received", "filename": "thesis.docx", "bytes": len(thesis_docx)}
+        assert events[1][1]["paragraphs"] == 48
+        event, result = events[-1]
+        assert event == "result"
+        expected = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)}).json()
+        assert result == expected
+
+    def test_pdf_page_progress(self, client, monkeypatch, thesis_pdf):
+        """Test that pdf2docx conversion reports pages as ranges finish"""
+        monkeypatch.setattr(main, "PDF_PROGRESS_STEP", 2)
+        with open(thesis_pdf, "rb") as f:
+            data = f.read()
+
+        response = client.post("/upload-pdf/stream?engine=pdf2docx", files={"file": ("thesis.pdf", data)})
+
+        events = self.events(response)
+        pages = [(d["pages_done"], d["pages_total"]) for e, d in events if d.get("stage") == "converting"]
+        total = pages[0][1]
+        assert total > 2 and len(pages) == -(-total // 2)
+        assert [done for done, _ in pages] == sorted(done for done, _ in pages)
+        assert pages[-1] == (total, total)
+        assert events[-1][0] == "result"
+
+    def test_pdf_pymupdf_progress(self, client, thesis_pdf):
+        """Test that direct extraction reports all pages at once"""
+        with open(thesis_pdf, "rb") as f:
+            data = f.read()
+
+        response = client.post("/upload-pdf/stream?engine=pymupdf", files={"file": ("thesis.pdf", data)})
+
+        stages = [d["stage"] for e, d in self.events(response) if e == "progress"]
+        assert stages == ["received", "converting", "extracted", "checked", "persisted"]
+
+    def test_cached_result_skips_stages(self, client, thesis_docx):
+        """Test that an already analyzed upload goes straight to persisted"""
+        client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        response = client.post("/upload-docx/stream", files={"file": ("thesis.docx", thesis_docx)})
+
+        events = self.events(response)
+        assert [d.get("stage") for e, d in events[:-1]] == ["received", "persisted"]
+        assert events[-1][0] == "result"
+
+    def test_error_event(self, client):
+        """Test that a failed analysis ends with an error event"""
+        response = client.post("/upload-docx/stream", files={"file": ("thesis.docx", b"not a docx")})
+
+        event, data = self.events(response)[-1]
+        assert event == "error"
+        assert data["status"] == 400 and "Error reading DOCX" in data["detail"]
+
+    def test_disconnect_cancels_analysis(self, monkeypatch, tmp_path):
+        """Test that closing the stream cancels the analysis and removes the upload"""
+        started = asyncio.Event()
+        cancelled = []
+
+        async def analyze(path, digest, kind, engine=None, progress=None):
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(path)
+                raise
+        monkeypatch.setattr(main, "_analyze_upload", analyze)
+        path = tmp_path / "a.docx"
+        path.write_bytes(b"x")
+
+        async def run():
+            stream = main._stream_analysis("a.docx", str(path), None, "docx")
+            await stream.__anext__()
+            await started.wait()
+            await stream.aclose()
+
+        asyncio.run(run())
+        assert cancelled == [str(path)]
+        assert not path.exists()
+
+    def test_disconnect_before_first_event_removes_upload(self, monkeypatch, thesis_docx):
+        """Test that the upload goes even if the client leaves before any event"""
+        from starlette.datastructures import UploadFile
+        from starlette.requests import ClientDisconnect
+
+        paths = []
+        spool = main._spool_upload
+
+        async def recording_spool(file, suffix, directory=None):
+            path, digest = await spool(file, suffix, directory)
+            paths.append(path)
+            return path, digest
+        monkeypatch.setattr(main, "_spool_upload", recording_spool)
+
+        async def gone(message):
+            raise OSError("client went away")
+
+        async def run():
+            response = await main.upload_docx_stream(UploadFile(io.BytesIO(thesis_docx), filename="a.docx"))
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, gone)
+
+        with pytest.raises(ClientDisconnect):
+            asyncio.run(run())
+        assert len(paths) == 1 and not os.path.exists(paths[0])
+
+
+class TestJobsAPI:
+    """Test background analysis jobs through the HTTP API"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    @staticmethod
+    def wait_for(client, job_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = client.get(f"/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"job {job_id} did not finish")
+
+    def test_job_lifecycle(self, client, job_queue, thesis_docx):
+        """Test that a queued upload is analyzed by a worker and its input removed"""
+        response = client.post("/jobs", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.headers["location"] == f"/jobs/{job_id}"
+        job = self.wait_for(client, job_id)
+        assert job["status"] == "done" and job["attempts"] == 1
+        expected = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)}).json()
+        del expected["document_id"], expected["save_status"]
+        assert job["result"] == expected
+        assert not [name for name in os.listdir(main.JOBS_DIR) if name.endswith(".docx")]
+
+    def test_unreadable_document_fails_without_retry(self, client):
+        """Test that a document error ends the job at once"""
+        job_id = client.post("/jobs", files={"file": ("bad.docx", b"not a docx")}).json()["job_id"]
+
+        job = self.wait_for(client, job_id)
+
+        assert (job["status"], job["attempts"]) == ("failed", 1)
+        assert "Error reading DOCX" in job["error"]
+
+    def test_rejected_uploads(self, client):
+        """Test unsupported files, unknown engines and unknown jobs"""
+        assert client.post("/jobs", files={"file": ("a.txt", b"x")}).status_code == 400
+        assert client.post("/jobs?engine=ocr", files={"file": ("a.pdf", b"x")}).status_code == 400
+        assert client.get("/jobs/unknown").status_code == 404
+
+    def test_saved_under_job_id(self, monkeypatch, job_queue, thesis_docx):
+        """Test that the job waits for its save and reuses its id for the document"""
+        saves = []
+
+        async def save(filename, file_type, result, document_id=None, wait=False):
+            saves.append((filename, file_type, document_id, wait))
+            return document_id, "saved"
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "save_document_to_supabase", save)
+        path = os.path.join(main.JOBS_DIR, "a.docx")
+        os.makedirs(main.JOBS_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(thesis_docx)
+        job_id = job_queue.submit("docx", "a.docx", path)
+
+        asyncio.run(main._run_job(job_queue.claim("w")))
+
+        job = job_queue.get(job_id)
+        assert (job["status"], job["document_id"], job["save_status"]) == ("done", job_id, "saved")
+        assert saves == [("a.docx", "docx", job_id, True)]
+        assert not os.path.exists(path)
+
+    def test_busy_server_delays_jobs(self, monkeypatch, job_queue, thesis_docx):
+        """Test that a job waits for a worker where an upload would get 503"""
+        async def save(filename, file_type, result, document_id=None, wait=False):
+            return document_id, "saved"
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "save_document_to_supabase", save)
+        monkeypatch.setattr(main, "_active_uploads", 1 + main.ANALYSIS_QUEUE_DEPTH)
+        path = os.path.join(main.JOBS_DIR, "a.docx")
+        os.makedirs(main.JOBS_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(thesis_docx)
+        job_id = job_queue.submit("docx", "a.docx", path)
+
+        async def run():
+            task = asyncio.ensure_future(main._run_job(job_queue.claim("w")))
+            await asyncio.sleep(0.1)
+            waiting = job_queue.get(job_id)
+            main._active_uploads = 0
+            await task
+            return waiting
+
+        waiting = asyncio.run(run())
+        assert (waiting["status"], waiting["attempts"]) == ("running", 1)
+        assert (job_queue.get(job_id)["status"], job_queue.get(job_id)["attempts"]) == ("done", 1)
+
+    def test_server_errors_are_retried(self, monkeypatch, job_queue, tmp_path):
+        """Test that a crashed worker pool queues the job again"""
+        async def analyze(path, digest, kind, engine=None, progress=None, background=False):
+            raise HTTPException(500, "Analysis worker crashed")
+        monkeypatch.setattr(main, "_analyze_upload", analyze)
+        path = tmp_path / "a.docx"
+        path.write_bytes(b"x")
+        job_id = job_queue.submit("docx", "a.docx", str(path))
+
+        asyncio.run(main._run_job(job_queue.claim("w")))
+
+        job = job_queue.get(job_id)
+        assert (job["status"], job["error"]) == ("queued", "Analysis worker crashed")
+        assert path.exists()
+
+    def test_worker_survives_failing_job(self, monkeypatch, job_queue):
+        """Test that an error escaping one job does not stop the worker"""
+        ran = []
+        job_queue.submit("docx", "a.docx", "/tmp/a.docx")
+        job_queue.submit("docx", "b.docx", "/tmp/b.docx")
+
+        async def run():
+            done = asyncio.Event()
+
+            async def run_job(job):
+                ran.append(job.filename)
+                if len(ran) == 1:
+                    raise RuntimeError("database is locked")
+                done.set()
+            monkeypatch.setattr(main, "_run_job", run_job)
+
+            worker = asyncio.ensure_future(main._job_worker("w"))
+            await asyncio.wait_for(done.wait(), 5)
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+        asyncio.run(run())
+        assert ran == ["a.docx", "b.docx"]
+
+    def test_cancelled_job_is_released(self, monkeypatch, job_queue, tmp_path):
+        """Test that a job interrupted by shutdown goes back to the queue"""
+        async def analyze(path, digest, kind, engine=None, progress=None, background=False):
+            await asyncio.Event().wait()
+        monkeypatch.setattr(main, "_analyze_upload", analyze)
+        path = tmp_path / "a.docx"
+        path.write_bytes(b"x")
+        job_id = job_queue.submit("docx", "a.docx", str(path))
+
+        async def run():
+            task = asyncio.ensure_future(main._run_job(job_queue.claim("w")))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(run())
+        job = job_queue.get(job_id)
+        assert (job["status"], job["attempts"]) == ("queued", 0)
+
+
+class TestUploadStreaming:
+    """Test chunked upload spooling and size limits"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    def test_declared_size_rejected_early(self, client, monkeypatch):
+        """Test that an oversize Content-Length is refused before the body is read"""
+        monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1000)
+        monkeypatch.setattr(main, "_spool_upload", None)
+
+        response = client.post("/upload-pdf", files={"file": ("big.pdf", b"x" * 200_000)})
+
+        assert response.status_code == 413
+        assert "1000 bytes" in response.json()["detail"]
+
+    def test_streamed_size_rejected(self, client, monkeypatch):
+        """Test the limit while copying, when the declared size fits"""
+        monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1000)
+        monkeypatch.setattr(main, "UPLOAD_CHUNK_SIZE", 256)
+
+        response = client.post("/upload-docx", files={"file": ("big.docx", b"x" * 5000)})
+
+        assert response.status_code == 413
+
+    def test_spooled_file_removed(self, client, monkeypatch, thesis_docx):
+        """Test that the temp copy of the upload is deleted after analysis"""
+        paths = []
+        spool = main._spool_upload
+
+        async def recording_spool(file, suffix):
+            path, digest = await spool(file, suffix)
+            paths.append(path)
+            return path, digest
+        monkeypatch.setattr(main, "_spool_upload", recording_spool)
+
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 200
+        assert not os.path.exists(paths[0])
+
+    def test_peak_memory_flat(self, monkeypatch):
+        """Test that spooling memory does not grow with the upload size"""
+        import tempfile, tracemalloc
+        from starlette.datastructures import UploadFile
+
+        monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 64 * 1024 * 1024)
+
+        def peak(size):
+            source = tempfile.TemporaryFile()
+            for _ in range(size // main.UPLOAD_CHUNK_SIZE):
+                source.write(b"x" * main.UPLOAD_CHUNK_SIZE)
+            source.seek(0)
+            upload = UploadFile(source, filename="big.pdf")
+
+            tracemalloc.start()
+            try:
+                path, digest = asyncio.run(main._spool_upload(upload, ".pdf"))
+                _, peak_bytes = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                source.close()
+            assert os.path.getsize(path) == size
+            os.unlink(path)
+            return peak_bytes
+
+        small, large = peak(4 * 1024 * 1024), peak(48 * 1024 * 1024)
+
+        assert large < 3 * main.UPLOAD_CHUNK_SIZE
+        assert large < small + main.UPLOAD_CHUNK_SIZE
+
+
+class TestMetrics:
+    """Test the Prometheus metrics endpoint"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with TestClient(app) as client:
+            yield client
+
+    @staticmethod
+    def sample(line_start):
+        for line in main.registry.render().splitlines():
+            if line.startswith(line_start + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_upload_stages_recorded(self, client, thesis_docx):
+        """Test that stage timings made in the worker reach the registry"""
+        stage = 'thesis_stage_duration_seconds_count{stage="%s"}'
+        before = {name: self.sample(stage % name)
+                  for name in ("docx_parse", "read_paragraphs", "check_sections", "trim_output")}
+        uploads = self.sample('thesis_upload_size_bytes_count{kind="docx"}')
+
+        client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        for name, count in before.items():
+            assert self.sample(stage % name) == count + 1
+        assert self.sample('thesis_upload_size_bytes_count{kind="docx"}') == uploads + 1
+
+    def test_exposition_format(self, client):
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE thesis_http_request_duration_seconds histogram" in response.text
+        assert "# TYPE thesis_http_errors_total counter" in response.text
+
+    def test_errors_by_endpoint_template(self, client):
+        """Test error counts per route, not per document id"""
+        errors = 'thesis_http_errors_total{endpoint="/jobs/{job_id}",status="404"}'
+        before = self.sample(errors)
+
+        client.get("/jobs/one")
+        client.get("/jobs/two")
+
+        assert self.sample(errors) == before + 2
+        assert "/jobs/one" not in client.get("/metrics").text
+
+    def test_streamed_response_leaves_flight(self, client, thesis_docx):
+        """Test that a streamed response counts as in flight until it ends"""
+        in_flight = 'thesis_http_requests_in_flight{endpoint="/upload-batch"}'
+        batches = self.sample("thesis_batch_documents_count")
+        ok = self.sample('thesis_batch_results_total{status="200"}')
+        refused = self.sample('thesis_batch_results_total{status="400"}')
+
+        client.post("/upload-batch", files=[("files", ("a.docx", thesis_docx)), ("files", ("b.txt", b"x"))])
+
+        assert self.sample(in_flight) == 0
+        assert self.sample("thesis_batch_documents_count") == batches + 1
+        assert self.sample('thesis_batch_results_total{status="200"}') == ok + 1
+        assert self.sample('thesis_batch_results_total{status="400"}') == refused + 1
+
+    def test_supabase_requests_recorded(self):
+        """Test the save queue's request callback"""
+        latency = 'thesis_supabase_request_duration_seconds_count{operation="documents"}'
+        failures = 'thesis_supabase_request_errors_total{operation="documents"}'
+        before = self.sample(latency), self.sample(failures)
+
+        main.persistence_queue.on_request("documents", 0.02, None)
+        main.persistence_queue.on_request("documents", 0.02, ConnectionError("reset"))
+
+        assert (self.sample(latency), self.sample(failures)) == (before[0] + 2, before[1] + 1)
+
+
+class TestProfiling:
+    """Test admin-only request profiling"""
+
+    ADMIN = {"X-Admin-Token": "secret"}
+
+    @pytest.fixture
+    def client(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+        monkeypatch.setattr(main, "PROFILE_INTERVAL", 0.001)
+        monkeypatch.setattr(main, "profile_store", main.profiling.ProfileStore(str(tmp_path / "profiles")))
+        with TestClient(app) as client:
+            yield client
+
+    def test_profiled_upload(self, client, thesis_docx):
+        """Test that the report covers the pool call and can be fetched by id"""
+        response = client.post("/upload-docx?profile=true", headers=self.ADMIN,
+                               files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 200
+        assert response.json()["notranja_naslovna"]["student"] == "Janez Novak"
+        profile = client.get(f"/profiles/{response.headers['X-Profile-Id']}", headers=self.ADMIN).json()
+        assert profile["endpoint"] == "/upload-docx" and profile["filename"] == "thesis.docx"
+        [call] = profile["calls"]
+        assert call["function"] == "_analyze_docx"
+        assert "check_sections" in [name for name, _ in call["stages"]]
+        assert call["memory"]["peak_bytes"] > 0
+
+    def test_cache_bypassed(self, client, thesis_docx):
+        client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        response = client.post("/upload-docx?profile=true", headers=self.ADMIN,
+                               files={"file": ("thesis.docx", thesis_docx)})
+
+        profile = client.get(f"/profiles/{response.headers['X-Profile-Id']}", headers=self.ADMIN).json()
+        assert len(profile["calls"]) == 1
+
+    def test_failed_upload_profiled(self, client):
+        """Test that a document failing in the worker still leaves its profile"""
+        response = client.post("/upload-docx?profile=true", headers=self.ADMIN,
+                               files={"file": ("broken.docx", b"not a docx")})
+
+        assert response.status_code == 400
+        [name] = os.listdir(main.profile_store.directory)
+        profile = client.get(f"/profiles/{name[:-5]}", headers=self.ADMIN).json()
+        assert "Error reading DOCX" in profile["error"]
+        assert profile["calls"][0]["function"] == "_analyze_docx"
+
+    def test_collapsed_format(self, client, thesis_docx):
+        response = client.post("/upload-docx?profile=true", headers=self.ADMIN,
+                               files={"file": ("thesis.docx", thesis_docx)})
+
+        stacks = client.get(f"/profiles/{response.headers['X-Profile-Id']}?format=collapsed",
+                            headers=self.ADMIN)
+
+        assert stacks.headers["content-type"].startswith("text/plain")
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks.text.splitlines())
+
+    def test_admin_only(self, client, monkeypatch, thesis_docx):
+        files = {"file": ("thesis.docx", thesis_docx)}
+
+        assert client.post("/upload-docx?profile=true", files=files).status_code == 403
+        assert client.post("/upload-docx?profile=true", files=files,
+                           headers={"X-Admin-Token": "wrong"}).status_code == 403
+        assert client.get(f"/profiles/{uuid.uuid4()}").status_code == 403
+        assert client.get(f"/profiles/{uuid.uuid4()}", headers=self.ADMIN).status_code == 404
+        assert "X-Profile-Id" not in client.post("/upload-docx", files=files).headers
+
+        monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+        assert client.post("/upload-docx?profile=true", files=files, headers=self.ADMIN).status_code == 403
+
+
+class TestDocumentRetrieval:
+    """Test paginated and projected document reads"""
+
+    @pytest.fixture
+    def client(self, fake_db):
+        fake_db.tables["documents"] = [{"id": "doc-1", "filename": "thesis.docx"}]
+        fake_db.tables["document_paragraphs"] = [
+            {"id": i, "document_id": "doc-1", "paragraph_order": i, "paragraph_id": f"p{i}",
+             "paragraph_style": "Normal", "content": f"Odstavek {i}"}
+            for i in reversed(range(25))
+        ] + [{"id": 99, "document_id": "doc-2", "paragraph_order": 0, "content": "Drug"}]
+        with TestClient(app) as client:
+            yield client
+
+    def test_first_page_with_document(self, client, fake_db):
+        """Test that the document row and first page come back together"""
+        response = client.get("/documents/doc-1?limit=10")
+
+        data = response.json()
+        assert data["document"]["filename"] == "thesis.docx"
+        assert [p["paragraph_order"] for p in data["document"]["paragraphs"]] == list(range(10))
+        assert data["next_cursor"] == 9
+        assert {table for table, _ in fake_db.queries} == {"documents", "document_paragraphs"}
+
+    def test_cursor_walks_all_pages(self, client):
+        """Test keyset pagination until the cursor runs out"""
+        orders, cursor = [], -1
+        while cursor is not None:
+            data = client.get(f"/documents/doc-1/paragraphs?after={cursor}&limit=10").json()
+            orders += [p["paragraph_order"] for p in data["paragraphs"]]
+            cursor = data["next_cursor"]
+
+        assert orders == list(range(25))
+
+    def test_exact_last_page_has_no_cursor(self, client):
+        data = client.get("/documents/doc-1/paragraphs?after=14&limit=10").json()
+
+        assert len(data["paragraphs"]) == 10
+        assert data["next_cursor"] is None
+
+    def test_fields_projection(self, client, fake_db):
+        """Test that fields= limits columns and always keeps the cursor"""
+        data = client.get("/documents/doc-1?fields=paragraph_style&limit=2").json()
+
+        assert data["document"]["paragraphs"] == [
+            {"paragraph_order": 0, "paragraph_style": "Normal"},
+            {"paragraph_order": 1, "paragraph_style": "Normal"},
+        ]
+        assert ("document_paragraphs", "paragraph_order,paragraph_style") in fake_db.queries
+
+    def test_internal_columns_not_read(self, client, fake_db):
+        """Test that index, hash and signature columns are left in the database"""
+        fake_db.tables["documents"][0].update(paragraph_hashes=["h"] * 25, minhash=[1] * 128)
+        fake_db.tables["document_paragraphs"][0]["search_terms"] = "odstav 0"
+        document = client.get("/documents/doc-1").json()["document"]
+
+        assert "paragraph_hashes" not in document and "minhash" not in document
+        assert not any("search_terms" in p for p in document["paragraphs"])
+        assert all(columns != "*" for _, columns in fake_db.queries)
+
+    def test_columns_match_saved_row(self):
+        """Test that reads cover every column a save writes, minus hashes and signature"""
+        revision = {"base_document_id": None, "paragraph_hashes": [], "paragraph_sources": None}
+        row = main._document_row("doc-1", "thesis.docx", "docx", {}, revision)
+
+        written = set(row) - {"paragraph_hashes", "minhash"} | {"created_at"}
+        assert len(main.DOCUMENT_COLUMNS) == len(set(main.DOCUMENT_COLUMNS))
+        assert set(main.DOCUMENT_COLUMNS) == written
+
+    def test_unknown_field_rejected(self, client):
+        response = client.get("/documents/doc-1?fields=content,secret")
+
+        assert response.status_code == 400
+        assert "secret" in response.json()["detail"]
+
+    def test_missing_document(self, client):
+        assert client.get("/documents/nope").status_code == 404
+
+    def test_page_size_bounds(self, client):
+        assert client.get(f"/documents/doc-1?limit={main.MAX_PARAGRAPH_PAGE_SIZE + 1}").status_code == 422
+
+
+class TestRevisions:
+    """Test revised uploads stored as a delta against their base"""
+
+    @pytest.fixture
+    def client(self, monkeypatch, fake_db):
+        async def connect():
+            return fake_db
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "persistence_queue", main.WriteBehindQueue(connect, retry_delay=0))
+        with TestClient(app) as client:
+            yield client
+
+    def revise(self, thesis_docx):
+        """The fixture thesis with one paragraph edited and one added."""
+        doc = Document(io.BytesIO(thesis_docx))
+        for p in doc.paragraphs:
+            if p.text == "Cilj dela je razviti sistem.":
+                p.text = "Cilj dela je razviti in ovrednotiti sistem."
+                p.insert_paragraph_before("Novo poglavje besedila.")
+        buf = io.BytesIO()
+        doc.save(buf)
+        return buf.getvalue()
+
+    def upload(self, client, data, base=None):
+        url = "/upload-docx" + (f"?base_document_id={base}" if base else "")
+        response = client.post(url, files={"file": ("thesis.docx", data)})
+        assert response.status_code == 200
+        document_id = response.json()["document_id"]
+        while client.get(f"/documents/{document_id}/status").json()["status"] != "saved":
+            time.sleep(0.01)
+        return response.json()
+
+    def test_only_changes_stored(self, client, fake_db, thesis_docx):
+        """Test that a revision writes rows for new paragraphs only and reads back whole"""
+        base = self.upload(client, thesis_docx)
+        revision = self.upload(client, self.revise(thesis_docx), base["document_id"])
+
+        assert revision["revision"] == {"base_document_id": base["document_id"],
+                                        "paragraphs": len(revision["paragraphs"]), "stored_paragraphs": 2}
+        own = [row for row in fake_db.tables["document_paragraphs"]
+               if row["document_id"] == revision["document_id"]]
+        assert sorted(row["content"] for row in own) == ["Cilj dela je razviti in ovrednotiti sistem.",
+                                                         "Novo poglavje besedila."]
+
+        contents, cursor = [], -1
+        while cursor is not None:
+            data = client.get(f"/documents/{revision['document_id']}/paragraphs?after={cursor}&limit=7").json()
+            contents += [p["content"] for p in data["paragraphs"]]
+            assert {p["document_id"] for p in data["paragraphs"]} == {revision["document_id"]}
+            cursor = data["next_cursor"]
+        assert contents == [p["content"] for p in revision["paragraphs"]]
+
+        document = client.get(f"/documents/{revision['document_id']}?fields=content&limit=5").json()
+        assert document["document"]["base_document_id"] == base["document_id"]
+        assert "paragraph_hashes" not in document["document"]
+        assert [p["content"] for p in document["document"]["paragraphs"]] == contents[:5]
+
+    def test_base_cannot_be_deleted(self, client, thesis_docx):
+        base = self.upload(client, thesis_docx)
+        revision = self.upload(client, self.revise(thesis_docx), base["document_id"])
+
+        assert client.delete(f"/documents/{base['document_id']}").status_code == 409
+        assert client.delete(f"/documents/{revision['document_id']}").status_code == 200
+        assert client.delete(f"/documents/{base['document_id']}").status_code == 200
+
+    def test_unknown_base(self, client, thesis_docx):
+        response = client.post("/upload-docx?base_document_id=nope", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 404
+
+
+def uid(i):
+    """Document id that sorts by `i`."""
+    return str(uuid.UUID(int=i))
+
+
+class TestDocumentListing:
+    """Test document list pagination, filters and conditional GET"""
+
+    @pytest.fixture
+    def client(self, fake_db):
+        fake_db.tables["document_summary"] = [
+            {"id": uid(i), "document_type": "Magistrsko delo" if i % 2 else "Diplomsko delo",
+             # Pairs of documents share a timestamp to exercise the id tie-break
+             "created_at": f"2024-05-{i // 2 + 1:02d}T10:00:00"}
+            for i in range(20)
+        ]
+        fake_db.tables["documents"] = [{"id": uid(0)}]
+        with TestClient(app) as client:
+            yield client
+
+    def walk(self, client, query=""):
+        ids, cursor = [], None
+        while True:
+            url = f"/documents?limit=3{query}" + (f"&cursor={cursor}" if cursor else "")
+            data = client.get(url).json()
+            ids += [d["id"] for d in data["documents"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_cursor_pages_newest_first(self, client):
+        """Test that pages cover every document once, ties broken by id"""
+        assert self.walk(client) == [uid(i) for i in reversed(range(20))]
+
+    def test_filters(self, client):
+        """Test document_type and created_at range filters together"""
+        ids = self.walk(client, "&document_type=Magistrsko delo"
+                                "&created_from=2024-05-03T00:00:00&created_to=2024-05-06T00:00:00")
+
+        assert ids == [uid(9), uid(7), uid(5)]
+
+    def test_invalid_cursor(self, client):
+        assert client.get("/documents?cursor=not-a-cursor").status_code == 400
+
+    def test_cursor_cannot_inject_filters(self, client, fake_db):
+        """Test that cursor values must be a timestamp and a UUID"""
+        for values in (['2024-05-05T10:00:00",id.gt."0', uid(1)],
+                       ["2024-05-05T10:00:00", uid(1) + '"),id.gt.("0'],
+                       [None, uid(1)]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            queries = len(fake_db.queries)
+
+            assert client.get(f"/documents?cursor={cursor}").status_code == 400
+            assert len(fake_db.queries) == queries
+
+    def test_cursor_timestamp_forms(self):
+        """Test the timestamp forms PostgREST returns, reserialized"""
+        assert main._decode_cursor(main._encode_cursor({"created_at": "2024-05-01T10:00:00.12345Z", "id": uid(1)})) \
+            == ("2024-05-01T10:00:00.123450+00:00", uid(1))
+
+    def test_not_modified(self, client, fake_db):
+        """Test If-None-Match with the returned ETag answers 304 from the cache"""
+        first = client.get("/documents")
+        queries = len(fake_db.queries)
+
+        second = client.get("/documents", headers={"If-None-Match": first.headers["etag"]})
+
+        assert second.status_code == 304
+        assert second.headers["etag"] == first.headers["etag"]
+        assert len(fake_db.queries) == queries
+
+    def test_etag_survives_cache_expiry(self, client, monkeypatch):
+        """Test that unchanged data still yields 304 after the TTL"""
+        monkeypatch.setattr(main, "documents_cache", main.ResponseCache(0))
+        etag = client.get("/documents").headers["etag"]
+
+        response = client.get("/documents", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+
+    def test_delete_invalidates(self, client, fake_db):
+        """Test that deleting a document drops cached pages"""
+        etag = client.get("/documents").headers["etag"]
+        fake_db.tables["document_summary"].pop()
+
+        assert client.delete(f"/documents/{uid(0)}").status_code == 200
+        response = client.get("/documents", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_saved_upload_invalidates(self, client, fake_db):
+        """Test that the persistence hook drops cached pages"""
+        client.get("/documents")
+        queries = len(fake_db.queries)
+
+        main.persistence_queue.on_saved("doc-new")
+        client.get("/documents")
+
+        assert len(fake_db.queries) == queries + 1
+
+
+class TestSearch:
+    """Test full-text search over saved paragraphs"""
+
+    @pytest.fixture
+    def client(self, monkeypatch, fake_db):
+        async def connect():
+            return fake_db
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "persistence_queue", main.WriteBehindQueue(connect, retry_delay=0))
+        with TestClient(app) as client:
+            yield client
+
+    @pytest.fixture
+    def document_id(self, client, thesis_docx):
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+        document_id = response.json()["document_id"]
+        while client.get(f"/documents/{document_id}/status").json()["status"] != "saved":
+            time.sleep(0.01)
+        return document_id
+
+    def test_inflected_query(self, client, fake_db, document_id):
+        """Test that other forms of the words and no diacritics still match"""
+        data = client.get("/search?q=nevronskih mrez").json()
+
+        assert data["terms"] == ["nevronsk", "mrez"]
+        [result] = data["results"]
+        row = next(row for row in fake_db.tables["document_paragraphs"]
+                   if row["content"] == "2.1.1 Nevronske mreže")
+        assert result["document_id"] == document_id
+        assert result["paragraph_order"] == row["paragraph_order"]
+        assert result["snippet"] == "2.1.1 Nevronske mreže"
+        assert [result["snippet"][s:e] for s, e in result["highlights"]] == ["Nevronske", "mreže"]
+        assert data["next_offset"] is None
+
+    def test_ranked_pages(self, client, document_id):
+        """Test that paragraphs with more matches come first and pages follow on"""
+        first = client.get("/search?q=delo&limit=1").json()
+        rest = client.get(f"/search?q=delo&offset={first['next_offset']}").json()
+
+        ranks = [r["rank"] for r in first["results"] + rest["results"]]
+        assert len(ranks) > 2
+        assert ranks == sorted(ranks, reverse=True)
+        assert rest["next_offset"] is None
+
+    def test_no_words(self, client):
+        assert client.get("/search?q=...").status_code == 400
+
+    def test_index_columns_not_returned(self, client, document_id):
+        paragraphs = client.get(f"/documents/{document_id}/paragraphs").json()["paragraphs"]
+
+        assert paragraphs and not any("search_terms" in p for p in paragraphs)
+
+
+class TestSimilarDocuments:
+    """Test near-duplicate lookup of saved documents"""
+
+    SHARED = [
+        "V tem poglavju opisujemo zbiranje podatkov iz javno dostopnih virov, njihovo čiščenje "
+        "in pripravo za učenje modelov, ki jih primerjamo v nadaljevanju dela.",
+        "Rezultati kažejo, da se nevronske mreže pri razvrščanju krajših besedil odrežejo bolje "
+        "od klasičnih metod, pri daljših besedilih pa je razlika zanemarljiva.",
+    ]
+    OTHER = [
+        "Vinogradništvo na Štajerskem ima dolgo tradicijo, ki sega v rimske čase in se je skozi "
+        "stoletja prilagajala podnebju, tlom in okusom kupcev na bližnjih trgih.",
+        "Anketa med pridelovalci je pokazala, da večina pričakuje večje spremembe zaradi toplejših "
+        "poletij, zato že zdaj sadijo sorte, ki bolje prenašajo sušo in vročino.",
+    ]
+
+    @pytest.fixture
+    def client(self, monkeypatch, fake_db):
+        async def connect():
+            return fake_db
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "persistence_queue", main.WriteBehindQueue(connect, retry_delay=0))
+        with TestClient(app) as client:
+            yield client
+
+    def upload(self, client, thesis_docx, extra):
+        doc = Document(io.BytesIO(thesis_docx))
+        for text in extra:
+            doc.add_paragraph(text)
+        buf = io.BytesIO()
+        doc.save(buf)
+        response = client.post("/upload-docx", files={"file": ("thesis.docx", buf.getvalue())})
+        document_id = response.json()["document_id"]
+        while client.get(f"/documents/{document_id}/status").json()["status"] != "saved":
+            time.sleep(0.01)
+        return response.json()
+
+    def test_shared_paragraphs_found(self, client, fake_db, thesis_docx):
+        original = self.upload(client, thesis_docx, self.SHARED)
+        other = self.upload(client, thesis_docx, self.OTHER)
+        copy = self.upload(client, thesis_docx, [self.SHARED[0], self.SHARED[1].replace("bolje", "precej bolje")])
+
+        data = client.get(f"/documents/{copy['document_id']}/similar").json()
+
+        assert [d["document_id"] for d in data["documents"]][:1] == [original["document_id"]]
+        first = data["documents"][0]
+        assert first["shared_paragraphs"] == 2
+        assert first["similarity"] > 0.5
+        assert first["filename"] == "thesis.docx"
+        assert {d["document_id"]: d["shared_paragraphs"] for d in data["documents"]}.get(other["document_id"], 0) == 0
+        exact, edited = data["paragraphs"]
+        assert exact["similarity"] == 1.0
+        assert exact["content"] == exact["match_content"] == self.SHARED[0]
+        assert exact["document_id"] == original["document_id"]
+        assert 0.5 <= edited["similarity"] < 1.0
+        assert "minhash" not in client.get(f"/documents/{copy['document_id']}").json()["document"]
+
+    def test_common_keys_skipped(self, client, monkeypatch, thesis_docx):
+        """Test that band keys held by too many rows yield no candidates"""
+        monkeypatch.setattr(main, "SIMILAR_MAX_KEY_ROWS", 2)
+        self.upload(client, thesis_docx, self.SHARED)
+        self.upload(client, thesis_docx, [self.SHARED[0]] + self.OTHER)
+        copy = self.upload(client, thesis_docx, self.SHARED)
+
+        data = client.get(f"/documents/{copy['document_id']}/similar").json()
+
+        assert [p["content"] for p in data["paragraphs"]] == [self.SHARED[1]]
+
+    def test_unknown_document(self, client):
+        assert client.get("/documents/nope/similar").status_code == 404
+
+
 class TestStructureMetrics:
     """Test structure analysis and scoring"""
     
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import metrics
+from metrics import Registry, collect_stages, stage
+
+
+class TestRegistry:
+    """Test metric types and the Prometheus text format"""
+
+    def test_counter_and_gauge(self):
+        registry = Registry()
+        errors = registry.counter("errors_total", "Errors", ["endpoint", "status"])
+        in_flight = registry.gauge("in_flight", "Requests in flight")
+
+        errors.labels("/upload-docx", "400").inc()
+        errors.labels("/upload-docx", "400").inc(2)
+        in_flight.inc()
+        in_flight.inc()
+        in_flight.dec()
+
+        assert registry.render() == (
+            "# HELP errors_total Errors\n"
+            "# TYPE errors_total counter\n"
+            'errors_total{endpoint="/upload-docx",status="400"} 3\n'
+            "# HELP in_flight Requests in flight\n"
+            "# TYPE in_flight gauge\n"
+            "in_flight 1\n"
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1))
+
+        child = latency.labels("parse")
+        for value in (0.05, 0.1, 0.5, 3):
+            child.observe(value)
+
+        lines = registry.render().splitlines()[2:]
+        assert lines == [
+            'latency_seconds_bucket{stage="parse",le="0.1"} 2',
+            'latency_seconds_bucket{stage="parse",le="1"} 3',
+            'latency_seconds_bucket{stage="parse",le="+Inf"} 4',
+            'latency_seconds_sum{stage="parse"} 3.65',
+            'latency_seconds_count{stage="parse"} 4',
+        ]
+
+    def test_label_values_escaped(self):
+        registry = Registry()
+        registry.counter("odd_total", "Odd labels", ["name"]).labels('a "b"\\\n').inc()
+
+        assert 'odd_total{name="a \\"b\\"\\\\\\n"} 1' in registry.render()
+
+    def test_label_checks(self):
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests", ["status"])
+
+        with pytest.raises(ValueError):
+            counter.labels("200", "extra")
+        with pytest.raises(ValueError):
+            counter.labels(200)
+        with pytest.raises(ValueError):
+            registry.gauge("requests_total", "Again")
+
+    def test_concurrent_updates(self):
+        registry = Registry()
+        histogram = registry.histogram("work_seconds", "Work")
+
+        def work():
+            for _ in range(10000):
+                histogram.observe(0.002)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert "work_seconds_count 40000" in registry.render()
+
+
+class TestStages:
+    """Test stage timings carried back from pool workers"""
+
+    def test_collect_stages(self):
+        def work(n):
+            with stage("parse"):
+                with stage("inner"):
+                    pass
+            with stage("check"):
+                return n * 2
+
+        result, stages = collect_stages(work, 21)
+
+        assert result == 42
+        assert [name for name, _ in stages] == ["inner", "parse", "check"]
+        assert all(seconds >= 0 for _, seconds in stages)
+
+    def test_stage_outside_collection_is_free(self):
+        with stage("parse"):
+            pass
+
+        assert getattr(metrics._local, "timings", None) is None
+
+    def test_failed_call_restores_state(self):
+        def fail():
+            with stage("parse"):
+                raise ValueError("bad")
+
+        with pytest.raises(ValueError):
+            collect_stages(fail)
+        assert metrics._local.timings is None
@@ -0,0 +1,146 @@
+import asyncio
+
+from docx import Document
+from fastapi.testclient import TestClient
+from pdf2docx import Converter
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+from main import (app, _analyze_pdf, _iter_styled_text, _page_ranges,
+                  _convert_pdf_parallel, _convert_pdf_range)
+from pdf_extract import extract_styled_text, _infer_styles
+
+
+class TestExtractParagraphs:
+    """Test PyMuPDF paragraph extraction"""
+
+    def test_styled_text(self, thesis_pdf):
+        """Test that pairs have the same shape as _iter_styled_text"""
+        paragraphs = extract_styled_text(thesis_pdf)
+
+        assert paragraphs[0][1] == "Janez Novak"
+        assert "Studijski program: Racunalnistvo in informacijske tehnologije" in \
+            [text for _, text in paragraphs]
+
+    def test_heading_levels(self, thesis_pdf):
+        """Test heading inference from font size and cover page handling"""
+        paragraphs = extract_styled_text(thesis_pdf)
+        styles = {text: style for style, text in paragraphs}
+
+        assert paragraphs[1][0] == "Heading 1"
+        assert styles["KAZALO VSEBINE"] == "Heading 1"
+        assert styles["1. UVOD"] == "Heading 1"
+        assert styles["1.1 Cilji"] == "Heading 2"
+        assert styles["Cilj dela je razviti sistem."] == "Normal"
+
+    def test_page_range(self, thesis_pdf):
+        """Test extraction limited to the first page"""
+        paragraphs = extract_styled_text(thesis_pdf, pages=range(1))
+
+        assert paragraphs[0][1] == "Janez Novak"
+        assert "1. UVOD" not in [text for _, text in paragraphs]
+
+    def test_bold_body_lines(self):
+        """Test that short bold lines at body size become the next heading level"""
+        paras = [
+            ["Body text " * 20, 11, False, 0],
+            ["1. Poglavje", 16, True, 1],
+            ["2. Poglavje", 16, True, 2],
+            ["Pomembno", 11, True, 2],
+        ]
+
+        styles = [style for _, style in _infer_styles(paras)]
+
+        assert styles == ["Normal", "Heading 1", "Heading 1", "Heading 2"]
+
+
+class TestPdfEngines:
+    """Test engine selection and parity with the pdf2docx path"""
+
+    def test_content_parity_with_pdf2docx(self, thesis_pdf, tmp_path):
+        """Test that both engines read the same text from the PDF"""
+        docx_path = str(tmp_path / "thesis.docx")
+        cv = Converter(thesis_pdf)
+        cv.convert(docx_path)
+        cv.close()
+
+        words = lambda pairs: " ".join(text for _, text in pairs).split()
+        assert words(extract_styled_text(thesis_pdf)) == \
+            words(_iter_styled_text(Document(docx_path)))
+
+    def test_native_engine_analysis(self, thesis_pdf):
+        """Test that line-level paragraphs keep title page fields apart"""
+        result = _analyze_pdf(thesis_pdf, "pymupdf")
+
+        assert result["notranja_naslovna"]["type"] == "Magistrsko delo"
+        assert result["notranja_naslovna"]["mentor"] == "red. prof. dr. Ana Kos"
+        assert result["front_matter_found"]["Naslovna stran na platnici"] is True
+        assert result["body_sections_found"]["Pregled literature"] is True
+
+    def test_upload_pdf_engine_parameter(self, monkeypatch, thesis_pdf):
+        """Test per-request engine selection and validation"""
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        with open(thesis_pdf, "rb") as f:
+            data = f.read()
+
+        with TestClient(app) as client:
+            ok = client.post("/upload-pdf?engine=pymupdf", files={"file": ("thesis.pdf", data)})
+            bad = client.post("/upload-pdf?engine=ocr", files={"file": ("thesis.pdf", data)})
+
+        assert ok.status_code == 200
+        assert ok.json()["notranja_naslovna"]["type"] == "Magistrsko delo"
+        assert bad.status_code == 400
+
+
+class TestParallelConversion:
+    """Test page-range parallel pdf2docx conversion"""
+
+    def test_page_ranges(self):
+        """Test range splitting with the minimum range size"""
+        assert _page_ranges(300, 4) == [(0, 75), (75, 150), (150, 225), (225, 300)]
+        assert _page_ranges(7, 3) == [(0, 4), (4, 7)]
+        assert _page_ranges(2, 8) == [(0, 2)]
+        assert _page_ranges(0, 4) == []
+
+    def test_parallel_matches_sequential(self, monkeypatch, thesis_pdf):
+        """Test that merged page ranges give the same paragraphs and analysis"""
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "PDF_CONVERT_PARALLELISM", 3)
+        monkeypatch.setattr(main, "MIN_PAGES_PER_RANGE", 1)
+
+        merged = asyncio.run(_convert_pdf_parallel(thesis_pdf))
+        sequential = _convert_pdf_range(thesis_pdf)
+
+        assert merged == sequential
+
+    def test_upload_pdf_parallel(self, monkeypatch, thesis_pdf):
+        """Test the endpoint with conversion split across the pool"""
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "PDF_CONVERT_PARALLELISM", 2)
+        monkeypatch.setattr(main, "MIN_PAGES_PER_RANGE", 1)
+        with open(thesis_pdf, "rb") as f:
+            data = f.read()
+
+        with TestClient(app) as client:
+            response = client.post("/upload-pdf?engine=pdf2docx", files={"file": ("thesis.pdf", data)})
+
+        expected = _analyze_pdf(thesis_pdf, "pdf2docx")
+        assert response.status_code == 200
+        assert response.json()["front_matter_found"] == expected["front_matter_found"]
+        assert response.json()["uvod"] == expected["uvod"]
+
+    def test_unreadable_pdf(self, monkeypatch, tmp_path):
+        """Test that a corrupt PDF fails before any range is converted"""
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "PDF_CONVERT_PARALLELISM", 2)
+        with TestClient(app) as client:
+            response = client.post("/upload-pdf", files={"file": ("broken.pdf", b"not a pdf")})
+
+        assert response.status_code == 500
+        assert response.json()["detail"].startswith("Conversion failed")
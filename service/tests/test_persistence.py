@@ -0,0 +1,287 @@
+import asyncio
+import json
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import main
+from persistence import WriteBehindQueue, batch_rows
+
+
+class FakeQuery:
+    def __init__(self, client, table, op, payload=None, **options):
+        self.client = client
+        self.call = [table, op, payload]
+        self.options = options
+
+    def eq(self, column, value):
+        self.call.append((column, value))
+        return self
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        if self.client.failures:
+            self.client.failures -= 1
+            raise ConnectionError("connection reset")
+        self.client.calls.append(tuple(self.call))
+        self.client.options.append(self.options)
+        return self
+
+
+class FakeTable:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def upsert(self, payload, **options):
+        return FakeQuery(self.client, self.name, "upsert", payload, **options)
+
+    def delete(self):
+        return FakeQuery(self.client, self.name, "delete")
+
+
+class FakeAsyncClient:
+    """Records calls the way the Supabase async client would make them."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.options = []
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+    def rpc(self, fn, params):
+        return FakeQuery(self, fn, "rpc", params)
+
+
+def make_queue(client, **kwargs):
+    async def connect():
+        return client
+    return WriteBehindQueue(connect, retry_delay=0, **kwargs)
+
+
+def paragraph_rows(document_id, n):
+    return [{"document_id": document_id, "paragraph_order": i, "content": "x" * 80}
+            for i in range(n)]
+
+
+async def save(queue, document_id="doc-1", paragraphs=250):
+    await queue.start()
+    rows = paragraph_rows(document_id, paragraphs)
+    status = await queue.enqueue(document_id, {"id": document_id}, rows)
+    await queue.stop()
+    return status
+
+
+class TestWriteBehindQueue:
+    """Test background saving, retries and job status"""
+
+    def test_saves_document_then_paragraph_batches(self):
+        """Test the document row goes first and paragraphs follow in byte-sized batches"""
+        client = FakeAsyncClient()
+        queue = make_queue(client, batch_bytes=100 * 120)
+
+        status = asyncio.run(save(queue))
+
+        assert status["status"] == "pending"
+        assert client.calls[0][:2] == ("documents", "upsert")
+        batches = [call[2] for call in client.calls[1:]]
+        assert all(call[:2] == ("document_paragraphs", "upsert") for call in client.calls[1:])
+        assert sorted(row["paragraph_order"] for batch in batches for row in batch) == list(range(250))
+        assert len(batches) == 3
+        assert client.options[1]["on_conflict"] == "document_id,paragraph_order"
+        assert queue.status("doc-1") == {"document_id": "doc-1", "status": "saved",
+                                         "attempts": 1, "error": None}
+
+    def test_failed_batch_retried_alone(self):
+        """Test that a transient batch failure does not restart the whole job"""
+        client = FakeAsyncClient(failures=1)
+        queue = make_queue(client)
+
+        asyncio.run(save(queue, paragraphs=10))
+
+        assert [call[:2] for call in client.calls] == [("documents", "upsert"),
+                                                       ("document_paragraphs", "upsert")]
+        assert queue.status("doc-1")["attempts"] == 1
+        assert queue.status("doc-1")["status"] == "saved"
+
+    def test_job_retried_after_batch_attempts(self):
+        """Test that the job is replayed once a batch runs out of retries"""
+        client = FakeAsyncClient(failures=3)
+        queue = make_queue(client, batch_attempts=3)
+
+        asyncio.run(save(queue, paragraphs=10))
+
+        assert queue.status("doc-1")["attempts"] == 2
+        assert queue.status("doc-1")["status"] == "saved"
+
+    def test_single_rpc_call(self):
+        """Test sending every paragraph through one database function call"""
+        client = FakeAsyncClient()
+        queue = make_queue(client, rpc="insert_document_paragraphs")
+
+        asyncio.run(save(queue))
+
+        assert [call[:2] for call in client.calls] == [("documents", "upsert"),
+                                                       ("insert_document_paragraphs", "rpc")]
+        params = client.calls[1][2]
+        assert params["p_document_id"] == "doc-1"
+        assert len(params["p_paragraphs"]) == 250
+
+    def test_gives_up_after_max_attempts(self):
+        """Test that persistent errors mark the job failed"""
+        client = FakeAsyncClient(failures=100)
+        queue = make_queue(client, max_attempts=3, batch_attempts=1)
+
+        asyncio.run(save(queue))
+
+        status = queue.status("doc-1")
+        assert status["status"] == "failed"
+        assert status["attempts"] == 3
+        assert status["error"] == "connection reset"
+
+    def test_wait_for_save(self):
+        """Test waiting until a queued save has finished"""
+        client = FakeAsyncClient(failures=1)
+        queue = make_queue(client, batch_attempts=1)
+
+        async def run():
+            await queue.start()
+            await queue.enqueue("doc-1", {"id": "doc-1"}, paragraph_rows("doc-1", 10))
+            status = await queue.wait("doc-1")
+            await queue.stop()
+            return status
+
+        status = asyncio.run(run())
+        assert status["status"] == "saved"
+        assert status["attempts"] == 2
+        assert asyncio.run(queue.wait("unknown")) is None
+
+    def test_requests_reported(self):
+        """Test that every database request, failed attempts included, is timed"""
+        client = FakeAsyncClient(failures=1)
+        requests = []
+        queue = make_queue(client, on_request=lambda *args: requests.append(args))
+
+        asyncio.run(save(queue, paragraphs=10))
+
+        assert [(operation, error is None) for operation, _, error in requests] == [
+            ("documents", False), ("documents", True), ("document_paragraphs", True)]
+        assert all(seconds >= 0 for _, seconds, _ in requests)
+
+    def test_disabled_without_connection(self):
+        """Test that a queue without a database accepts nothing"""
+        queue = WriteBehindQueue(None)
+
+        assert asyncio.run(save(queue)) is None
+        assert queue.status("doc-1") is None
+
+    def test_status_history_is_bounded(self):
+        """Test that old job statuses are forgotten first"""
+        queue = make_queue(FakeAsyncClient(), status_limit=2)
+
+        async def run():
+            await queue.start()
+            for i in range(3):
+                await queue.enqueue(f"doc-{i}", {"id": f"doc-{i}"}, [])
+            await queue.stop()
+        asyncio.run(run())
+
+        assert queue.status("doc-0") is None
+        assert queue.status("doc-2")["status"] == "saved"
+
+    def test_rows_prepared_by_worker(self):
+        """Test that a job's rows can be built in the worker, and a failure there fails the job"""
+        client = FakeAsyncClient()
+        queue = make_queue(client)
+
+        async def prepare():
+            return {"id": "doc-1"}, paragraph_rows("doc-1", 3), []
+
+        async def broken():
+            raise ValueError("no rows")
+
+        async def run():
+            await queue.start()
+            await queue.enqueue("doc-1", prepare=prepare)
+            await queue.enqueue("doc-2", prepare=broken)
+            await queue.stop()
+        asyncio.run(run())
+
+        assert queue.status("doc-1")["status"] == "saved"
+        assert [call[:2] for call in client.calls] == [("documents", "upsert"), ("document_paragraphs", "upsert")]
+        assert queue.status("doc-2") == {"document_id": "doc-2", "status": "failed", "attempts": 0,
+                                         "error": "no rows"}
+
+
+class TestBatchRows:
+    """Test payload-size batching"""
+
+    def test_batches_respect_byte_and_row_limits(self):
+        rows = [{"paragraph_style": "Normal", "content": "x" * 80}] * 50
+        size = len(json.dumps(rows[0]).encode())
+
+        by_bytes = list(batch_rows(rows, size * 20, 1000))
+        by_rows = list(batch_rows(rows, 10 ** 9, 15))
+
+        assert [len(b) for b in by_bytes] == [20, 20, 10]
+        assert [len(b) for b in by_rows] == [15, 15, 15, 5]
+
+    def test_oversized_row_gets_own_batch(self):
+        rows = [{"content": "x" * 1000}, {"content": "y"}]
+
+        assert [len(b) for b in batch_rows(rows, 100, 10)] == [1, 1]
+
+
+class TestUploadPersistence:
+    """Test that uploads return before their rows are written"""
+
+    def test_upload_returns_pending_document_id(self, monkeypatch, thesis_docx):
+        from fastapi.testclient import TestClient
+
+        client_db = FakeAsyncClient()
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "persistence_queue", make_queue(client_db))
+
+        with TestClient(main.app) as client:
+            response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+            document_id = response.json()["document_id"]
+            missing = client.get("/documents/unknown/status")
+
+        assert response.json()["save_status"] == "pending"
+        assert missing.status_code == 404
+        # Shutdown drains the queue
+        assert main.persistence_queue.status(document_id)["status"] == "saved"
+        document = client_db.calls[0][2]
+        assert document["id"] == document_id
+        assert document["student_name"] == "Janez Novak"
+        paragraphs = client_db.calls[1][2]
+        assert paragraphs[0] == {"document_id": document_id, "paragraph_order": 0,
+                                 "paragraph_id": response.json()["paragraphs"][0]["id"],
+                                 "paragraph_style": "Heading 1", "content": "Zahvala",
+                                 "search_terms": "zahval"}
+
+    def test_fingerprint_failure_still_saves(self, monkeypatch, thesis_docx):
+        """Test that a failed fingerprint neither fails the upload nor the save"""
+        from fastapi.testclient import TestClient
+
+        def broken(texts, stored=None):
+            raise MemoryError("too big")
+
+        client_db = FakeAsyncClient()
+        monkeypatch.setattr(main, "ANALYSIS_WORKERS", 0)
+        monkeypatch.setattr(main, "persistence_queue", make_queue(client_db))
+        monkeypatch.setattr(main.similarity, "fingerprint", broken)
+
+        with TestClient(main.app) as client:
+            response = client.post("/upload-docx", files={"file": ("thesis.docx", thesis_docx)})
+
+        assert response.status_code == 200
+        assert main.persistence_queue.status(response.json()["document_id"])["status"] == "saved"
+        assert client_db.calls[0][2]["minhash"] is None
+        assert [call[0] for call in client_db.calls] == ["documents", "document_paragraphs"]
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from profiling import ProfileStore, SamplingProfiler, profile_call
+
+
+def busy(seconds):
+    """CPU-bound work in a recognizable function."""
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(1000))
+    return total
+
+
+def allocate():
+    return [str(i) * 10 for i in range(20000)]
+
+
+def fail():
+    busy(0.05)
+    raise ValueError("unreadable")
+
+
+class TestProfileCall:
+    """Test running a worker function under the profiler"""
+
+    def test_samples_and_allocations(self):
+        result, report = profile_call(lambda: (busy(0.2), allocate())[1], interval=0.002)
+
+        assert len(result) == 20000
+        assert report["clock"] == "cpu"
+        assert report["samples"] > 10
+        assert report["top_total"][0]["percent"] == 100.0
+        assert any(entry["function"].startswith("busy ") for entry in report["top_self"])
+        assert "busy (tests/test_profiling.py)" in report["collapsed"]
+        assert report["memory"]["peak_bytes"] > 20000 * 50
+        assert "test_profiling.py" in report["memory"]["top_allocations"][0]["location"]
+
+    def test_profiler_frames_left_out(self):
+        _, report = profile_call(busy, (0.1,), interval=0.002)
+
+        assert "profile_call" not in report["collapsed"]
+        assert all(line.startswith("busy ") for line in report["collapsed"].splitlines())
+
+    def test_other_threads_sampled_on_wall_clock(self):
+        reports = []
+        thread = threading.Thread(target=lambda: reports.append(profile_call(busy, (0.2,), 0.002)[1]))
+        thread.start()
+        thread.join()
+
+        assert reports[0]["clock"] == "wall"
+        assert reports[0]["samples"] > 10
+        assert reports[0]["top_self"][0]["function"].startswith("busy ")
+
+    def test_failure_carries_report(self):
+        with pytest.raises(ValueError) as info:
+            profile_call(fail, interval=0.002)
+
+        assert info.value.profile["error"] == "ValueError('unreadable')"
+        assert info.value.profile["samples"] > 0
+
+    def test_signal_handler_restored(self):
+        import signal
+        before = signal.getsignal(signal.SIGPROF)
+
+        with SamplingProfiler(0.002):
+            busy(0.01)
+
+        assert signal.getsignal(signal.SIGPROF) is before
+
+
+class TestProfileStore:
+    """Test keeping reports on disk"""
+
+    def test_save_and_get(self, tmp_path):
+        store = ProfileStore(str(tmp_path / "profiles"))
+        profile_id = str(uuid.uuid4())
+
+        store.save(profile_id, {"profile_id": profile_id, "calls": []})
+
+        assert store.get(profile_id) == {"profile_id": profile_id, "calls": []}
+        assert store.get(str(uuid.uuid4())) is None
+
+    def test_ids_cannot_leave_directory(self, tmp_path):
+        store = ProfileStore(str(tmp_path))
+
+        assert store.get("../secrets") is None
+        with pytest.raises(ValueError):
+            store.save("../secrets", {})
+
+    def test_oldest_pruned(self, tmp_path):
+        store = ProfileStore(str(tmp_path), max_profiles=2)
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        for i, profile_id in enumerate(ids):
+            store.save(profile_id, {"n": i})
+            os.utime(store._path(profile_id), (i, i))
+
+        assert store.get(ids[0]) is None
+        assert [store.get(profile_id) for profile_id in ids[1:]] == [{"n": 1}, {"n": 2}]
@@ -0,0 +1,83 @@
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from revisions import paragraph_hash, paragraph_hashes, plan_delta, locate_range
+
+
+def hashes(texts):
+    return paragraph_hashes([{"style": "Normal", "content": t} for t in texts])
+
+
+def resolve(sources, count):
+    """`(source, source_order)` of every paragraph, via `locate_range`."""
+    located = locate_range(sources, 0, count)
+    where = {}
+    for source, rows in located.items():
+        for source_order, orders in rows.items():
+            for order in orders:
+                where[order] = (source, source_order)
+    return [where[order] for order in range(count)]
+
+
+class TestParagraphHash:
+    """Test the paragraph fingerprint"""
+
+    def test_style_and_content_count(self):
+        assert paragraph_hash("Normal", "Uvod") == paragraph_hash("Normal", "Uvod")
+        assert paragraph_hash("Normal", "Uvod") != paragraph_hash("Heading 1", "Uvod")
+        assert paragraph_hash("Normal", "Uvod") != paragraph_hash("Normal", "Uvod.")
+        assert len(paragraph_hash("Normal", "Uvod")) == 16
+
+
+class TestPlanDelta:
+    """Test matching a revision against its base"""
+
+    BASE = ["a", "b", "c", "d", "e"]
+
+    def test_unchanged(self):
+        sources, stored = plan_delta(hashes(self.BASE), "base", hashes(self.BASE))
+
+        assert sources == [[0, 5, "base", 0]]
+        assert stored == []
+
+    def test_edit_and_insert(self):
+        sources, stored = plan_delta(hashes(["a", "B", "c", "x", "d", "e"]), "base", hashes(self.BASE))
+
+        assert stored == [1, 3]
+        assert sources == [[0, 1, "base", 0], [1, 1, None, 1], [2, 1, "base", 2],
+                           [3, 1, None, 3], [4, 2, "base", 3]]
+
+    def test_moved_and_repeated_paragraphs(self):
+        base = ["h", "p", "h", "q"]
+        sources, stored = plan_delta(hashes(["h", "q", "h", "p"]), "base", hashes(base))
+
+        assert stored == []
+        # The second "h" follows the match of "q", so it takes the first occurrence
+        assert resolve(sources, 4) == [("base", 0), ("base", 3), ("base", 0), ("base", 1)]
+
+    def test_chain_refers_to_row_owners(self):
+        """Test that a revision of a revision points at the rows, not at its base"""
+        v2 = ["a", "B", "c", "d", "e"]
+        v2_sources, _ = plan_delta(hashes(v2), "v1", hashes(self.BASE))
+
+        v3_sources, stored = plan_delta(hashes(["a", "B", "c", "D"]), "v2", hashes(v2), v2_sources)
+
+        assert stored == [3]
+        assert resolve(v3_sources, 4) == [("v1", 0), ("v2", 1), ("v1", 2), (None, 3)]
+
+
+class TestLocateRange:
+    """Test mapping a page of paragraphs onto stored rows"""
+
+    SOURCES = [[0, 3, "base", 0], [3, 1, None, 3], [4, 4, "base", 3]]
+
+    def test_window(self):
+        assert locate_range(self.SOURCES, 2, 6) == {"base": {2: [2], 3: [4], 4: [5]}, None: {3: [3]}}
+
+    def test_past_the_end(self):
+        assert locate_range(self.SOURCES, 6, 20) == {"base": {5: [6], 6: [7]}}
+        assert locate_range(self.SOURCES, 8, 20) == {}
@@ -0,0 +1,58 @@
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from search import fold, stem, index_terms, query_terms, tsquery, snippet
+
+
+class TestNormalization:
+    """Test folding and stemming of Slovenian words"""
+
+    def test_fold(self):
+        assert fold("Čebelarstvo ŠTUDIJ Žaba ćevapi Đurđa") == "cebelarstvo studij zaba cevapi durda"
+
+    def test_inflected_forms_share_a_stem(self):
+        for forms in (["raziskovalna", "raziskovalnih", "raziskovalnega", "raziskovalnemu"],
+                      ["besedilo", "besedila", "besedil"],
+                      ["mreža", "mreže", "mrežami", "mrežah"],
+                      ["informacija", "informacije", "informacijami"]):
+            assert len({stem(fold(form)) for form in forms}) == 1, forms
+
+    def test_short_words_and_numbers_kept(self):
+        assert stem("pri") == "pri"
+        assert stem("2024") == "2024"
+
+    def test_index_terms(self):
+        assert index_terms("Uporaba strojnega učenja, 2. del") == "uporab strojn ucenj 2 del"
+
+    def test_query_terms(self):
+        assert query_terms("Nevronske mreže, nevronskih MREŽ!") == ["nevronsk", "mrez"]
+        assert query_terms(" ... ") == []
+        assert tsquery(["nevronsk", "mrez"]) == "'nevronsk':* & 'mrez':*"
+
+
+class TestSnippet:
+    """Test snippets around the matching words"""
+
+    def test_short_paragraph_whole(self):
+        text, highlights = snippet("  Kratek odstavek o mrežah. ", ["mrez"])
+
+        assert text == "Kratek odstavek o mrežah."
+        assert [text[s:e] for s, e in highlights] == ["mrežah"]
+
+    def test_window_around_matches(self):
+        content = "Uvodno besedilo brez zadetkov. " * 20 + "Nevronske mreže so uporabne. " + "Konec. " * 20
+        text, highlights = snippet(content, ["nevronsk", "mrez"], words=10)
+
+        assert text.startswith("…") and text.endswith("…")
+        assert "Nevronske mreže so uporabne." in text
+        assert [text[s:e] for s, e in highlights] == ["Nevronske", "mreže"]
+
+    def test_no_match_starts_at_beginning(self):
+        text, highlights = snippet("ena dva tri štiri pet šest", ["xyz"], words=3)
+
+        assert text == "ena dva tri…"
+        assert highlights == []
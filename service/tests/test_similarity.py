@@ -0,0 +1,115 @@
+import random
+
+import numpy as np
+
+import sys, os
+
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+import similarity
+from similarity import (
+    NUM_PERM,
+    DOCUMENT_BANDS,
+    PARAGRAPH_BANDS,
+    band_keys,
+    estimate,
+    fingerprint,
+    jaccard,
+    shingle_hashes,
+    signatures,
+)
+
+VOCABULARY = [f"beseda{i}" for i in range(2000)]
+
+
+def text(seed, n=200):
+    rnd = random.Random(seed)
+    return " ".join(rnd.choice(VOCABULARY) for _ in range(n))
+
+
+def edit(original, every, seed=0):
+    """Replace every `every`-th word."""
+    rnd = random.Random(seed)
+    words = original.split()
+    for i in range(0, len(words), every):
+        words[i] = rnd.choice(VOCABULARY)
+    return " ".join(words)
+
+
+class TestShingles:
+    """Test shingling of paragraph text"""
+
+    def test_case_diacritics_and_punctuation_ignored(self):
+        a = shingle_hashes("Študent je napisal magistrsko delo o mrežah.")
+        b = shingle_hashes("student JE napisal, magistrsko delo o mrezah")
+
+        assert len(a) == 3
+        assert np.array_equal(a, b)
+
+    def test_too_short(self):
+        assert len(shingle_hashes("ena dva tri štiri")) == 0
+
+
+class TestSignatures:
+    """Test MinHash signatures and their band keys"""
+
+    def test_estimate_tracks_jaccard(self):
+        original = text(1)
+        for every in (2, 5, 20):
+            edited = edit(original, every)
+            a, b = signatures([original, edited])
+            assert abs(estimate(a, b) - jaccard(original, edited)) < 0.15
+
+    def test_identical_and_unrelated(self):
+        a, b, c = signatures([text(1), text(1), text(2)])
+
+        assert estimate(a, b) == 1.0
+        assert estimate(a, c) < 0.1
+
+    def test_stable_across_calls(self):
+        """Test that signatures do not depend on the process or on batching"""
+        texts = [text(seed, 50) for seed in range(200)]
+        batched = signatures(texts)
+        single = np.vstack([signatures([t]) for t in texts])
+
+        assert batched.shape == (200, NUM_PERM)
+        assert np.array_equal(batched, single)
+
+    def test_near_duplicates_share_a_band(self):
+        original = text(1)
+        sigs = signatures([original, edit(original, 20), text(2)])
+        keys = band_keys(sigs, PARAGRAPH_BANDS)
+
+        assert (keys[0] == keys[1]).any()
+        assert not (keys[0] == keys[2]).any()
+
+
+class TestFingerprint:
+    """Test the document signature and index rows"""
+
+    def test_rows(self):
+        texts = [text(1, 40), "Kratek naslov", text(2, 40)]
+        minhash, rows = fingerprint(texts)
+
+        assert len(minhash) == NUM_PERM
+        assert minhash == signatures(texts).min(axis=0).tolist()
+        assert [order for order, _, _ in rows].count(-1) == DOCUMENT_BANDS[0]
+        assert {order for order, _, _ in rows} == {-1, 0, 2}
+
+    def test_only_stored_paragraphs_indexed(self):
+        texts = [text(1, 40), text(2, 40)]
+        _, rows = fingerprint(texts, stored=[1])
+
+        assert {order for order, _, _ in rows} == {-1, 1}
+
+    def test_empty(self):
+        assert fingerprint([]) == (None, [])
+        assert fingerprint(["Uvod"]) == (None, [])
+
+    def test_short_paragraphs_not_indexed(self):
+        _, rows = fingerprint([" ".join(["beseda"] * (similarity.MIN_PARAGRAPH_WORDS - 1))])
+
+        assert {order for order, _, _ in rows} == {-1}